@@ -2,6 +2,8 @@ __author__ = 'Will Hart'
 
 import logging
 import os.path
+import Queue
+import threading
 import tornado.httpserver
 import tornado.ioloop
 import tornado.web
@@ -11,6 +13,7 @@ from blitz.data.database import DatabaseClient
 from blitz.communications.boards import BoardManager
 import blitz.communications.signals as sigs
 from blitz.communications.tcp import TcpCommunicationException, TcpBase
+from blitz.utilities import monotonic_time
 import blitz.web.api as blitz_api
 import blitz.web.http as blitz_http
 
@@ -30,6 +33,8 @@ class Config(object):
             "template_path": os.path.join(os.path.dirname(__file__), "templates"),
             "static_path": os.path.join(os.path.dirname(__file__), "static"),
             "database_path": os.path.join(os.path.dirname(__file__), "data", "app.db"),
+            "archive_path": os.path.join(os.path.dirname(__file__), "data", "archive"),
+            "decode_processes": None,
             "port": 8989,
             "autoescape": None,
             "debug": True
@@ -70,6 +75,113 @@ class Config(object):
         return self.set(key, value)
 
 
+class CacheLineWorker(object):
+    """
+    Parses and saves lines of cached data received from the logger on a background thread, so that neither the
+    TCP thread nor the user interface waits on board decoding or database writes.  Results are collected and
+    passed to `callback` in batches, at most `MAX_UPDATE_RATE` times per second.  Messages are processed in the
+    order they are received.
+
+    :param board_manager: the BoardManager used to parse messages
+    :param callback: a function which is passed a list of parsed variables for each batch
+    """
+
+    MAX_UPDATE_RATE = 25.0
+    POLL_TIMEOUT = 0.5
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, board_manager, callback):
+        self.__board_manager = board_manager
+        self.__callback = callback
+        self.__queue = Queue.Queue()
+        self.__stop_event = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """
+        Starts the worker thread
+        """
+        if self.__thread is not None:
+            return
+
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.run, name="CacheLineWorker")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Processes any queued messages, delivers the last batch and stops the worker thread
+        """
+        if self.__thread is None:
+            return
+
+        self.__stop_event.set()
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__thread = None
+
+    def put(self, message):
+        """
+        Queues a message for processing.  Returns immediately
+
+        :param message: the raw cache line received from the logger
+        """
+        self.__queue.put(message)
+
+    def run(self):
+        """
+        Runs the worker loop, parsing queued messages and delivering batches at the capped rate
+        """
+        interval = 1.0 / self.MAX_UPDATE_RATE
+        next_update = monotonic_time()
+        pending = []
+
+        while True:
+            timeout = max(next_update - monotonic_time(), 0) if pending else self.POLL_TIMEOUT
+
+            try:
+                message = self.__queue.get(timeout=timeout)
+            except Queue.Empty:
+                message = None
+
+            if message is not None:
+                pending.extend(self.parse(message))
+            elif self.__stop_event.is_set() and self.__queue.empty():
+                break
+
+            if pending and monotonic_time() >= next_update:
+                self.deliver(pending)
+                pending = []
+                next_update = monotonic_time() + interval
+
+        if pending:
+            self.deliver(pending)
+
+    def parse(self, message):
+        """
+        Parses and saves a single message, logging rather than raising any errors
+
+        :param message: the raw cache line
+        :returns: a list of parsed variables
+        """
+        try:
+            return self.__board_manager.parse_message(message)
+        except Exception as e:
+            self.logger.error("Unable to parse cached line [%s] - %s" % (message, e))
+            return []
+
+    def deliver(self, results):
+        """
+        Passes a batch of results to the callback, logging rather than raising any errors
+        """
+        try:
+            self.__callback(results)
+        except Exception as e:
+            self.logger.error("Error delivering %s cached readings - %s" % (len(results), e))
+
+
 class ApplicationClient(object):
     """
     A basic application which provides access method agnostic functionality
@@ -93,7 +205,7 @@ class ApplicationClient(object):
         self.config = Config()
 
         # create a database connection
-        self.data = DatabaseClient(path=self.config['database_path'])
+        self.data = DatabaseClient(path=self.config['database_path'], archive_path=self.config['archive_path'])
         self.data.clear_errors()
         self.logger.info("Initialised DatabaseClient")
 
@@ -101,7 +213,7 @@ class ApplicationClient(object):
         self.tcp = None
 
         # create a board manager
-        self.board_manager = BoardManager(self.data)
+        self.board_manager = BoardManager(self.data, decode_processes=self.config['decode_processes'])
 
         # save variables for later
         self.config['board_manager'] = self.board_manager
@@ -110,6 +222,10 @@ class ApplicationClient(object):
         self.cache = self.data.get_cache()
         self.variable_cache = self.data.get_cache_variables()
 
+        # decode and save cached lines off the thread which receives them
+        self.cache_worker = CacheLineWorker(self.board_manager, self.update_interface)
+        self.cache_worker.start()
+
         # subscribe to signals
         sigs.cache_line_received.connect(self.cache_line_received)
         sigs.client_requested_download.connect(self.send_download_request)
@@ -127,11 +243,11 @@ class ApplicationClient(object):
 
     def cache_line_received(self, message):
         """
-        Handles receiving a line of information from the logger,
-        and writing and parsing this to the temporary cache
+        Handles receiving a line of information from the logger by queuing it to be parsed and written
+        to the temporary cache on the cache worker thread.  The worker calls `update_interface` with
+        batches of the results.
         """
-        results = self.board_manager.parse_message(message)
-        self.update_interface(results)
+        self.cache_worker.put(message)
 
     def send_download_request(self, session_id):
         """
@@ -215,6 +331,9 @@ class ApplicationClient(object):
         the actual interface implementation is provided by the inheriting class.  Note that this means the inheriting
         class should call `results = super(...).update_interface` to gather the data in the correct format.
 
+        Cached data is passed to this method on the cache worker thread, so implementations must hand the results
+        to their user interface thread rather than updating the interface directly.
+
         :param data: A list of Cache models or Reading models to convert into a dictionary: {'variable_name': [[x][y]] }
         :param replace_existing: If True, appends to existing cache, if False, replaces cache? Defaults to False
 
@@ -273,4 +392,7 @@ class ApplicationClient(object):
         A destructor, run when the application is closing
         """
         self.logger.warning("Closing Client Application")
+        self.cache_worker.stop()
+        self.board_manager.decoder.stop()
+        self.data.close()
 
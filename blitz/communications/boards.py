@@ -3,10 +3,13 @@ __author__ = 'Will Hart'
 import logging
 
 from bitstring import BitArray
+import numpy as np
 
 from blitz.constants import BOARD_MESSAGE_MAPPING, PAYLOAD_LENGTH, MESSAGE_BYTE_LENGTH
-from blitz.data.models import Reading
-from blitz.communications.signals import data_line_received, data_line_processed, registering_boards
+from blitz.data.models import Cache, Reading
+from blitz.communications.decoding import SessionDecoder
+from blitz.communications.signals import data_line_received, data_block_received, data_line_processed, \
+    registering_boards, session_data_received
 from blitz.communications.rs232 import SerialManager
 from blitz.plugins import Plugin
 from blitz.utilities import blitz_timestamp
@@ -20,20 +23,29 @@ class BoardManager(object):
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, database):
+    def __init__(self, database, decode_processes=None):
         """
         Register boards by ID
+
+        :param database: the DatabaseClient to save readings to
+        :param decode_processes: the number of processes used to decode downloads (default None, one for each
+            CPU).  Use 0 to decode downloads on the writer thread.
         """
 
         # save a reference to the database
         self.data = database
         self.boards = {}
 
+        # downloads are decoded in worker processes and saved from a single writer thread
+        self.decoder = SessionDecoder(database, self.boards, processes=decode_processes)
+
         # send the signal to register boards
         registering_boards.send(self)
 
-        # connect the data line received message
+        # connect the data line and block received messages
         data_line_received.connect(self.parse_session_message)
+        data_block_received.connect(self.parse_session_block)
+        session_data_received.connect(self.finish_session_download)
 
     def register_board(self, board_id, board):
         """
@@ -50,20 +62,32 @@ class BoardManager(object):
 
     def parse_session_message(self, message_tuple):
         """
-        Passes the received message to the board manager message parser with the appropriate session id
-        """
+        Queues received session messages to be decoded and saved.  Returns once the messages are queued so that
+        the next chunk of the download can be requested straight away.
 
+        :param message_tuple: a tuple of (messages, session_id) where messages is a list of raw hex messages
+        """
         messages, session_id = message_tuple
-        decoded_vars = []
+        self.decoder.put(messages, session_id)
 
-        for msg in messages:
-            decoded_vars += self.parse_message(msg, session_id=session_id)
+    def parse_session_block(self, block_tuple):
+        """
+        Queues a bulk encoded block of session messages to be decoded and saved.  Groups of messages from boards
+        which implement `get_variable_arrays` are decoded as whole columns, other messages are parsed one at a
+        time.
 
-        # perform a single database transaction
-        self.data.add_many(decoded_vars)
+        :param block_tuple: a tuple of (block, session_id) where block was created by `bulk.encode_block`
+        """
+        block, session_id = block_tuple
+        self.decoder.put(block, session_id, bulk=True)
 
-        # work out if the session is fully downloaded
-        self.data.update_session_availability(session_id)
+    def finish_session_download(self, session_id):
+        """
+        Marks the end of a download.  `session_download_finished` is sent once all of the data has been saved.
+
+        :param session_id: the ID of the session which has been downloaded
+        """
+        self.decoder.finish(session_id)
 
     def parse_message(self, message, session_id=None, board_id=None):
         """
@@ -97,6 +121,7 @@ class BoardManager(object):
         time_logged = board["timestamp"]
 
         # write the variables to the database
+        cached_items = []
         for key in result.keys():
             category_id = self.data.get_or_create_category(key)
             if session_id:
@@ -105,15 +130,19 @@ class BoardManager(object):
                     Reading(sessionId=session_id, timeLogged=time_logged, categoryId=category_id, value=result[key]))
             else:
                 # adding to cache
-                cached_item = self.data.add_cache(time_logged, category_id, result[key])
-                if cached_item.value:
+                cached_items.append(Cache(timeLogged=time_logged, categoryId=category_id, value=result[key]))
+                if result[key]:
                     readings.append({
                         'categoryName': key,
-                        'categoryId': cached_item.categoryId,
-                        'timeLogged': cached_item.timeLogged / 1000,
-                        'value': float(cached_item.value)
+                        'categoryId': category_id,
+                        'timeLogged': time_logged / 1000,
+                        'value': float(result[key])
                     })
 
+        # queue the cached values of the line as one write, the writer commits them with other lines
+        if cached_items:
+            self.data.add_many(cached_items, wait=False)
+
         return readings
 
     def get_board_descriptions(self, boards):
@@ -266,6 +295,43 @@ class BaseExpansionBoard(Plugin):
         """
         return {}
 
+    def get_variable_arrays(self, payloads):
+        """
+        Decodes the payloads of many messages at once, returning the same variables as `get_variables`
+        as arrays with one value for each message.  Boards which don't override this method have bulk
+        downloads parsed one message at a time.
+        This method MAY be overridden by derived classes
+
+        :param payloads: an (n, payload length) array of payload bytes
+        :returns: a dictionary of "variable": array pairs, or None if the board doesn't support it
+        """
+        return None
+
+    @staticmethod
+    def get_number_array(payloads, start_bit, length):
+        """
+        Gets a number from each of an array of payloads, the column equivalent of `get_number`.
+        Bits past the end of the payload are read as zero.
+        This method SHOULD NOT be overridden by derived classes
+
+        :param payloads: an (n, payload length) array of payload bytes
+        :param start_bit: the first bit of the number
+        :param length: the number of bits in the number, up to 57
+        :returns: an array of unsigned integers
+        """
+        first = start_bit // 8
+        count = (start_bit + length - 1) // 8 - first + 1
+        columns = payloads[:, first:first + count].astype(np.uint64)
+
+        result = np.zeros(len(payloads), dtype=np.uint64)
+        for i in xrange(count):
+            result <<= np.uint64(8)
+            if i < columns.shape[1]:
+                result |= columns[:, i]
+
+        result >>= np.uint64(count * 8 - start_bit % 8 - length)
+        return (result & np.uint64((1 << length) - 1)).astype(np.int64)
+
     def send_command(self, command):
         """
         Sends a command using the preferred method of the board.  Can be overridden in inherited classes
@@ -306,6 +372,15 @@ class BlitzBasicExpansionBoard(BaseExpansionBoard):
             "adc_channel_five": self.get_number(48, 12)
         }
 
+    def get_variable_arrays(self, payloads):
+        return {
+            "adc_channel_one": self.get_number_array(payloads, 0, 12),
+            "adc_channel_two": self.get_number_array(payloads, 12, 12),
+            "adc_channel_three": self.get_number_array(payloads, 24, 12),
+            "adc_channel_four": self.get_number_array(payloads, 36, 12),
+            "adc_channel_five": self.get_number_array(payloads, 48, 12)
+        }
+
 
 class MotorExpansionBoard(BaseExpansionBoard):
     """
@@ -337,6 +412,13 @@ class MotorExpansionBoard(BaseExpansionBoard):
             "set_point": self.get_number(32, 16)
         }
 
+    def get_variable_arrays(self, payloads):
+        return {
+            "raw_adc": self.get_number_array(payloads, 0, 16),
+            "motor_value": self.get_number_array(payloads, 16, 16),
+            "set_point": self.get_number_array(payloads, 32, 16)
+        }
+
 
 class NetScannerEthernetBoard(BaseExpansionBoard):
     """
@@ -363,6 +445,11 @@ class NetScannerEthernetBoard(BaseExpansionBoard):
         channels = ["Channel_{0}".format(i + self.channel_offset) for i in xrange(1, 17)]
         return dict(zip(channels, var_vals))
 
+    def get_variable_arrays(self, payloads):
+        var_vals = [(self.get_number_array(payloads, i * 32, 32) - 2e6) / 1.0e6 for i in xrange(0, 16)]
+        channels = ["Channel_{0}".format(i + self.channel_offset) for i in xrange(1, 17)]
+        return dict(zip(channels, var_vals))
+
 
 class NetScannerEthernetBoardTwo(NetScannerEthernetBoard):
     """
@@ -0,0 +1,152 @@
+__author__ = 'Will Hart'
+
+import binascii
+from collections import OrderedDict
+import struct
+
+import numpy as np
+
+
+class BoardMessages(object):
+    """
+    A group of messages from one board which share a header byte and payload length, decoded into columns
+
+    :param board_id: the ID of the board which sent the messages
+    :param header: the byte holding the message type and flags
+    :param timestamps: an array of the timestamp of each message
+    :param payloads: an (n, payload length) array of the payload bytes of each message
+    """
+
+    def __init__(self, board_id, header, timestamps, payloads):
+        self.board_id = board_id
+        self.header = header
+        self.timestamps = timestamps
+        self.payloads = payloads
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def to_lines(self):
+        """
+        Rebuilds the raw hex messages of the group
+
+        :returns: a list of hex strings
+        """
+        prefix = "%02X%02X" % (self.board_id, self.header)
+        return [prefix + "%08X" % t + binascii.hexlify(p.tostring()).upper()
+                for t, p in zip(self.timestamps.tolist(), self.payloads)]
+
+
+#: The version of the bulk block format
+BULK_VERSION = 1
+
+_BLOCK_HEADER = struct.Struct("<BHH")
+_GROUP_HEADER = struct.Struct("<BBHIIB")
+_HEADER_BYTES = 6
+_DELTA_TYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+
+def encode_block(lines):
+    """
+    Encodes a block of raw hex messages for bulk transfer.  Messages are grouped by board, header byte and
+    payload length, and each group is stored as columns:
+
+     - the first timestamp, then the differences between consecutive timestamps as zigzag encoded integers
+       packed at the smallest width of 1, 2, 4 or 8 bytes which holds them all
+     - the payload bytes, stored one byte position at a time so that slowly changing values sit together
+
+    Messages keep their order within a group but not between groups.  Lines which aren't valid messages are
+    kept as they are.
+
+    :param lines: a list of hex message strings
+    :returns: the encoded block as a string
+    """
+    groups = OrderedDict()
+    raw_lines = []
+
+    for line in lines:
+        try:
+            message = binascii.unhexlify(line)
+        except (TypeError, binascii.Error):
+            raw_lines.append(line)
+            continue
+
+        if len(message) < _HEADER_BYTES:
+            raw_lines.append(line)
+            continue
+
+        groups.setdefault((message[0], message[1], len(message)), []).append(message)
+
+    parts = [_BLOCK_HEADER.pack(BULK_VERSION, len(groups), len(raw_lines))]
+
+    for (board_id, header, length), messages in groups.iteritems():
+        data = np.frombuffer("".join(messages), dtype=np.uint8).reshape(len(messages), length)
+        timestamps = _big_endian_uint32(data[:, 2:_HEADER_BYTES])
+
+        deltas = np.diff(timestamps.astype(np.int64))
+        zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+        delta_type = _DELTA_TYPES[-1]
+        for t in _DELTA_TYPES:
+            if not len(zigzag) or zigzag.max() <= np.iinfo(t).max:
+                delta_type = t
+                break
+
+        parts.append(_GROUP_HEADER.pack(ord(board_id), ord(header), length - _HEADER_BYTES, len(messages),
+                                        int(timestamps[0]), np.dtype(delta_type).itemsize))
+        parts.append(zigzag.astype(np.dtype(delta_type).newbyteorder("<")).tostring())
+        parts.append(np.ascontiguousarray(data[:, _HEADER_BYTES:].T).tostring())
+
+    parts.append("\n".join(raw_lines))
+    return "".join(parts)
+
+
+def decode_block(data):
+    """
+    Decodes a block created by `encode_block`
+
+    :param data: the encoded block
+    :returns: a tuple of (groups, lines) where groups is a list of BoardMessages and lines is a list of the
+        lines which weren't valid messages
+    :raises: ValueError if the block is not a supported version
+    """
+    version, group_count, raw_count = _BLOCK_HEADER.unpack_from(data, 0)
+    if version != BULK_VERSION:
+        raise ValueError("Unable to decode bulk block version %s" % version)
+
+    offset = _BLOCK_HEADER.size
+    groups = []
+
+    for _ in xrange(group_count):
+        board_id, header, length, count, first, width = _GROUP_HEADER.unpack_from(data, offset)
+        offset += _GROUP_HEADER.size
+
+        delta_type = np.dtype(_DELTA_TYPES[[np.dtype(t).itemsize for t in _DELTA_TYPES].index(width)])
+        zigzag = _read(data, delta_type.newbyteorder("<"), count - 1, offset).astype(np.int64)
+        offset += width * (count - 1)
+
+        deltas = (zigzag >> 1) ^ -(zigzag & 1)
+        timestamps = np.concatenate(([first], first + np.cumsum(deltas))).astype(np.int64)
+
+        payloads = np.ascontiguousarray(_read(data, np.uint8, length * count, offset).reshape(length, count).T)
+        offset += length * count
+
+        groups.append(BoardMessages(board_id, header, timestamps, payloads))
+
+    lines = data[offset:].split("\n") if raw_count else []
+    return groups, lines
+
+
+def _read(data, dtype, count, offset):
+    """
+    Reads an array from a string, allowing empty arrays at the end of the string
+    """
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+
+
+def _big_endian_uint32(columns):
+    """
+    Converts an (n, 4) array of bytes into an array of big endian unsigned 32 bit integers
+    """
+    return np.ascontiguousarray(columns).view(np.dtype(">u4")).ravel().astype(np.int64)
@@ -5,6 +5,7 @@ import threading
 import time
 
 from blitz.constants import *
+from blitz.communications.compression import get_codec
 import blitz.communications.signals as sigs
 
 
@@ -50,17 +51,42 @@ class BaseState(object):
 
 class ClientInitState(BaseState):
     """
-    Handles the client starting up - sends a "logging" query
+    Handles the client starting up - offers the logger the codecs it can use to compress
+    downloads and whether it accepts bulk encoded downloads, then sends a "logging" query
     to the logger and waits for the response
     """
+
+    negotiating = False
+
     def enter_state(self, tcp, state, args=None):
-        """Send a logging query to the logger"""
+        """Send a codec offer, or a logging query if there is nothing to offer, to the logger"""
         self.logger.debug("[TCP] Calling init.enter_state")
-        tcp.do_send(CommunicationCodes.IsLogging)
+        tcp.codec = None
+        tcp.bulk = False
+        offer = tcp.codecs + (["bulk"] if tcp.bulk_transfer else [])
+
+        if offer:
+            self.negotiating = True
+            tcp.do_send(CommunicationCodes.composite(CommunicationCodes.Codec, " ".join(offer)))
+        else:
+            tcp.do_send(CommunicationCodes.IsLogging)
         return self
 
     def receive_message(self, tcp, msg):
         self.logger.debug("[TCP] Calling init.receive_message: " + msg)
+
+        if self.negotiating:
+            # loggers which don't support compression respond with an error
+            self.negotiating = False
+            if msg[0:6] == CommunicationCodes.Codec + " ":
+                reply = msg.split(" ")[1:]
+                tcp.codec = get_codec(reply[0])
+                tcp.bulk = "bulk" in reply[1:]
+            self.logger.info("Using download codec: %s, bulk transfer: %s" % (
+                tcp.codec.name if tcp.codec else "none", tcp.bulk))
+            tcp.do_send(CommunicationCodes.IsLogging)
+            return self
+
         sigs.process_finished.send()
 
         if msg == CommunicationCodes.Acknowledge:
@@ -271,17 +297,24 @@ class ClientDownloadingState(BaseState):
         return self
 
     def receive_message(self, tcp, msg):
-        self.logger.debug("[TCP] Calling downloading.receive_message: " + msg)
-
-        # removing the command message and send the remainder off for processing via a signal
-        msg_parts = msg.split("\n")
-        if msg_parts[-1][0:2] != "0x":
-            del msg_parts[-1]
-
-        sigs.data_line_received.send((msg_parts, self.session_id))
+        code, _, payload = msg.partition(" ")
+
+        if tcp.bulk and code in (CommunicationCodes.Acknowledge, CommunicationCodes.Negative):
+            # send bulk encoded blocks off for decoding via a signal
+            self.logger.debug("[TCP] Calling downloading.receive_message: %s with %s bytes of bulk data" % (
+                code, len(payload)))
+            if payload:
+                block = tcp.codec.decompress(payload) if tcp.codec is not None else payload
+                sigs.data_block_received.send((block, self.session_id))
+            complete = code == CommunicationCodes.Negative
+        else:
+            # send the lines off for processing via a signal
+            msg_parts, complete = self.decode_message(tcp, msg)
+            sigs.data_line_received.send((msg_parts, self.session_id))
 
-        if msg[-4:] == CommunicationCodes.Negative:
-            # the data has been received
+        if complete:
+            # the data has been received, it is saved once the queued chunks are decoded
+            sigs.session_data_received.send(self.session_id)
             return self.go_to_state(tcp, ClientIdleState)
 
         elif msg[0:5] == CommunicationCodes.Error:
@@ -293,6 +326,29 @@ class ClientDownloadingState(BaseState):
         tcp.send(CommunicationCodes.Acknowledge)
         return self
 
+    def decode_message(self, tcp, msg):
+        """
+        Decodes a block of downloaded lines, which is either the lines followed by the command code or,
+        if a codec was negotiated, the command code followed by the compressed lines
+
+        :returns: a tuple of (lines, complete) where complete is True if this is the last block
+        """
+        code, _, payload = msg.partition(" ")
+
+        if tcp.codec is not None and code in (CommunicationCodes.Acknowledge, CommunicationCodes.Negative):
+            self.logger.debug("[TCP] Calling downloading.receive_message: %s with %s bytes of %s data" % (
+                code, len(payload), tcp.codec.name))
+            msg_parts = tcp.codec.decompress(payload).split("\n") if payload else []
+            return msg_parts, code == CommunicationCodes.Negative
+
+        self.logger.debug("[TCP] Calling downloading.receive_message: " + msg)
+
+        # remove the command message
+        msg_parts = msg.split("\n")
+        if msg_parts[-1][0:2] != "0x":
+            del msg_parts[-1]
+        return msg_parts, msg[-4:] == CommunicationCodes.Negative
+
     def go_to_state(self, tcp, state, args=None):
         sigs.process_finished.send()
         self.logger.debug("[TCP] Calling downloading.go_to_state >> " + state.__name__)
@@ -0,0 +1,140 @@
+__author__ = 'Will Hart'
+
+from collections import OrderedDict
+import logging
+import zlib
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class BaseCodec(object):
+    """
+    A base class for codecs which compress session downloads.  Derived classes must set `name` and implement
+    `compress` and `decompress`.
+
+    :param level: the compression level, or None for the default level of the codec
+    """
+
+    name = None
+    default_level = None
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, level=None):
+        self.level = self.default_level if level is None else level
+
+    def compress(self, data):
+        """
+        Compresses a string.  Must be overridden by derived classes.
+
+        :param data: the string to compress
+        :returns: the compressed string
+        """
+        raise NotImplementedError("BaseCodec.compress should be overridden by derived instances")
+
+    def decompress(self, data):
+        """
+        Decompresses a string created by `compress`.  Must be overridden by derived classes.
+
+        :param data: the compressed string
+        :returns: the original string
+        """
+        raise NotImplementedError("BaseCodec.decompress should be overridden by derived instances")
+
+
+class ZlibCodec(BaseCodec):
+    """
+    Compresses downloads with zlib, which is always available
+    """
+
+    name = "zlib"
+    default_level = 6
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class Lz4Codec(BaseCodec):
+    """
+    Compresses downloads with LZ4 frames, which is much faster than zlib for a lower compression ratio.
+    Requires the lz4 package.
+    """
+
+    name = "lz4"
+    default_level = 0
+
+    def compress(self, data):
+        return lz4_frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return lz4_frame.decompress(data)
+
+
+class ZstdCodec(BaseCodec):
+    """
+    Compresses downloads with Zstandard.  Requires the zstandard package.
+    """
+
+    name = "zstd"
+    default_level = 3
+
+    def __init__(self, level=None):
+        super(ZstdCodec, self).__init__(level)
+        self.__compressor = zstandard.ZstdCompressor(level=self.level)
+        self.__decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self.__compressor.compress(data)
+
+    def decompress(self, data):
+        return self.__decompressor.decompress(data)
+
+
+#: The codecs which can be used for downloads on this machine, in order of preference
+CODECS = OrderedDict((c.name, c) for c, available in (
+    (ZstdCodec, zstandard is not None),
+    (Lz4Codec, lz4_frame is not None),
+    (ZlibCodec, True),
+) if available)
+
+
+def get_codec(name, level=None):
+    """
+    Creates a codec by name
+
+    :param name: the name of the codec
+    :param level: the compression level (default None, the default level of the codec)
+    :returns: a BaseCodec derived instance, or None if name is None or "none"
+    :raises: KeyError if the codec is not available
+    """
+    if name is None or name == "none":
+        return None
+    return CODECS[name](level)
+
+
+def negotiate_codec(offered, supported=None):
+    """
+    Chooses the codec to use for downloads from the codecs offered by the client
+
+    :param offered: a list of codec names offered by the client, in order of preference
+    :param supported: a list of codec names supported by the server (default None, all available codecs)
+    :returns: the name of the first offered codec which is supported, or "none"
+    """
+    supported = CODECS.keys() if supported is None else supported
+
+    for name in offered:
+        if name in supported and name in CODECS:
+            return name
+
+    return "none"
@@ -0,0 +1,216 @@
+__author__ = 'Will Hart'
+
+import cPickle
+import logging
+import multiprocessing
+import Queue
+import threading
+
+import numpy as np
+
+from blitz.communications.bulk import encode_block, decode_block
+import blitz.communications.signals as sigs
+
+
+# board instances created in each worker process, keyed by board class
+_boards = {}
+
+
+def decode_session_data(board_classes, data, bulk=False):
+    """
+    Decodes downloaded session data into columns of readings.  This runs in worker processes so it only
+    uses its arguments, creating its own instance of each board class.  Lines are grouped by board with
+    `bulk.encode_block`, so boards which implement `get_variable_arrays` decode whole columns at once and
+    other boards parse one message at a time.
+
+    :param board_classes: a dictionary of expansion board classes keyed by board ID
+    :param data: a list of raw hex messages, or a bulk encoded block if bulk is True
+    :param bulk: True if data is a block created by `bulk.encode_block` (default False)
+    :returns: a tuple of (columns, skipped) where columns is a dictionary of (times, values) array tuples
+        keyed by variable name, and skipped is the number of messages which could not be decoded
+    """
+    groups, lines = decode_block(data if bulk else encode_block(data))
+    columns = {}
+    skipped = len(lines)
+
+    for group in groups:
+        try:
+            board_class = board_classes[group.board_id]
+        except KeyError:
+            skipped += len(group)
+            continue
+
+        board = _boards.get(board_class)
+        if board is None:
+            board = _boards[board_class] = board_class()
+
+        arrays = board.get_variable_arrays(group.payloads)
+
+        if arrays is None:
+            # the board can only parse single messages
+            arrays = {}
+            for line in group.to_lines():
+                board.parse_message(line)
+                for key, value in board.get_variables().iteritems():
+                    arrays.setdefault(key, []).append(value)
+            arrays = dict((k, np.array(v)) for k, v in arrays.iteritems())
+
+        for key, values in arrays.iteritems():
+            columns.setdefault(key, []).append((group.timestamps, values))
+
+    columns = dict((k, (np.concatenate([t for t, _ in v]), np.concatenate([x for _, x in v])))
+                   for k, v in columns.iteritems())
+    return columns, skipped
+
+
+class _DeferredDecode(object):
+    """
+    Decodes session data on the writer thread when no worker processes are available
+    """
+
+    def __init__(self, args):
+        self.args = args
+
+    def get(self):
+        return decode_session_data(*self.args)
+
+
+class SessionDecoder(object):
+    """
+    Decodes downloaded session data in a pool of worker processes and saves it from a single writer thread.
+    `put` returns as soon as the data is queued, so the next chunk of a download can be requested while
+    earlier chunks are decoded on other cores.  The writer saves the results in the order they were queued
+    and sends `session_download_finished` once every chunk of a session has been saved.
+
+    The pool is started when the first chunk is queued.  If there are no worker processes, or the board
+    classes can't be sent to them, data is decoded on the writer thread instead.
+
+    :param database: the DatabaseClient to save readings to
+    :param boards: the dictionary of registered expansion boards keyed by ID
+    :param processes: the number of worker processes (default None, one for each CPU).  Use 0 to decode on the
+        writer thread.
+    """
+
+    MAX_PENDING = 32
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, database, boards, processes=None):
+        self.database = database
+        self.boards = boards
+        self.processes = processes
+        self.__pool = None
+        self.__pool_checked = False
+        self.__queue = Queue.Queue(self.MAX_PENDING)
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__saved_sessions = set()
+
+    def put(self, data, session_id, bulk=False):
+        """
+        Queues a chunk of downloaded data for decoding and saving.  Blocks if `MAX_PENDING` chunks are already
+        waiting to be saved.
+
+        :param data: a list of raw hex messages, or a bulk encoded block if bulk is True
+        :param session_id: the ID of the session the data belongs to
+        :param bulk: True if data is a block created by `bulk.encode_block` (default False)
+        """
+        args = (dict((k, type(v)) for k, v in self.boards.iteritems()), data, bulk)
+        pool = self.__get_pool(args[0])
+        result = pool.apply_async(decode_session_data, args) if pool is not None else _DeferredDecode(args)
+        self.__queue.put((session_id, result))
+
+    def finish(self, session_id):
+        """
+        Marks the end of the download of a session.  The writer sends `session_download_finished` once the
+        data queued before this has been saved.
+
+        :param session_id: the ID of the session which has been downloaded
+        """
+        self.__start_writer()
+        self.__queue.put((session_id, None))
+
+    def join(self):
+        """
+        Waits until all of the queued data has been saved
+        """
+        self.__queue.join()
+
+    def stop(self):
+        """
+        Saves any queued data then stops the writer thread and worker processes
+        """
+        if self.__thread is not None:
+            self.__queue.put((None, None))
+            self.__thread.join()
+            self.__thread = None
+
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool = None
+
+    def run(self):
+        """
+        The writer thread, which saves decoded data in the order it was queued
+        """
+        while True:
+            session_id, result = self.__queue.get()
+
+            try:
+                if session_id is None:
+                    return
+                elif result is None:
+                    self.database.writer.flush()
+                    self.database.update_session_availability(session_id)
+                    self.__saved_sessions.discard(session_id)
+                    sigs.session_download_finished.send(session_id)
+                else:
+                    self.save(session_id, result)
+            except Exception as e:
+                self.logger.error("Failed to save downloaded data for session %s - %s" % (session_id, e))
+            finally:
+                self.__queue.task_done()
+
+    def save(self, session_id, result):
+        """
+        Waits for a chunk to be decoded and saves the readings
+        """
+        columns, skipped = result.get()
+
+        if skipped:
+            self.logger.warning("Skipped %s messages that could not be decoded in session %s" % (skipped, session_id))
+
+        # only the first chunk of a session waits to be written, so that the session can be marked as available
+        first = session_id not in self.__saved_sessions
+        self.database.add_session_columns(session_id, dict(
+            (self.database.get_or_create_category(k), v) for k, v in columns.iteritems()), wait=first)
+
+        if first:
+            self.__saved_sessions.add(session_id)
+            self.database.update_session_availability(session_id)
+
+    def __get_pool(self, board_classes):
+        """
+        Gets the pool of worker processes, starting the pool and the writer thread on first use
+        """
+        self.__start_writer()
+
+        with self.__lock:
+            if not self.__pool_checked:
+                self.__pool_checked = True
+
+                if self.processes != 0:
+                    try:
+                        cPickle.dumps(board_classes, cPickle.HIGHEST_PROTOCOL)
+                        self.__pool = multiprocessing.Pool(self.processes)
+                    except Exception as e:
+                        self.logger.warning("Decoding downloads on the writer thread - %s" % e)
+
+            return self.__pool
+
+    def __start_writer(self):
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.run, name="SessionDecoderWriter")
+                self.__thread.daemon = True
+                self.__thread.start()
@@ -8,14 +8,109 @@
 
 __author__ = 'Will Hart'
 
+import binascii
 import datetime
 import logging
+import math
 import Queue
 import socket
+import struct
 import threading
-import time
 
 from blitz.communications.signals import logging_started, logging_stopped
+from blitz.utilities import monotonic_time
+
+
+class SampleScheduler(object):
+    """
+    Schedules samples at a fixed frequency against absolute deadlines on a monotonic clock, so the time taken
+    to request each sample doesn't reduce the achieved sample rate.  If sampling falls more than a whole period
+    behind, the missed deadlines are skipped (and counted) rather than sampling in a burst to catch up.
+
+    The achieved sample rate and jitter (standard deviation of the interval between samples) are recorded
+    when `record` is called after each sample is received.  The statistics are guarded by a lock, so they can
+    be read from another thread while sampling.
+
+    :param frequency: the target sample frequency in Hz
+    """
+
+    def __init__(self, frequency):
+        self.frequency = float(frequency)
+        self.period = 1.0 / self.frequency
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the schedule and statistics, the next call to `wait` will return immediately
+        """
+        with self.__lock:
+            self.samples = 0
+            self.missed = 0
+            self.__deadline = None
+            self.__first = None
+            self.__last = None
+            self.__mean = 0.0
+            self.__m2 = 0.0
+
+    def wait(self, stop_event):
+        """
+        Waits until the next sample is due
+
+        :param stop_event: a threading Event which interrupts the wait when it is set
+        """
+        now = monotonic_time()
+
+        with self.__lock:
+            if self.__deadline is None:
+                self.__deadline = now
+            elif now - self.__deadline > self.period:
+                skipped = int((now - self.__deadline) / self.period)
+                self.missed += skipped
+                self.__deadline += skipped * self.period
+
+            delay = self.__deadline - now
+            self.__deadline += self.period
+
+        if delay > 0:
+            stop_event.wait(delay)
+
+    def record(self):
+        """
+        Records that a sample was received, updating the rate and jitter statistics
+        """
+        now = monotonic_time()
+
+        with self.__lock:
+            if self.__last is None:
+                self.__first = now
+            else:
+                # a running mean and variance of the sample interval (Welford's method)
+                interval = now - self.__last
+                delta = interval - self.__mean
+                self.__mean += delta / self.samples
+                self.__m2 += delta * (interval - self.__mean)
+
+            self.__last = now
+            self.samples += 1
+
+    def get_statistics(self):
+        """
+        Gets the sampling statistics since the scheduler was last reset
+
+        :returns: a dictionary with the number of `samples`, the achieved `rate` in Hz, the `jitter` in seconds
+                  and the number of `missed` samples
+        """
+        with self.__lock:
+            intervals = self.samples - 1
+
+            return {
+                "samples": self.samples,
+                "rate": intervals / (self.__last - self.__first) if intervals > 0 and self.__last > self.__first
+                else 0.0,
+                "jitter": math.sqrt(self.__m2 / intervals) if intervals > 0 else 0.0,
+                "missed": self.missed
+            }
 
 
 class NetScannerManager(object):
@@ -38,23 +133,54 @@ class NetScannerManager(object):
         ('rFFFF0', 'digital read data') # or b for binary format
     ]
 
+    # replaces the last step of INIT_SEQUENCE when reading in binary format.  The device responds
+    # with the 16 channels as big endian 32 bit floats, which are unpacked with BINARY_FORMAT
+    BINARY_READ_COMMAND = ('bFFFF0', 'binary read data')
+    BINARY_FORMAT = struct.Struct('>16f')
+
+    # the format of the payload saved to the database, 16 big endian unsigned ints in reverse channel order
+    PAYLOAD_FORMAT = struct.Struct('>16I')
+
+    # the range of readings which can be scaled by 1e6 and offset by 2e6 into an unsigned 32 bit int
+    MIN_READING = -2.0
+    MAX_READING = (2 ** 32 - 1 - 2e6) / 1e6
+
+    # commands which start and stop the device sending frames autonomously at the configured
+    # scan rate, which must be used in binary format above MAX_POLLED_FREQUENCY
+    STREAM_START_COMMAND = ('c 00 {0:g}', 'start autonomous streaming')
+    STREAM_STOP_COMMAND = ('c 00 0', 'stop autonomous streaming')
+
     REQUEST_TIMEOUT = 5.0
 
     SAMPLE_FREQUENCY = 2.0
 
+    MAX_POLLED_FREQUENCY = 100.0
+
     MAX_RETRIES = 10
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, database, host, board_id="0A", port=9000):
+    def __init__(self, database, host, board_id="0A", port=9000, binary=False, sample_frequency=None):
         """
         Initialises a NetScannerManager which connects a TCP/IP connection to the device
 
         :param host: The host IP address of the NetScanner device
         :param port: The port of the NetScanner device
         :param database: The database to use to save serial data
+        :param binary: If True, data is requested from the device in binary rather than decimal format
+        :param sample_frequency: The sample frequency in Hz (default SAMPLE_FREQUENCY).  Frequencies above
+            MAX_POLLED_FREQUENCY use autonomous streaming, which requires binary format
         """
 
+        self.binary = binary
+        self.scheduler = SampleScheduler(sample_frequency or self.SAMPLE_FREQUENCY)
+        self.streaming = self.scheduler.frequency > self.MAX_POLLED_FREQUENCY
+
+        if self.streaming and not self.binary:
+            raise ValueError("NetScanner sample frequencies above {0} Hz require binary format".format(
+                self.MAX_POLLED_FREQUENCY))
+
+        self.__sequence = self.INIT_SEQUENCE[:-1] + [self.BINARY_READ_COMMAND] if binary else self.INIT_SEQUENCE
         self.__host = host
         self.__port = port
         self.__data = database
@@ -63,7 +189,6 @@ class NetScannerManager(object):
         self.__stop_event = threading.Event()
         self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.__socket.settimeout(self.REQUEST_TIMEOUT)
-        self.__run_thread(self.run_client)
         self.__thread = None
         self.__logging_start = datetime.datetime.now()
         self.__logging = False
@@ -72,6 +197,8 @@ class NetScannerManager(object):
         logging_started.connect(self.start_logging)
         logging_stopped.connect(self.stop_logging)
 
+        self.__run_thread(self.run_client)
+
     def __run_thread(self, thread_target):
         self.__thread = threading.Thread(target=thread_target, args=[self.__stop_event])
         self.__thread.daemon = True
@@ -89,29 +216,56 @@ class NetScannerManager(object):
 
         current_state = 0
         retries = 0
+        streaming = False
         self.logger.debug("NetScanner starting polling loop")
 
         while not stop_event.is_set():
 
-            if self.INIT_SEQUENCE[current_state][0] == self.INIT_SEQUENCE[-1][0]:
-
-                skip = False
+            if current_state == len(self.__sequence) - 1:
 
                 # the handshake is finished, check if we should be logging
                 with self.__logging_lock:
-                    if not self.__logging:
-                        skip = True
+                    logging = self.__logging
+
+                if not logging:
+                    if streaming:
+                        self.__stop_streaming()
+                        streaming = False
 
-                if skip:
-                    time.sleep(1.0 / self.SAMPLE_FREQUENCY)
+                    self.scheduler.reset()
+                    stop_event.wait(0.1)
                     continue
 
-            self.__socket.send(self.INIT_SEQUENCE[current_state][0])
-            if current_state < len(self.INIT_SEQUENCE) - 1:
-                self.logger.debug("Netscanner sent {0} message".format(self.INIT_SEQUENCE[current_state][1]))
+                if self.streaming:
+                    # the device pushes frames at the sample rate, so just receive them
+                    if not streaming:
+                        self.__socket.send(self.STREAM_START_COMMAND[0].format(self.scheduler.frequency))
+                        self.logger.debug("Netscanner sent {0} message".format(self.STREAM_START_COMMAND[1]))
+                        streaming = True
+
+                    try:
+                        data = self.__receive_exactly(self.BINARY_FORMAT.size, stop_event)
+                    except Exception as e:
+                        self.logger.error("NetScanner stream failed with exception... aborting. Exception was:")
+                        self.logger.error(e)
+                        stop_event.set()
+                    else:
+                        self.receive_binary_message(data)
+                        self.scheduler.record()
+                    continue
+
+                # wait until the next sample is due
+                self.scheduler.wait(stop_event)
+
+            self.__socket.send(self.__sequence[current_state][0])
+            if current_state < len(self.__sequence) - 1:
+                self.logger.debug("Netscanner sent {0} message".format(self.__sequence[current_state][1]))
 
             try:
-                data = self.__socket.recv(1024)
+                if self.binary and current_state == len(self.__sequence) - 1:
+                    data = self.__receive_exactly(self.BINARY_FORMAT.size, stop_event)
+                else:
+                    data = self.__socket.recv(1024)
             except Exception as e:
                 self.logger.warning("NetScanner receive failed with exception... retrying. Exception was:")
                 self.logger.warning(e)
@@ -121,19 +275,59 @@ class NetScannerManager(object):
                     self.logger.error("Max retries on NetScanner exceeded. Aborting")
                     stop_event.set()
             else:
-                self.receive_message(data)
+                if self.binary and current_state == len(self.__sequence) - 1:
+                    self.receive_binary_message(data)
+                else:
+                    self.receive_message(data)
                 retries = 0
 
-                if current_state < len(self.INIT_SEQUENCE) - 1:
+                if current_state < len(self.__sequence) - 1:
                     current_state += 1
                 else:
-                    # sample at approximately 2 Hz
-                    time.sleep(1.0 / self.SAMPLE_FREQUENCY)
+                    self.scheduler.record()
 
         # terminate the context before exiting
         self.__socket.close()
         self.logger.debug("NetScanner terminated")
 
+    def __stop_streaming(self):
+        """
+        Stops the device streaming and discards any frames which were sent before the stop command arrived
+        """
+        self.__socket.send(self.STREAM_STOP_COMMAND[0])
+        self.logger.debug("Netscanner sent {0} message".format(self.STREAM_STOP_COMMAND[1]))
+
+        self.__socket.settimeout(0.2)
+        try:
+            while self.__socket.recv(4096):
+                pass
+        except socket.error:
+            pass
+        finally:
+            self.__socket.settimeout(self.REQUEST_TIMEOUT)
+
+    def __receive_exactly(self, size, stop_event):
+        """
+        Receives a fixed length message from the device, which may arrive over several TCP packets
+
+        :param size: the number of bytes to receive
+        :param stop_event: the threading Event which stops the client
+
+        :returns: the received bytes, which may be short if the client was stopped
+        """
+        chunks = []
+        received = 0
+
+        while received < size and not stop_event.is_set():
+            chunk = self.__socket.recv(size - received)
+            if not chunk:
+                raise socket.error("NetScanner connection closed")
+
+            chunks.append(chunk)
+            received += len(chunk)
+
+        return "".join(chunks)
+
     def start_logging(self, args):
         """
         Stores the current time when data logging commences so the correct timestamp can be provided to messages
@@ -150,33 +344,81 @@ class NetScannerManager(object):
         with self.__logging_lock:
             self.__logging = False
 
+        stats = self.scheduler.get_statistics()
+        self.logger.info("NetScanner {0} took {1} samples at {2:.2f} Hz (target {3:.2f} Hz), jitter {4:.2f} ms, "
+                         "{5} missed".format(self.board_id, stats['samples'], stats['rate'],
+                                             self.scheduler.frequency, stats['jitter'] * 1000.0, stats['missed']))
+
     def receive_message(self, message):
         """
         Receives and handles a new message received via TCP
 
         :param message: the message that was received
         """
-        delta_t = 0
-
         if message == "A":
             self.logger.debug("NetScanner received ACK from device")
         else:
             if self.__data:
-                delta_t = (datetime.datetime.now() - self.__logging_start).total_seconds() * 1000.0
-                delta_t = hex(int(delta_t))[2:].rjust(8, '0').upper()
+                delta_t = self.__timestamp()
 
                 raw = message.split()
 
                 if len(raw) == 16:
-                    out_message = ""
-                    for r in reversed(raw):
-                        # scale by 1e6 and offset by 2e6 to avoid negative numbers and encode as int
-                        out_message += hex(int(float(r) * 1e6 + 2e6))[2:].rjust(8, "0").upper()
-
-                    self.__data.queue(self.board_id + "50" + delta_t + out_message)
+                    try:
+                        payload = self.encode_readings([float(r) for r in reversed(raw)])
+                    except ValueError:
+                        payload = None
+
+                    if payload is not None:
+                        self.__data.queue(self.board_id + "50" + delta_t + payload)
+                    else:
+                        self.logger.warning("Dropped a NetScanner frame with invalid readings - {0}".format(message))
                 else:
                     self.logger.debug("Received {0} variables from the NetScanner device, ignoring".format(len(raw)))
 
+    def receive_binary_message(self, message):
+        """
+        Receives and handles a binary data message from the device, unpacking all 16 channels at once
+
+        :param message: the message that was received, which should be BINARY_FORMAT.size bytes long
+        """
+        if not self.__data:
+            return
+
+        if len(message) != self.BINARY_FORMAT.size:
+            self.logger.debug("Received {0} bytes from the NetScanner device, ignoring".format(len(message)))
+            return
+
+        values = self.BINARY_FORMAT.unpack(message)
+        payload = self.encode_readings(list(reversed(values)))
+
+        if payload is None:
+            self.logger.warning("Dropped a NetScanner frame with invalid readings - {0}".format(values))
+            return
+
+        self.__data.queue(self.board_id + "50" + self.__timestamp() + payload)
+
+    def encode_readings(self, values):
+        """
+        Encodes readings as a hex payload, scaling by 1e6 and offsetting by 2e6 to avoid negative numbers and
+        encoding each as an unsigned 32 bit int
+
+        :param values: a list of 16 readings in the order they are saved
+        :returns: the hex payload, or None if a reading is NaN or outside MIN_READING to MAX_READING
+        """
+        # comparisons with NaN are always False, so NaN readings fail this check too
+        if not all(self.MIN_READING <= v <= self.MAX_READING for v in values):
+            return None
+
+        return binascii.hexlify(self.PAYLOAD_FORMAT.pack(*[int(v * 1e6 + 2e6) for v in values])).upper()
+
+    def __timestamp(self):
+        """
+        Gets the number of milliseconds since logging started as an 8 character hex string
+        """
+        delta_t = (datetime.datetime.now() - self.__logging_start).total_seconds() * 1000.0
+        return hex(int(delta_t))[2:].rjust(8, '0').upper()
+
     def stop_client(self):
         """
         Stops a client from polling the NetScanner by setting the stop_event
@@ -1,11 +1,15 @@
 __author__ = 'Will Hart'
 
 
+import binascii
+import json
 import logging
 import os
+import Queue
 from redis import ConnectionError
 import serial
 from serial.tools.list_ports import comports
+import struct
 import time
 import threading
 
@@ -13,6 +17,7 @@ from blitz import constants
 from blitz.constants import CommunicationCodes, SerialUpdatePeriod, SerialCommands
 from blitz.data.database import DatabaseServer
 from blitz.communications.signals import board_command_received, logging_started, logging_stopped
+from blitz.utilities import user_data_path
 
 
 class ExpansionBoardNotFound(BaseException):
@@ -23,6 +28,239 @@ class ExpansionBoardNotFound(BaseException):
     pass
 
 
+class SerialFrameDecoder(object):
+    """
+    Decodes binary frames sent by expansion boards which have negotiated binary framing.  Each frame is::
+
+        SYNC (1 byte, 0xA5) | LENGTH (1 byte) | PAYLOAD (LENGTH bytes) | CRC (2 bytes, big endian)
+
+    where the CRC is the CRC-16-CCITT (initial value 0xFFFF) of the LENGTH and PAYLOAD bytes.  The payload
+    is the raw message, i.e. the bytes which would otherwise be sent as a hex string.  Frames which fail
+    the CRC check are counted and the decoder resynchronises on the next SYNC byte.
+
+    Boards may still send plain text lines, such as command responses, between frames.  Printable lines
+    found outside frames are collected and returned by `text_lines`.
+    """
+
+    SYNC = '\xa5'
+
+    # the longest text line which is kept, longer runs of bytes outside frames are discarded
+    MAX_TEXT_LENGTH = 64
+
+    def __init__(self):
+        self.crc_errors = 0
+        self.__buffer = ""
+        self.__text = ""
+        self.__text_lines = []
+
+    @classmethod
+    def encode(cls, payload):
+        """
+        Builds a binary frame around the given payload
+
+        :param payload: the raw payload string, up to 255 bytes long
+
+        :returns: the framed payload
+        """
+        body = chr(len(payload)) + payload
+        return cls.SYNC + body + struct.pack('>H', binascii.crc_hqx(body, 0xFFFF))
+
+    def feed(self, data):
+        """
+        Adds received bytes to the decoder and returns any payloads which have been completed
+
+        :param data: the string of bytes read from the serial port
+
+        :returns: a list of hex encoded (upper case) payload strings
+        """
+        buf = self.__buffer + data
+        payloads = []
+        start = 0
+
+        while True:
+            idx = buf.find(self.SYNC, start)
+            if idx < 0:
+                self.__add_text(buf[start:])
+                start = len(buf)
+                break
+
+            self.__add_text(buf[start:idx])
+            start = idx
+
+            if len(buf) < idx + 2:
+                break
+
+            length = ord(buf[idx + 1])
+            end = idx + 4 + length
+            if len(buf) < end:
+                break
+
+            body = buf[idx + 1:end - 2]
+            if struct.unpack('>H', buf[end - 2:end])[0] != binascii.crc_hqx(body, 0xFFFF):
+                self.crc_errors += 1
+                start = idx + 1
+                continue
+
+            payloads.append(binascii.hexlify(body[1:]).upper())
+            start = end
+
+        self.__buffer = buf[start:]
+        return payloads
+
+    def text_lines(self):
+        """
+        Gets the text lines which have been received outside frames since this was last called
+
+        :returns: a list of lines, without line endings
+        """
+        lines, self.__text_lines = self.__text_lines, []
+        return lines
+
+    def __add_text(self, data):
+        """
+        Splits bytes received outside frames into lines, keeping only printable lines
+        """
+        lines = (self.__text + data).split('\n')
+
+        # a partial line which is already too long is kept truncated, so it is discarded once it is complete
+        self.__text = lines.pop()[:self.MAX_TEXT_LENGTH + 1]
+
+        for line in lines:
+            line = line.replace('\r', '')
+            if line and len(line) <= self.MAX_TEXT_LENGTH and all(' ' <= c <= '~' for c in line):
+                self.__text_lines.append(line)
+
+
+class SerialStreamReader(object):
+    """
+    Reads lines which are pushed continuously by an expansion board in streaming mode.  The port is read
+    with a short timeout so that only the bytes which are waiting are consumed, and completed lines are
+    placed on a shared (bounded) line queue for writing to the database.  If the line queue is full the
+    line is dropped and counted, so a slow database never stalls the serial port.
+
+    Short (four character) messages such as ACK are command responses, and are placed on the `responses`
+    queue so that commands can still be sent to the board whilst it is streaming.
+
+    Boards which have negotiated binary framing send SerialFrameDecoder frames instead of lines, which are
+    decoded back to the hex string form that is stored in the database.  Command responses from these boards
+    may be framed or sent as plain text lines between frames.
+
+    :param board_id: the ID of the board in hex form, (e.g. "08" for board with ID 8)
+    :param port: the open serial port to read from
+    :param line_queue: the Queue.Queue that received data lines are put on
+    :param binary: if True the board is sending binary frames rather than lines (default False)
+    """
+
+    # the read timeout (in seconds) used on the port whilst streaming
+    READ_TIMEOUT = 0.05
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, board_id, port, line_queue, binary=False):
+        self.board_id = board_id
+        self.port = port
+        self.lines = line_queue
+        self.decoder = SerialFrameDecoder() if binary else None
+        self.responses = Queue.Queue()
+        self.received = 0
+        self.dropped = 0
+        self.__buffer = ""
+        self.__stop_event = threading.Event()
+        self.__thread = None
+        self.__previous_timeout = port.timeout
+
+    def start(self):
+        """
+        Starts reading from the serial port on a background thread
+
+        :returns: Nothing
+        """
+        self.port.timeout = self.READ_TIMEOUT
+        self.__thread = threading.Thread(target=self.run, args=[self.__stop_event])
+        self.__thread.daemon = True
+        self.__thread.start()
+        self.logger.debug("Started streaming from board %s on %s" % (self.board_id, self.port.port))
+
+    def stop(self):
+        """
+        Stops reading from the serial port and restores the original port timeout
+
+        :returns: Nothing
+        """
+        self.__stop_event.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.port.timeout = self.__previous_timeout
+        self.logger.debug("Stopped streaming from board %s, received %s lines and dropped %s" % (
+            self.board_id, self.received, self.dropped))
+
+    def is_alive(self):
+        """
+        Checks if the reader thread is running
+
+        :returns: True if the reader is reading from the serial port, False otherwise
+        """
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def run(self, stop_event):
+        """
+        Reads whatever is waiting on the serial port until the stop_event is set
+
+        :param stop_event: the threading Event which triggers stopping the reader
+
+        :returns: Nothing
+        """
+        while not stop_event.is_set():
+            try:
+                data = self.port.read(max(1, self.port.inWaiting()))
+            except serial.SerialException as e:
+                self.logger.error("Error reading stream from board %s - %s" % (self.board_id, e))
+                break
+
+            if data:
+                self.handle_data(data)
+
+    def handle_data(self, data):
+        """
+        Splits received bytes into lines (or decodes binary frames) and dispatches any completed lines.
+        Incomplete lines are buffered until the remainder is received
+
+        :param data: the string of bytes read from the serial port
+
+        :returns: Nothing
+        """
+        if self.decoder is not None:
+            lines = self.decoder.feed(data)
+
+            # plain text between frames can only be a command response
+            for line in self.decoder.text_lines():
+                if len(line) == 4:
+                    self.responses.put(line)
+                else:
+                    self.logger.debug("Ignoring text (%s) between frames from board %s" % (line, self.board_id))
+        else:
+            lines = (self.__buffer + data).split('\n')
+            self.__buffer = lines.pop()
+
+        for line in lines:
+            line = line.replace('\r', '')
+            line_size = len(line)
+
+            if line_size < 4:
+                self.logger.debug("Received short message (%s) from board %s, ignoring" % (line, self.board_id))
+            elif line_size == 4:
+                self.responses.put(line)
+            else:
+                self.received += 1
+                try:
+                    self.lines.put_nowait(line)
+                except Queue.Full:
+                    self.dropped += 1
+                    if self.dropped == 1 or self.dropped % 1000 == 0:
+                        self.logger.warning("Stream queue full, dropped %s lines from board %s" % (
+                            self.dropped, self.board_id))
+
+
 class SerialManager(object):
     """
     Manages serial (eventually RS232, SPI or I2C) communications with
@@ -30,11 +268,44 @@ class SerialManager(object):
     which it uses for sending information.
     """
 
+    # the file in which the board ID and baud rate found on each port are cached between runs
+    PORT_CACHE_PATH = user_data_path("serial_ports.json")
+
+    # read timeouts (in seconds) used for each successive ID request when probing a port
+    PROBE_TIMEOUTS = [0.1, 0.3, 1.0]
+
+    # read timeout (in seconds) for ports once a board has been found
+    READ_TIMEOUT = 3
+
+    # the baud rate boards use when they are reset
+    BAUD_RATE = 57600
+
+    # faster baud rates to try and negotiate with each board, in order of preference
+    NEGOTIATED_BAUD_RATES = [230400, 115200]
+
+    # read timeout (in seconds) for the responses to baud rate negotiation, which legacy boards ignore
+    NEGOTIATION_TIMEOUT = 0.3
+
+    # if True, streaming boards are asked to send SerialFrameDecoder frames instead of hex lines
+    BINARY_FRAMING_ENABLED = True
+
+    # if True, boards are asked to push data continuously rather than being polled with TRANSMIT
+    STREAMING_ENABLED = True
+
+    # the maximum number of streamed lines waiting to be written to the database
+    STREAM_QUEUE_SIZE = 50000
+
+    # the maximum number of streamed lines written to the database in one operation
+    STREAM_BATCH_SIZE = 500
+
     __instance = None
     database = None
     serial_mapping = None
     __serial_thread = None
+    __stream_thread = None
     __stop_event = None
+    __streams = {}
+    __stream_queue = None
 
     logger = logging.getLogger(__name__)
 
@@ -83,45 +354,263 @@ class SerialManager(object):
         logging_stopped.connect(self.stop)
         board_command_received.connect(self.handle_board_command)
 
-    def get_available_ports(self):
+    def get_available_ports(self, rescan=False):
         """
         Generates a list of available serial ports, mapping their ID to
         the COM* or /dev/tty* reference.  Adapted from http://stackoverflow.com/a/14224477/233608
 
+        The board ID and baud rate found on each port are cached along with the port's hardware ID.  Ports
+        which are listed with the same hardware ID as last time are not probed again - ports which had no board
+        are skipped, and boards are verified with a single request at the baud rate they were left at.  Every
+        other port is probed in parallel using increasing read timeouts from PROBE_TIMEOUTS, and then at each
+        of the NEGOTIATED_BAUD_RATES in case a board was left at a faster rate by a previous run.  Newly found
+        boards are asked to move to a faster baud rate, and the result is cached so that boards which refuse
+        are not asked again.  The port cache is rewritten with the results.
+
+        :param rescan: if True the port cache is ignored and every port is probed (default False)
+
         :returns: Nothing
         """
         self.logger.info("Scanning for available serial ports")
         self.serial_mapping = {}
+        ports = self.list_serial_ports()
+        cache = {} if rescan else self.load_port_cache(self.PORT_CACHE_PATH)
+        known = dict((p, cache[p]) for p, hwid in ports.iteritems() if p in cache and cache[p]["hwid"] == hwid)
+        new_cache = dict((p, entry) for p, entry in known.iteritems() if entry["board_id"] is None)
+        results = {}
+
+        # verify the cached boards at their cached baud rate - if nothing has changed this is the only probe
+        cached_boards = dict((p, entry) for p, entry in known.iteritems() if entry["board_id"] is not None)
+        self.logger.debug("Verifying %s cached serial ports, skipping %s without a board" % (
+            len(cached_boards), len(new_cache)))
+        for baud_rate in set(entry["baud_rate"] for entry in cached_boards.values()):
+            verify = [p for p, entry in cached_boards.iteritems() if entry["baud_rate"] == baud_rate]
+            for port, (ser, board_id) in self.__probe_ports(verify, self.PROBE_TIMEOUTS[:1], baud_rate).iteritems():
+                if board_id is not None and board_id == cached_boards[port]["board_id"]:
+                    results[port] = (ser, board_id)
+                    new_cache[port] = cached_boards[port]
+                elif ser is not None:
+                    ser.close()
+
+        # probe everything else - new or changed ports, and cached boards which didn't answer
+        unknown_ports = [p for p in ports if p not in results and p not in new_cache]
+        self.logger.debug("Probing %s unknown serial ports" % len(unknown_ports))
+        probed = self.__probe_ports(unknown_ports, self.PROBE_TIMEOUTS, self.BAUD_RATE, self.NEGOTIATED_BAUD_RATES)
+
+        # save the boards we found and close everything else
+        for port, (ser, board_id) in probed.iteritems():
+            if board_id is not None:
+                results[port] = (ser, board_id)
+            else:
+                new_cache[port] = {"hwid": ports[port], "board_id": None, "baud_rate": None}
+                if ser is not None:
+                    ser.close()
+
+        for port, (ser, board_id) in results.iteritems():
+            key = hex(board_id)[2:].zfill(2)
+            self.logger.info("Found board ID %s at %s" % (board_id, port))
+            ser.timeout = self.READ_TIMEOUT
+            self.serial_mapping[key] = ser
+
+            if port not in new_cache:
+                new_cache[port] = {"hwid": ports[port], "board_id": board_id, "baud_rate": self.negotiate_baud_rate(key)}
+
+        self.save_port_cache(self.PORT_CACHE_PATH, new_cache)
+
+    def rescan_ports(self):
+        """
+        Closes the open serial ports and probes every port again, ignoring the port cache.  Use this when a
+        board has been changed without the port listing changing.
+
+        :returns: Nothing
+        """
+        for ser in self.serial_mapping.values():
+            ser.close()
+
+        self.get_available_ports(rescan=True)
+
+    def list_serial_ports(self):
+        """
+        Lists the serial ports on this machine with their hardware IDs (which include the USB serial number
+        where there is one).  On Windows, if the port enumeration doesn't return any ports then COM1 to COM256
+        are opened in parallel to find out which exist, and these ports have no hardware ID
+
+        :returns: a dictionary of {port name: hardware ID}
+        """
+        ports = dict((port[0], port[2]) for port in comports())
+
+        if ports or os.name != 'nt':
+            return ports
+
         ports = []
 
-        # Windows
-        if os.name == 'nt':
-            self.logger.debug("Performing Windows scan")
+        self.logger.debug("Performing Windows scan")
+        lock = threading.Lock()
+        threads = []
 
-            # scan for available ports
-            for i in range(256):
-                try:
-                    portname = "COM%s" % (i + 1)
-                    s = self.open_serial_connection(portname)
-                    s.close()
-                    ports.append(portname)
+        def try_port(name):
+            try:
+                self.open_serial_connection(name, read_timeout=0).close()
+            except serial.SerialException:
+                return
 
-                except serial.SerialException:
-                    pass
-        else:
-            # Mac / Linux
-            self.logger.debug("Performing Mac/Linux scan for expansion boards on serial ports")
-            for port in comports():
-                ports.append(port[0])
-
-        for port in ports:
-            ser = self.open_serial_connection(port)
-            board_id = self.send_id_request(ser)
-            if board_id is not None:
-                self.logger.info("Found board ID %s at %s" % (board_id, port))
-                self.serial_mapping[hex(board_id)[2:].zfill(2)] = ser
-            else:
-                ser.close()
+            with lock:
+                ports.append(name)
+
+        for i in range(256):
+            t = threading.Thread(target=try_port, args=["COM%s" % (i + 1)])
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
+        return dict((name, "") for name in ports)
+
+    def __probe_ports(self, ports, timeouts, baud_rate, fallback_rates=()):
+        """
+        Opens each of the given ports and requests a board ID, with one thread per port.  Each port is
+        asked for its ID at the given baud rate with the first timeout, and ports which do not respond are
+        retried with each subsequent (longer) timeout until an ID is received or the timeouts are exhausted.
+        Ports which still do not respond are then asked at each of the fallback rates with the longest timeout,
+        and are left open at the rate the board answered at.
+
+        :param ports: a list of port names to probe
+        :param timeouts: a list of increasing read timeouts (in seconds) to use for each attempt
+        :param baud_rate: the baud rate to open the ports at
+        :param fallback_rates: baud rates to try if the board doesn't answer at baud_rate (default none)
+
+        :returns: a dictionary of {port_name: (open serial port or None, board ID or None)}
+        """
+        results = {}
+        lock = threading.Lock()
+
+        def probe(port_name):
+            ser = None
+            board_id = None
+
+            try:
+                ser = self.open_serial_connection(port_name, baud_rate=baud_rate, read_timeout=timeouts[0])
+                for timeout in timeouts:
+                    ser.timeout = timeout
+                    board_id = self.send_id_request(ser)
+                    if board_id is not None:
+                        break
+
+                # a board which wasn't reset since it was negotiated to a faster rate only answers at that rate
+                if board_id is None:
+                    for fallback_rate in fallback_rates:
+                        ser.baudrate = fallback_rate
+                        board_id = self.send_id_request(ser)
+                        if board_id is not None:
+                            self.logger.info("Found a board at %s baud on %s" % (fallback_rate, port_name))
+                            break
+                    else:
+                        ser.baudrate = baud_rate
+            except serial.SerialException as e:
+                self.logger.debug("Unable to probe serial port %s - %s" % (port_name, e))
+
+            with lock:
+                results[port_name] = (ser, board_id)
+
+        threads = [threading.Thread(target=probe, args=[port]) for port in ports]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        return results
+
+    @staticmethod
+    def load_port_cache(path):
+        """
+        Loads the cached board ID and baud rate of each port from disk.  Entries in the format saved by older
+        versions, which only held the board ID, are ignored so those ports are probed again
+
+        :param path: the path to the port cache file
+
+        :returns: a dictionary of {port_name: {"hwid": hardware ID, "board_id": board ID or None,
+            "baud_rate": baud rate or None}}, which is empty if the cache could not be read
+        """
+        try:
+            with open(path, 'r') as f:
+                cache = json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+        if not isinstance(cache, dict):
+            return {}
+
+        keys = set(["hwid", "board_id", "baud_rate"])
+        return dict((k, v) for k, v in cache.iteritems() if isinstance(v, dict) and set(v.keys()) == keys)
+
+    @classmethod
+    def save_port_cache(cls, path, cache):
+        """
+        Writes the board ID and baud rate of each port to disk, creating the directory if required
+
+        :param path: the path to the port cache file
+        :param cache: a dictionary of {port_name: {"hwid": hardware ID, "board_id": board ID or None,
+            "baud_rate": baud rate or None}}
+
+        :returns: Nothing
+        """
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(path, 'w') as f:
+                json.dump(cache, f)
+        except (IOError, OSError) as e:
+            cls.logger.warning("Unable to write serial port cache to %s - %s" % (path, e))
+
+    def negotiate_baud_rate(self, board_id):
+        """
+        Attempts to move the given board to a faster baud rate.  Each rate in NEGOTIATED_BAUD_RATES is
+        requested with a SET_BAUD command in turn.  If the board acknowledges the request the port is
+        switched to the new rate and the board is asked for its ID to confirm the link works, otherwise
+        the port is returned to the previous rate.  Responses are read with NEGOTIATION_TIMEOUT, so boards
+        which ignore SET_BAUD are not waited on for long.  Boards return to BAUD_RATE when they are reset.
+
+        :param board_id: the ID of the board in hex form, (e.g. "08" for board with ID 8)
+
+        :returns: the baud rate the board is now using
+        """
+        port = self.serial_mapping[board_id]
+        previous_rate = port.baudrate
+        previous_timeout = port.timeout
+        port.timeout = self.NEGOTIATION_TIMEOUT
+
+        try:
+            for baud_rate in self.NEGOTIATED_BAUD_RATES:
+                if baud_rate <= previous_rate:
+                    continue
+
+                # the payload is the requested rate as a 32 bit number, after an empty timestamp
+                response = self.send_command_with_ack(
+                    SerialCommands['SET_BAUD'] + "00000000" + hex(baud_rate)[2:].rjust(8, "0").upper(), board_id)
+
+                if response is not None:
+                    self.logger.debug("Board %s refused baud rate %s (received '%s')" % (
+                        board_id, baud_rate, response))
+                    continue
+
+                port.baudrate = baud_rate
+                if self.send_id_request(port) == int(board_id, 16):
+                    self.logger.info("Board %s is now using %s baud" % (board_id, baud_rate))
+                    return baud_rate
+
+                self.logger.warning("Board %s did not respond at %s baud, returning to %s baud" % (
+                    board_id, baud_rate, previous_rate))
+                port.baudrate = previous_rate
+                self.send_id_request(port)
+        finally:
+            port.timeout = previous_timeout
+
+        return previous_rate
 
     @staticmethod
     def open_serial_connection(port_name, baud_rate=57600, read_timeout=3):
@@ -239,9 +728,12 @@ class SerialManager(object):
         except KeyError:
             raise ExpansionBoardNotFound("Unable to find board %s - it doesn't appear to be connected" % board_id)
 
+        reader = self.__streams.get(board_id)
+
         # clear existing
-        port.write('\n')
-        port.readline()
+        if reader is None:
+            port.write('\n')
+            port.readline()
 
         # set up the command
         command = board_id + command
@@ -254,8 +746,14 @@ class SerialManager(object):
         # write the command
         port.write(command)
 
-        # read the response
-        serial_buffer = port.readline().replace('\n', '').replace('\r', '')
+        # read the response, which is read by the stream reader if the board is streaming
+        if reader is None:
+            serial_buffer = port.readline().replace('\n', '').replace('\r', '')
+        else:
+            try:
+                serial_buffer = reader.responses.get(True, self.READ_TIMEOUT)
+            except Queue.Empty:
+                serial_buffer = ""
 
         # TODO: properly handle errors
         self.logger.debug("Sent {0} on {1}, received \"{2}\"".format(
@@ -283,6 +781,26 @@ class SerialManager(object):
         # enter a new session
         session_id = self.database.start_session()
 
+        # ask boards to stream, any which don't acknowledge will be polled instead
+        streaming_boards = []
+        binary_boards = []
+        if self.STREAMING_ENABLED:
+            for k in self.serial_mapping.keys():
+                response = self.send_command_with_ack(SerialCommands['STREAM'], k)
+
+                if response is None:
+                    streaming_boards.append(k)
+                    self.logger.debug("Board %s will stream data" % k)
+
+                    # ask streaming boards to send binary frames once they have acknowledged START
+                    if self.BINARY_FRAMING_ENABLED and \
+                            self.send_command_with_ack(SerialCommands['BINARY_FRAMING'], k) is None:
+                        binary_boards.append(k)
+                        self.logger.debug("Board %s will stream binary frames" % k)
+                else:
+                    self.logger.info("Board %s does not support streaming (received '%s'), polling instead" % (
+                        k, response))
+
         # send a start signal to all boards
         for k in self.serial_mapping.keys():
             success = self.send_command_with_ack(SerialCommands['START'], k)
@@ -293,8 +811,21 @@ class SerialManager(object):
             else:
                 self.logger.debug("Board %s has started logging" % k)
 
-        # Start a thread for polling serial for updates
         self.__stop_event = threading.Event()
+
+        # start reading from streaming boards and writing their lines to the database
+        self.__stream_queue = Queue.Queue(self.STREAM_QUEUE_SIZE)
+        self.__streams = {}
+        for k in streaming_boards:
+            self.__streams[k] = SerialStreamReader(
+                k, self.serial_mapping[k], self.__stream_queue, binary=k in binary_boards)
+            self.__streams[k].start()
+
+        self.__stream_thread = threading.Thread(target=self.__write_streams, args=[self.__stop_event])
+        self.__stream_thread.daemon = True
+        self.__stream_thread.start()
+
+        # Start a thread for polling serial for updates
         self.__serial_thread = threading.Thread(target=self.__poll_serial, args=[self.__stop_event])
         self.__serial_thread.daemon = True
         self.__serial_thread.start()
@@ -323,7 +854,8 @@ class SerialManager(object):
             for k in self.serial_mapping.keys():
 
                 # clear out the serial buffer
-                self.receive_serial_data(k)
+                if k not in self.__streams.keys():
+                    self.receive_serial_data(k)
 
                 # then stop the board
                 success = self.send_command_with_ack(SerialCommands['STOP'], k)
@@ -334,6 +866,22 @@ class SerialManager(object):
                 else:
                     self.logger.debug("Board %s has stopped logging" % k)
 
+            # stop the stream readers and write out any remaining lines
+            for reader in self.__streams.values():
+                reader.stop()
+
+                if reader.decoder is not None and reader.decoder.crc_errors > 0:
+                    self.logger.warning("Received %s corrupt frames from board %s" % (
+                        reader.decoder.crc_errors, reader.board_id))
+
+                if reader.dropped > 0:
+                    self.logger.warning("Dropped %s of %s lines streamed from board %s" % (
+                        reader.dropped, reader.received, reader.board_id))
+
+            self.__stream_thread.join()
+            self.__streams = {}
+            self.__stop_event = None
+
         # end the new session
         if self.database is not None:
             self.database.stop_session()
@@ -368,14 +916,54 @@ class SerialManager(object):
         self.logger.debug("Commencing Serial polling loop")
 
         while not stop_event.is_set():
-            # enumerate each port
+            # enumerate each port which isn't streaming
             for k in self.serial_mapping.keys():
-                self.receive_serial_data(k)
+                if k not in self.__streams.keys():
+                    self.receive_serial_data(k)
 
-            time.sleep(SerialUpdatePeriod)
+            stop_event.wait(SerialUpdatePeriod)
 
         self.logger.debug("Exited poll serial thread")
 
+    def __write_streams(self, stop_event):
+        """
+        A thread which writes lines received from streaming boards to the database in batches until a
+        stop_event is received, after which any lines remaining in the queue are written out
+
+        :param stop_event: the threading Event which triggers stopping serial listening
+
+        :returns: Nothing
+        """
+
+        self.logger.debug("Commencing serial stream writing loop")
+
+        while True:
+            try:
+                lines = [self.__stream_queue.get(True, 0.1)]
+            except Queue.Empty:
+                if stop_event.is_set() and not any(r.is_alive() for r in self.__streams.values()):
+                    break
+                continue
+
+            # take whatever else is waiting, up to the batch size
+            while len(lines) < self.STREAM_BATCH_SIZE:
+                try:
+                    lines.append(self.__stream_queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            self.database.queue_many(lines)
+
+        self.logger.debug("Exited serial stream writing thread")
+
+    def get_stream_statistics(self):
+        """
+        Gets the number of lines received and dropped for each board which is streaming
+
+        :returns: a dictionary of {board_id: (lines received, lines dropped)}
+        """
+        return dict([(k, (r.received, r.dropped)) for k, r in self.__streams.iteritems()])
+
     def __del__(self):
         """
         Destroys the SerialManager and closes all open ports
@@ -2,9 +2,24 @@ __author__ = 'Will Hart'
 
 from blitz.constants import *
 from blitz.communications.client_states import BaseState
+from blitz.communications.compression import get_codec, negotiate_codec
 import blitz.communications.signals as sigs
 
 
+def bulk_available():
+    """
+    Checks if bulk encoded downloads can be sent.  Bulk encoding needs numpy, which is not required by the
+    server, so it is only imported once a client asks for bulk transfers.
+
+    :returns: True if `blitz.communications.bulk` can be imported
+    """
+    try:
+        import blitz.communications.bulk
+    except ImportError:
+        return False
+    return True
+
+
 def validate_command(msg, commands):
     """
     Helper function which checks to see if a message is in the list of valid commands
@@ -34,6 +49,15 @@ class ServerBaseState(BaseState):
             tcp.send(CommunicationCodes.Acknowledge)
             return True
 
+        if msg[0:6] == CommunicationCodes.Codec + " ":
+            # choose a codec for compressing downloads from those offered by the client
+            offered = msg.split(" ")[1:]
+            name = negotiate_codec(offered, tcp.codecs)
+            tcp.codec = get_codec(name, tcp.compression_level)
+            tcp.bulk = tcp.bulk_transfer and "bulk" in offered and bulk_available()
+            tcp.do_send(CommunicationCodes.composite(CommunicationCodes.Codec, name + (" bulk" if tcp.bulk else "")))
+            return True
+
         return False  # message was not handled
 
 
@@ -140,21 +164,34 @@ class ServerDownloadingState(ServerBaseState):
             tcp.do_send(CommunicationCodes.Negative)
             return self.go_to_state(tcp, ServerIdleState)
 
-        # send the next block of messages, appending the correct command code
+        # send the next block of messages with the correct command code
         #  >> ACK for more to come
         #  >> NACK for transmission complete
-        lines = "\n".join(self.session_data[self.send_index])
+        index = self.send_index
         self.send_index += 1
+        complete = self.send_index == len(self.session_data)
+        code = CommunicationCodes.Negative if complete else CommunicationCodes.Acknowledge
+
+        if tcp.bulk:
+            # bulk blocks are the command code followed by the encoded and optionally compressed lines
+            from blitz.communications.bulk import encode_block
+            block = encode_block(self.session_data[index])
+            tcp.do_send(code + " " + (tcp.codec.compress(block) if tcp.codec is not None else block))
+        elif tcp.codec is None:
+            # plain blocks are the lines followed by the command code
+            tcp.do_send("\n".join(self.session_data[index]) + "\n" + code)
+        elif tcp.codec.name == "zlib" and hasattr(self.session_data, "compressed"):
+            # compacted sessions are already stored as zlib compressed blocks so can be sent as they are
+            tcp.do_send(code + " " + self.session_data.compressed(index))
+        else:
+            # compressed blocks are the command code followed by the compressed lines
+            tcp.do_send(code + " " + tcp.codec.compress("\n".join(self.session_data[index])))
 
-        if self.send_index == len(self.session_data):
-            lines += "\n" + CommunicationCodes.Negative
-            tcp.do_send(lines)
+        if complete:
             self.session_data = []
             self.send_index = 0
             return self.go_to_state(tcp, ServerIdleState)
 
-        lines += "\n" + CommunicationCodes.Acknowledge
-        tcp.do_send(lines)
         return self
 
     def receive_message(self, tcp, msg):
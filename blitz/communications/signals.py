@@ -20,6 +20,16 @@ logger_connecting = signal('logger_connected')
 #:  - :mod:`ClientLoggingState`.receive_message
 cache_line_received = signal('cache_line_received')
 
+#: Fired when a batch of cached lines has been parsed and saved, with the data formatted for the user interface.
+#: Sent on the cache worker thread, at most `CacheLineWorker.MAX_UPDATE_RATE` times per second
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - `GUISignalEmitter`.__init__
+#:
+#: Sent by:
+#:  - :mod:`MainBlitzApplication`.update_interface
+cache_data_processed = signal('cache_data_processed')
+
 #: Fired when the expansion board receives a data row for processing
 #: during a download.  Allows pre-processing of data
 #:
@@ -31,6 +41,36 @@ cache_line_received = signal('cache_line_received')
 #:  - :mod:`ClientDownloadingState`.receive_message
 data_line_received = signal('data_line_received')
 
+#: Fired when the logger has sent all of the data for a session that was being downloaded,
+#: with the session ID.  Some of the data may still be waiting to be decoded and saved.
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`BoardManager`.__init__ >> BoardManager.finish_session_download
+#:
+#: Sent by:
+#:  - :mod:`ClientDownloadingState`.receive_message
+session_data_received = signal('session_data_received')
+
+#: Fired when all of the data for a session that was being downloaded has been saved,
+#: with the session ID
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`DatabaseClient`.__init__ >> DatabaseClient.archive_session
+#:
+#: Sent by:
+#:  - :mod:`SessionDecoder`.run
+session_download_finished = signal('session_download_finished')
+
+#: Fired when a bulk encoded block of session data is received during a download,
+#: with a tuple of (block, session_id)
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`BoardManager`.__init__ >> BoardManager.parse_session_block
+#:
+#: Sent by:
+#:  - :mod:`ClientDownloadingState`.receive_message
+data_block_received = signal('data_block_received')
+
 #: Fired when a board has finished processing a data line
 #:
 #: Sent by:
@@ -202,3 +242,13 @@ process_started = signal('process_started')
 #: Sent by:
 #:  - :mod:`TcpBase`.run_client
 process_finished = signal('process_finished')
+
+#: Fired when an asynchronous process makes progress, with a description of the progress, to allow clients to
+#: update the UI
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - `GUISignalEmitter`.__init__
+#:
+#: Sent by:
+#:  - :mod:`BlitzSessionTabPane`.save_session
+process_progress = signal('process_progress')
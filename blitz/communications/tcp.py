@@ -4,6 +4,7 @@ import Queue
 import zmq
 
 from blitz.communications.client_states import *
+from blitz.communications.compression import CODECS
 from blitz.communications.server_states import *
 import blitz.communications.signals as sigs
 
@@ -20,9 +21,23 @@ class TcpBase(object):
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, host="localhost", port=None):
+    def __init__(self, host="localhost", port=None, codecs=None, compression_level=None, bulk_transfer=True):
+        """
+        :param host: the host to connect to as a client
+        :param port: the port to connect to or serve on
+        :param codecs: the names of the codecs a client offers, or a server accepts, for compressing downloads
+            (default None, all available codecs)
+        :param compression_level: the level a server compresses downloads at (default None, the codec default)
+        :param bulk_transfer: if True bulk encoded downloads are offered by a client, or accepted by a server
+            (default True)
+        """
         self.__host = host
         self.__port = port
+        self.codecs = list(CODECS.keys()) if codecs is None else codecs
+        self.compression_level = compression_level
+        self.bulk_transfer = bulk_transfer
+        self.codec = None
+        self.bulk = False
         self.send_queue = Queue.Queue()
         self.waiting = False
         self.__poller = zmq.Poller()
@@ -31,6 +46,20 @@ class TcpBase(object):
         self.__state_machine = None
         self.__context = None
 
+    @staticmethod
+    def command_code(msg):
+        """
+        Gets the command code of a message for logging, without the data of download blocks which may be binary.
+        Plain download blocks end with their command code, other messages start with it.
+
+        :param msg: the message received
+        :returns: the command code of the message
+        """
+        head = msg[:16].split(" ", 1)[0].split("\n", 1)[0]
+        if head.isalpha() and head.isupper():
+            return head
+        return msg[-16:].rsplit("\n", 1)[-1]
+
     def create_client(self, autorun=True):
         self.__context = zmq.Context(1)
         self.__socket = self.__context.socket(zmq.REQ)
@@ -87,7 +116,7 @@ class TcpBase(object):
                 reply = self.__socket.recv()
                 self.receive_message(reply)
                 sigs.tcp_message_received.send([self, reply])
-                self.logger.info("Server processed message: %s" % reply)
+                self.logger.debug("Server processed message: %s (%s bytes)" % (self.command_code(reply), len(reply)))
 
                 # now wait until a response is ready to send
                 self.waiting = False
@@ -179,7 +208,7 @@ class TcpBase(object):
             # now handle the reply
             self.receive_message(reply)
             sigs.tcp_message_received.send([self, reply])
-            self.logger.info("Client processed message: %s" % reply)
+            self.logger.debug("Client processed message: %s (%s bytes)" % (self.command_code(reply), len(reply)))
 
         # terminate the context before exiting
         self.__socket.close()
@@ -29,6 +29,7 @@ class CommunicationCodes(object):
     IsLogging = "LOGGING"
     GetSessions = "SESSIONS"
     Reset = "RESET"
+    Codec = "CODEC"
 
     @classmethod
     def composite(cls, base_code, code_id):
@@ -54,7 +55,8 @@ VALID_SERVER_COMMANDS = [
     CommunicationCodes.Board,
     CommunicationCodes.IsLogging,
     CommunicationCodes.GetSessions,
-    CommunicationCodes.Reset
+    CommunicationCodes.Reset,
+    CommunicationCodes.Codec
 ]
 
 # commands that are valid to send TO the client
@@ -68,7 +70,8 @@ VALID_CLIENT_COMMANDS = [
     CommunicationCodes.NoBoard,
     CommunicationCodes.Error,
     CommunicationCodes.Ready,
-    CommunicationCodes.Reset
+    CommunicationCodes.Reset,
+    CommunicationCodes.Codec
 ]
 
 MAX_MESSAGE_LENGTH = 112  # max length of message in bits
@@ -89,6 +92,8 @@ BOARD_MESSAGE_MAPPING = {
 
 SerialUpdatePeriod = 1.0  # serial update period in seconds
 
+# SET_BAUD carries the requested baud rate as a 32 bit payload.  BINARY_FRAMING applies to
+# streaming boards, which send SerialFrameDecoder frames instead of hex lines after START is acknowledged
 SerialCommands = {
     'ACK': '40',
     'TRANSMIT': 'C0',
@@ -98,4 +103,7 @@ SerialCommands = {
     'SET_SPEED': '85',
     'SET_ANGLE': '86',
     'MOTOR_HOME': '87',
+    'STREAM': 'A0',
+    'BINARY_FRAMING': 'A1',
+    'SET_BAUD': '82',
 }
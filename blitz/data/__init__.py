@@ -1,8 +1,274 @@
-import sys
-
 __author__ = 'Will Hart'
 
 from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+class SeriesBuffer(object):
+    """
+    A preallocated float64 buffer which holds the x and y values of a single data series.  Values are
+    appended in O(1) (amortised) time and the `x` and `y` properties return views of the buffer without
+    copying.  Views are only valid until the next call to `append`.
+
+    If a capacity is given only the most recent `capacity` values are kept.  The buffer holds twice the
+    capacity so that old values only need to be moved to the start of the buffer once every `capacity`
+    appended values, keeping the retained values contiguous.
+
+    Without a capacity the buffer doubles in size whenever it is full.  Once it would grow beyond
+    `spill_threshold` values the series is moved to memory mapped files in a temporary directory, so that
+    very long series are paged in from disk by the operating system rather than held in memory.  The
+    temporary files are removed when `close` is called.
+
+    The `appended` attribute counts every value ever appended to the buffer, including values which have
+    since been discarded, so that consumers can work out how many values are new since they last looked.
+
+    :param capacity: the maximum number of values to keep, or None to keep all values (default None)
+    :param initial_size: the initial size of an unbounded buffer (default 1024)
+    :param spill_threshold: the size above which an unbounded buffer is memory mapped (default SPILL_THRESHOLD)
+    """
+
+    SPILL_THRESHOLD = 2 ** 18
+
+    def __init__(self, capacity=None, initial_size=1024, spill_threshold=None):
+        self.capacity = capacity
+        self.spill_threshold = spill_threshold or self.SPILL_THRESHOLD
+        size = 2 * capacity if capacity else initial_size
+        self.__x = np.empty(size, dtype=np.float64)
+        self.__y = np.empty(size, dtype=np.float64)
+        self.__start = 0
+        self.__end = 0
+        self.__spill_dir = None
+        self.__spill_files = []
+        self.appended = 0
+
+    def __len__(self):
+        return self.__end - self.__start
+
+    @property
+    def x(self):
+        """A view of the x values in the buffer"""
+        return self.__x[self.__start:self.__end]
+
+    @property
+    def y(self):
+        """A view of the y values in the buffer"""
+        return self.__y[self.__start:self.__end]
+
+    @property
+    def spilled(self):
+        """True if the buffer has been moved to memory mapped files"""
+        return self.__spill_dir is not None
+
+    def append(self, x, y):
+        """
+        Appends x and y values to the buffer, discarding the oldest values if the buffer is at capacity
+
+        :param x: the list (or array) of x values to append
+        :param y: the list (or array) of y values to append, which must be the same length as x
+        """
+        count = len(x)
+        self.appended += count
+
+        if self.capacity and count >= self.capacity:
+            # the new values fill the buffer on their own
+            self.__x[:self.capacity] = x[count - self.capacity:]
+            self.__y[:self.capacity] = y[count - self.capacity:]
+            self.__start = 0
+            self.__end = self.capacity
+            return
+
+        if self.__end + count > len(self.__x):
+            if self.capacity:
+                # move the values we are keeping to the start of the buffer
+                keep = min(len(self), self.capacity - count)
+                self.__x[:keep] = self.__x[self.__end - keep:self.__end]
+                self.__y[:keep] = self.__y[self.__end - keep:self.__end]
+                self.__start = 0
+                self.__end = keep
+            else:
+                self.__grow(self.__end + count)
+
+        self.__x[self.__end:self.__end + count] = x
+        self.__y[self.__end:self.__end + count] = y
+        self.__end += count
+
+        if self.capacity and len(self) > self.capacity:
+            self.__start = self.__end - self.capacity
+
+    def close(self):
+        """
+        Releases the buffer, removing any memory mapped files
+        """
+        self.__x = np.empty(0, dtype=np.float64)
+        self.__y = np.empty(0, dtype=np.float64)
+        self.__start = 0
+        self.__end = 0
+
+        if self.__spill_dir is not None:
+            shutil.rmtree(self.__spill_dir, ignore_errors=True)
+            self.__spill_dir = None
+            self.__spill_files = []
+
+    def __grow(self, required):
+        """
+        Doubles the size of an unbounded buffer until it can hold `required` values, moving it
+        to memory mapped files if it is larger than the spill threshold
+        """
+        size = len(self.__x)
+        while size < required:
+            size *= 2
+
+        if self.__spill_dir is None and size <= self.spill_threshold:
+            new_x = np.empty(size, dtype=np.float64)
+            new_y = np.empty(size, dtype=np.float64)
+        else:
+            if self.__spill_dir is None:
+                self.__spill_dir = tempfile.mkdtemp(prefix="blitz_series_")
+
+            # memory mapped files can't be resized whilst views are held on them (on Windows)
+            # so create new files and remove the old ones if possible
+            old_files = self.__spill_files
+            self.__spill_files = [
+                os.path.join(self.__spill_dir, "%s_%s.dat" % (axis, size)) for axis in ("x", "y")]
+            new_x = np.memmap(self.__spill_files[0], dtype=np.float64, mode='w+', shape=(size,))
+            new_y = np.memmap(self.__spill_files[1], dtype=np.float64, mode='w+', shape=(size,))
+
+            for path in old_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        new_x[:self.__end] = self.__x[:self.__end]
+        new_y[:self.__end] = self.__y[:self.__end]
+        self.__x = new_x
+        self.__y = new_y
+
+
+class TransformCache(object):
+    """
+    A least recently used cache of transformed series, keyed by owner, series ID, series version and transform
+    chain.  Entries are evicted oldest first when the total size of the cached arrays exceeds `budget` bytes, and
+    an entry is replaced when a newer version of the same series is stored for the same transform chain.
+    Cached arrays are marked read only as they are shared between callers.
+
+    A cache can be shared between several DataContainers, each passing its own `owner` token so that series
+    with the same ID in different containers are cached separately.
+
+    :param budget: the maximum number of bytes of arrays to hold (default BUDGET)
+    """
+
+    BUDGET = 64 * 1024 * 1024
+
+    def __init__(self, budget=None):
+        self.budget = budget or self.BUDGET
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__versions = {}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, series_id, version, chain, owner=None):
+        """
+        Gets a cached result, marking it as the most recently used
+
+        :param series_id: the ID of the series
+        :param version: the version of the series the result was calculated from
+        :param chain: the key of the transform chain the result was calculated with
+        :param owner: a token identifying the container the series belongs to (default None)
+        :returns: a tuple of (x, y) arrays, or None if the result is not cached
+        """
+        key = (owner, series_id, version, chain)
+        try:
+            entry = self.__entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.__entries[key] = entry
+        self.hits += 1
+        return entry
+
+    def put(self, series_id, version, chain, x, y, owner=None):
+        """
+        Stores a result in the cache, evicting least recently used results if it is over budget.
+        Results larger than the whole budget are not stored.
+
+        :param series_id: the ID of the series
+        :param version: the version of the series the result was calculated from
+        :param chain: the key of the transform chain the result was calculated with
+        :param x: the transformed x values
+        :param y: the transformed y values
+        :param owner: a token identifying the container the series belongs to (default None)
+        """
+        previous = self.__versions.get((owner, series_id, chain))
+        if previous is not None:
+            self.__remove((owner, series_id, previous, chain))
+
+        nbytes = x.nbytes + y.nbytes
+        if nbytes > self.budget:
+            return
+
+        x.flags.writeable = False
+        y.flags.writeable = False
+        self.__entries[(owner, series_id, version, chain)] = (x, y)
+        self.__versions[(owner, series_id, chain)] = version
+        self.size += nbytes
+
+        while self.size > self.budget:
+            self.__remove(next(iter(self.__entries)))
+
+    def clear(self, owner=None):
+        """
+        Removes results from the cache
+
+        :param owner: if given, only the results stored with this owner token are removed (default None,
+            remove all results)
+        """
+        if owner is None:
+            self.__entries.clear()
+            self.__versions.clear()
+            self.size = 0
+            return
+
+        for key in [k for k in self.__entries if k[0] is owner]:
+            self.__remove(key)
+
+    def __remove(self, key):
+        """
+        Removes an entry from the cache if it is present
+        """
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[0].nbytes + entry[1].nbytes
+            self.__versions.pop((key[0], key[1], key[3]), None)
+
+
+class _TransformScratch(object):
+    """
+    Holds a subset of the series in a DataContainer so that a transform chain can be applied to only those
+    series.  Other attributes are read from the container.
+    """
+
+    def __init__(self, container, series_ids, x, y):
+        self.__container = container
+        self.__series_ids = series_ids
+        self.x_transformed = x
+        self.y_transformed = y
+
+    def __getattr__(self, name):
+        return getattr(self.__container, name)
+
+    def get_series_names(self):
+        return list(self.__series_ids)
 
 
 class DataContainer(object):
@@ -11,36 +277,64 @@ class DataContainer(object):
     also provides an interface for adding DataTransform objects which can be used
     to apply filters (i.e. moving average, multiplication, etc) to the data
 
-    :param persistent: Indicates if all data is kept, (True) or only 200 values for each series (False, default)
+    Each series is stored in a preallocated SeriesBuffer, and series are returned as numpy array views.
+    Persistent series which grow beyond `spill_threshold` values are memory mapped from temporary files
+    so that whole sessions can be loaded with bounded memory use.
+
+    :param persistent: Indicates if all data is kept, (True) or only `capacity` values for each series (False, default)
+    :param capacity: The number of values kept for each series when not persistent (default MAX_VALUES)
+    :param spill_threshold: The number of values above which a persistent series is memory mapped
+        (default SeriesBuffer.SPILL_THRESHOLD)
+    :param cache: The TransformCache used to store the results of transform chains which are not incremental
+        (defaults to a new cache with the default budget).  A cache can be shared between containers.
     """
 
     MAX_VALUES = 50
 
-    def __init__(self, persistent=False):
-        self.__series = OrderedDict()
-        self.__series_names = {}
-        self.number_of_series = 0
-        self.x = []
-        self.y = []
-        self.__transforms = []
-        self.x_transformed = []
-        self.y_transformed = []
+    def __init__(self, persistent=False, capacity=None, spill_threshold=None, cache=None):
         self.__persistent = persistent
+        self.__capacity = capacity or self.MAX_VALUES
+        self.__spill_threshold = spill_threshold
+        self.cache = cache if cache is not None else TransformCache()
+        self.__cache_owner = object()
+        self.__buffers = []
+        self.__transformed_buffers = []
+        self.__transforms = []
+        self.clear_data()
+
+    @property
+    def x(self):
+        """A list of x value arrays, one for each series in the order they were added"""
+        return [b.x for b in self.__buffers]
+
+    @property
+    def y(self):
+        """A list of y value arrays, one for each series in the order they were added"""
+        return [b.y for b in self.__buffers]
 
     def clear_data(self):
         """
         Clears all data from the data DataContainer
         :returns: Nothing
         """
+        for buf in self.__buffers:
+            buf.close()
+
+        self.cache.clear(self.__cache_owner)
         self.__series = OrderedDict()
-        self.x = []
-        self.y = []
+        self.__buffers = []
         self.__series_names = {}
         self.number_of_series = 0
         self.__transforms = []
+        self.reset_transforms()
 
-        self.x_transformed = []
-        self.y_transformed = []
+    def __new_buffer(self):
+        """
+        Creates an empty SeriesBuffer configured for this container
+        """
+        if self.__persistent:
+            return SeriesBuffer(spill_threshold=self.__spill_threshold)
+        return SeriesBuffer(self.__capacity)
 
     def push(self, series_id, series_name, x, y):
         """
@@ -59,26 +353,32 @@ class DataContainer(object):
         if len(x) != len(y):
             raise ValueError("X and Y lists must have the same number of elements")
 
+        series_id = str(series_id)
         created = False
 
-        if series_id not in self.__series.keys():
+        if series_id not in self.__series:
             self.__series[series_id] = self.number_of_series
             self.__series_names[series_id] = series_name
-            self.x.append([])
-            self.y.append([])
+            self.__buffers.append(self.__new_buffer())
             self.number_of_series += 1
             created = True
 
-        idx = self.__series[str(series_id)]
-        self.x[idx] += x
-        self.y[idx] += y
-
-        if not self.__persistent:
-            self.x[idx] = self.x[idx][-self.MAX_VALUES:]
-            self.y[idx] = self.y[idx][-self.MAX_VALUES:]
+        self.__buffers[self.__series[series_id]].append(x, y)
 
         return created
 
+    def get_version(self, series_id):
+        """
+        Gets the version of a series, which changes every time values are pushed to it
+
+        :param series_id: the ID of the series
+        :returns: an integer version, or None if the series is not registered
+        """
+        try:
+            return self.__buffers[self.__series[str(series_id)]].appended
+        except KeyError:
+            return None
+
     def get_name(self, series_id):
         """
         Returns the name of a series in the DataContainer with the given series ID
@@ -88,16 +388,16 @@ class DataContainer(object):
         :returns: The name of the series if it is in the Container, otherwise the series ID
         """
         return self.__series_names[series_id].replace("_", " ").title() \
-            if series_id in self.__series_names.keys() else series_id
+            if series_id in self.__series_names else series_id
 
     def all_series(self):
         """
         A generator which yields the series x, y values
-        :returns: generated [x, y] value lists
+        :returns: generated [key, x, y] values, where x and y are lists copied from the series
         """
-        for key in self.__series.keys():
-            idx = self.__series[key]
-            yield [key, self.x[idx], self.y[idx]]
+        for key, idx in self.__series.iteritems():
+            buf = self.__buffers[idx]
+            yield [key, buf.x.tolist(), buf.y.tolist()]
 
     def get_latest(self, named=False):
         """
@@ -107,8 +407,8 @@ class DataContainer(object):
         :returns: A list of tuples.  Each tuple is in the form `(variable_name, value)`
         """
         result = []
-        for k in self.__series.keys():
-            val = self.y[self.__series[k]][-1]
+        for k, idx in self.__series.iteritems():
+            val = self.__buffers[idx].y[-1]
             if named:
                 k = self.get_name(k)
 
@@ -118,45 +418,79 @@ class DataContainer(object):
 
     def get_x(self, series_id):
         """
-        Gets a list of x-values for a specified series_name
+        Gets a list of x-values for a specified series_name.  The list is a copy, so it is not changed by
+        later pushes.
 
         :param series_id: the string name of the series to retrieve
         :returns: a list of x values if the key is found, an empty list otherwise
         """
+        return list(self.get_x_view(series_id))
+
+    def get_y(self, series_id):
+        """
+        Gets a list of y-values for a specified series_name.  The list is a copy, so it is not changed by
+        later pushes.
+
+        :param series_id: the string name of the series to retrieve
+        :returns: a list of y values if the key is found, an empty list otherwise
+        """
+        return list(self.get_y_view(series_id))
+
+    def get_series(self, series_id):
+        """
+        Gets a single series and returns a list of [x,y] values.  The values are copies, so they are not
+        changed by later pushes.
+
+        :param series_id: The name of the series to return
+        :returns: A list of [x,y] values for the given series, or empty lists if the series doesn't exist
+        """
+        x, y = self.get_series_view(series_id)
+        return [list(x), list(y)]
+
+    def get_x_view(self, series_id):
+        """
+        Gets the x-values for a specified series_name without copying them, for drawing plots.  The array is
+        a view of the series buffer, so it may change or stop being valid when values are next pushed.
+
+        :param series_id: the string name of the series to retrieve
+        :returns: an array of x values if the key is found, an empty array otherwise
+        """
         try:
             idx = self.__series[str(series_id)]
         except KeyError:
-            return []
+            return np.empty(0)
 
-        return self.x[idx]
+        return self.__buffers[idx].x
 
-    def get_y(self, series_id):
+    def get_y_view(self, series_id):
         """
-        Gets a list of y-values for a specified series_name
+        Gets the y-values for a specified series_name without copying them, for drawing plots.  The array is
+        a view of the series buffer, so it may change or stop being valid when values are next pushed.
 
         :param series_id: the string name of the series to retrieve
-        :returns: a list of y values if the key is found, an empty list otherwise
+        :returns: an array of y values if the key is found, an empty array otherwise
         """
         try:
             idx = self.__series[str(series_id)]
         except KeyError:
-            return []
+            return np.empty(0)
 
-        return self.y[idx]
+        return self.__buffers[idx].y
 
-    def get_series(self, series_id):
+    def get_series_view(self, series_id):
         """
-        Gets a single series and returns a list of [x,y] values
+        Gets a single series without copying it, for drawing plots.  The arrays are views of the series
+        buffer, so they may change or stop being valid when values are next pushed.
 
         :param series_id: The name of the series to return
-        :returns: A list of [x,y] values for the given series, or empty lists if the series doesn't exist
+        :returns: A tuple of (x, y) arrays for the given series, or empty arrays if the series doesn't exist
         """
+        try:
+            buf = self.__buffers[self.__series[series_id]]
+        except KeyError:
+            return np.empty(0), np.empty(0)
 
-        if series_id not in self.__series.keys():
-            return [[], []]
-        else:
-            idx = self.__series[series_id]
-            return [self.x[idx], self.y[idx]]
+        return buf.x, buf.y
 
     def get_transformed_series(self, series_id):
         """
@@ -165,12 +499,35 @@ class DataContainer(object):
         :param series_id: The name of the series to return
         :returns: A list of [x,y] values for the given series, or empty lists if the series doesn't exist
         """
-        if series_id not in self.__series.keys() or not self.x_transformed:
+        if series_id not in self.__series or not self.x_transformed:
             return [[], []]
         else:
             idx = self.__series[series_id]
             return [self.x_transformed[idx], self.y_transformed[idx]]
 
+    def get_series_array(self, series_ids=None):
+        """
+        Gets several series which share a time base as a single 2-D array
+
+        :param series_ids: the IDs of the series to return (defaults to all series in the order they were added)
+        :returns: a tuple of (x, y) where x is an array of the shared x values and y is a 2-D array with one
+            row of y values for each series
+        :raises: KeyError if a series is not registered, ValueError if the series do not share the same x values
+        """
+        if series_ids is None:
+            series_ids = self.__series.keys()
+
+        buffers = [self.__buffers[self.__series[str(k)]] for k in series_ids]
+        if not buffers:
+            return np.empty(0), np.empty((0, 0))
+
+        x = buffers[0].x
+        for buf in buffers[1:]:
+            if not np.array_equal(buf.x, x):
+                raise ValueError("Series do not share the same x values")
+
+        return x.copy(), np.vstack([buf.y for buf in buffers])
+
     def get_series_index(self, series_id):
         """
         Gets the index for a given series, or returns None if the series is not found
@@ -190,7 +547,7 @@ class DataContainer(object):
         :param series_id: The name of the series to check (will be converted to string)
         :returns: True if the series exists, false otherwise
         """
-        return str(series_id) in self.__series.keys()
+        return str(series_id) in self.__series
 
     def get_series_names(self):
         """
@@ -208,16 +565,114 @@ class DataContainer(object):
             raise ValueError("Attempted to add a data transformation class which doesn't derive from BaseDataTransform")
 
         self.__transforms.append(transform)
+        self.reset_transforms()
 
-    def apply_transforms(self):
+    def reset_transforms(self):
         """
-        Applies the transformation chain
+        Discards the transformed data and any state held by the transforms so that the next call to
+        `apply_transforms` processes all the data held in the container
         """
-        self.x_transformed = [data[:] for data in self.x]
-        self.y_transformed = [data[:] for data in self.y]
+        for buf in self.__transformed_buffers:
+            buf.close()
 
         for transform in self.__transforms:
-            transform.apply(self)
+            transform.reset()
+
+        self.__transformed_buffers = []
+        self.__processed = []
+        self.x_transformed = []
+        self.y_transformed = []
+
+    def __group_new_values(self):
+        """
+        Finds the values pushed to each series since transforms were last applied, and groups together
+        series which have the same new x values
+
+        :returns: a list of (x, indexes, series_ids, y_arrays) tuples, one for each group
+        """
+        groups = []
+
+        for key, idx in self.__series.iteritems():
+            if idx == len(self.__transformed_buffers):
+                self.__transformed_buffers.append(self.__new_buffer())
+                self.__processed.append(0)
+
+            buf = self.__buffers[idx]
+            count = min(buf.appended - self.__processed[idx], len(buf))
+            self.__processed[idx] = buf.appended
+
+            if count <= 0:
+                continue
+
+            x, y = buf.x[-count:], buf.y[-count:]
+            for group in groups:
+                if len(group[0]) == count and np.array_equal(group[0], x):
+                    group[1].append(idx)
+                    group[2].append(key)
+                    group[3].append(y)
+                    break
+            else:
+                groups.append((x, [idx], [key], [y]))
+
+        return groups
+
+    def apply_transforms(self):
+        """
+        Applies the transformation chain.  If every transform in the chain is incremental then only the
+        values pushed since the last call are passed through the chain and the results are appended to the
+        transformed data, otherwise the chain is applied to copies of all the data in the container.
+
+        Series which share a time base (for instance the channels of a NetScanner) are stacked into a
+        single 2-D array with one row per series, so that each transform runs once for all of them.
+
+        Results of chains which are not incremental are stored in the container's TransformCache, keyed by
+        the version of each series and the transform chain, so only series which have changed are transformed.
+        """
+        if not all(t.incremental for t in self.__transforms):
+            self.__apply_cached_transforms()
+            return
+
+        for x, indexes, keys, ys in self.__group_new_values():
+            if len(keys) == 1:
+                series_id, y = keys[0], ys[0]
+            else:
+                series_id, y = keys, np.vstack(ys)
+
+            for transform in self.__transforms:
+                x, y = transform.process(series_id, x, y)
+
+            for row, idx in enumerate(indexes):
+                self.__transformed_buffers[idx].append(x, y[row] if y.ndim == 2 else y)
+
+        self.x_transformed = [b.x for b in self.__transformed_buffers]
+        self.y_transformed = [b.y for b in self.__transformed_buffers]
+
+    def __apply_cached_transforms(self):
+        """
+        Applies a transform chain which is not incremental to each series that isn't in the cache
+        """
+        chain = transform_chain_key(self.__transforms)
+        series_ids = self.__series.keys()
+        results = [self.cache.get(k, self.__buffers[idx].appended, chain, self.__cache_owner)
+                   for k, idx in self.__series.iteritems()]
+        stale = [i for i, result in enumerate(results) if result is None]
+
+        # an empty container still runs the chain so that broken transforms are reported
+        if stale or not results:
+            scratch = _TransformScratch(
+                self, [series_ids[i] for i in stale],
+                [self.__buffers[i].x.copy() for i in stale], [self.__buffers[i].y.copy() for i in stale])
+
+            for transform in self.__transforms:
+                transform.apply(scratch)
+
+            for i, x, y in zip(stale, scratch.x_transformed, scratch.y_transformed):
+                x, y = np.asarray(x), np.asarray(y)
+                self.cache.put(series_ids[i], self.__buffers[i].appended, chain, x, y, self.__cache_owner)
+                results[i] = (x, y)
+
+        self.x_transformed = [r[0] for r in results]
+        self.y_transformed = [r[1] for r in results]
 
     def get_transforms(self):
         """
@@ -234,22 +689,97 @@ class DataContainer(object):
 
         :returns: True if there are no data series, False otherwise
         """
-        return len(self.__series.keys()) == 0
+        return len(self.__series) == 0
+
+
+def _freeze(value):
+    """
+    Converts a transform parameter into a hashable value
+    """
+    if isinstance(value, np.ndarray):
+        return value.shape, hashlib.md5(np.ascontiguousarray(value).tostring()).hexdigest()
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def transform_chain_key(transforms):
+    """
+    Calculates a key which identifies a chain of transforms and their parameters
+
+    :param transforms: a list of BaseDataTransform instances
+    :returns: a hashable key, the tuple of the cache keys of the transforms so that different chains never share
+        a key
+    """
+    return tuple(t.cache_key() for t in transforms)
 
 
 class BaseDataTransform(object):
     """
     A base class which must be inherited by DataTransform classes.
+
+    Transforms which set `incremental = True` implement `process`, which is passed only the values added to
+    a series since it was last called and keeps any state it needs (for instance a moving average window)
+    between calls.  The DataContainer then only runs new values through the transformation chain.  Other
+    transforms implement `apply`, which recalculates the whole container each time.
     """
 
+    incremental = False
+
     def apply(self, container):
         """
         Takes a DataContainer object and applies a transformation to the X and Y data in the
-        DataContainer.  This is a base class which should be inherited from.
+        DataContainer.  This is a base class which should be inherited from.  Incremental transforms
+        do not need to override this method, as by default it runs `process` over each whole series.
 
         .. warning::
-            If no `apply` method is provided on the derived class then a `NotImplementedError` will be thrown
+            If no `apply` or `process` method is provided on the derived class then a `NotImplementedError`
+            will be thrown
+
+        :raises: NotImplementedError
+        """
+        if not self.incremental:
+            raise NotImplementedError("BaseDataTransform.apply should be overridden by derived instances")
+
+        self.reset()
+        results = [self.process(key, x, y) for key, x, y in zip(
+            container.get_series_names(), container.x_transformed, container.y_transformed)]
+        container.x_transformed = [r[0] for r in results]
+        container.y_transformed = [r[1] for r in results]
 
+    def process(self, series_id, x, y):
+        """
+        Transforms the values which have been added to a series since the last call.  Derived classes
+        which set `incremental = True` must override this method.  The passed arrays must not be modified.
+
+        When several series share the same new x values, `y` is a 2-D array with one row for each series
+        and `series_id` is a list of the series IDs in row order.  Transforms should operate along the last
+        axis of `y` so that the same code handles both cases.
+
+        :param series_id: the ID of the series the values belong to, or a list of IDs
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row of new y values for each series
+        :returns: a tuple of transformed (x, y) arrays, where y has the same number of rows as the y passed in
+            and the same number of values as x
         :raises: NotImplementedError
         """
-        raise NotImplementedError("BaseDataTransform.apply should be overridden by derived instances")
+        raise NotImplementedError("BaseDataTransform.process should be overridden by incremental transforms")
+
+    def reset(self):
+        """
+        Clears any state held between calls to `process`
+        """
+        pass
+
+    def cache_key(self):
+        """
+        Gets a hashable key identifying the transform and its parameters, used to cache the results of
+        transform chains.  By default this is built from the class name and the public attributes of the
+        transform, so transforms with parameters stored elsewhere should override this method.
+
+        :returns: a hashable key
+        """
+        params = [(k, v) for k, v in vars(self).iteritems() if not k.startswith("_")]
+        return type(self).__module__, type(self).__name__, _freeze(dict(params))
@@ -0,0 +1,171 @@
+__author__ = 'Will Hart'
+
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from blitz.data.export import iter_wide_chunks
+
+
+class SessionArchive(object):
+    """
+    A completed logging session stored as columnar files in a directory rather than as rows in the database.
+    The session is held in wide format, with one row for each time a reading was logged:
+
+     - `time.i8` - the `timeLogged` of each row as raw int64 values
+     - `<category id>.f8` - the values of each variable as raw float64 values, NaN where there was no reading
+     - `manifest.json` - the session ID, the number of rows and readings and the category IDs
+
+    The arrays are memory mapped when they are read, so opening an archive is near instant whatever the size of
+    the session.  Values are stored as floats, so a session can only be archived if every value is a number.
+    Readings are returned with their values as strings, as they are from the database.
+
+    :param path: the directory of an archive written by `SessionArchive.write`
+    :raises: IOError if the directory does not hold a complete archive
+    """
+
+    MANIFEST = "manifest.json"
+    TIME_FILE = "time.i8"
+    VALUE_FILE = "%s.f8"
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, self.MANIFEST)) as f:
+            manifest = json.load(f)
+
+        self.session_id = manifest["session"]
+        self.rows = manifest["rows"]
+        self.readings = manifest["readings"]
+        self.categories = manifest["categories"]
+
+    @staticmethod
+    def exists(path):
+        """
+        Checks if a complete archive has been written to the given directory
+
+        :param path: the directory to check
+        :returns: True if the directory holds an archive
+        """
+        return os.path.isfile(os.path.join(path, SessionArchive.MANIFEST))
+
+    @property
+    def times(self):
+        """
+        :returns: a read only array of the `timeLogged` of each row
+        """
+        return self.__map(self.TIME_FILE, np.int64)
+
+    def values(self, category_id):
+        """
+        Gets the values of a variable for each row, with NaN where there was no reading
+
+        :param category_id: the ID of the category to get values for
+        :returns: a read only array of values
+        :raises: KeyError if the category is not in the archive
+        """
+        if category_id not in self.categories:
+            raise KeyError("Category %s is not in the archive of session %s" % (category_id, self.session_id))
+        return self.__map(self.VALUE_FILE % category_id, np.float64)
+
+    def series(self, category_id):
+        """
+        Gets the readings of a single variable
+
+        :param category_id: the ID of the category to get readings for
+        :returns: a tuple of (x, y) arrays holding `timeLogged` and the value of each reading
+        """
+        values = self.values(category_id)
+        mask = ~np.isnan(values)
+        return self.times[mask], values[mask]
+
+    def iter_readings(self, chunk_size=10000):
+        """
+        Iterates over the readings in the archive in time order, in chunks of about `chunk_size` readings
+
+        :param chunk_size: the approximate number of readings in each chunk (default 10000)
+        :returns: a generator of lists of (timeLogged, categoryId, value) rows, with values as strings
+        """
+        categories = np.array(self.categories, dtype=np.int64)
+        times = self.times
+        columns = [self.values(c) for c in self.categories]
+        step = max(1, chunk_size // max(1, len(categories)))
+
+        for start in xrange(0, self.rows, step):
+            table = np.column_stack([c[start:start + step] for c in columns])
+            rows, cols = np.nonzero(~np.isnan(table))
+            if len(rows):
+                yield zip(times[start:start + step][rows].tolist(), categories[cols].tolist(),
+                          [unicode(repr(v)) for v in table[rows, cols].tolist()])
+
+    def __map(self, name, dtype):
+        """
+        Memory maps one of the arrays in the archive
+        """
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=(self.rows,))
+
+    @classmethod
+    def write(cls, path, session_id, chunks, category_ids):
+        """
+        Writes an archive from chunks of readings.  The files are written to a temporary directory which is
+        renamed once the archive is complete, replacing any existing archive at `path`.
+
+        :param path: the directory to write the archive to
+        :param session_id: the ID of the session being archived
+        :param chunks: an iterable of lists of (timeLogged, categoryId, value) tuples, ordered by time
+        :param category_ids: the IDs of the categories in the session
+        :returns: the SessionArchive that was written
+        :raises: ValueError if a reading could not be archived, because its value is not a number or another
+            reading of the same variable was logged at the same time.  No archive is written.
+        """
+        category_ids = sorted(category_ids)
+        temp_path = path + ".tmp"
+
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+
+        files = [open(os.path.join(temp_path, cls.TIME_FILE), 'wb')] + [
+            open(os.path.join(temp_path, cls.VALUE_FILE % c), 'wb') for c in category_ids]
+        rows = 0
+        readings = 0
+        received = [0]
+
+        def count(chunks):
+            for chunk in chunks:
+                received[0] += len(chunk)
+                yield chunk
+
+        try:
+            for times, table in iter_wide_chunks(count(chunks), category_ids):
+                times.astype(np.int64).tofile(files[0])
+                for i, f in enumerate(files[1:]):
+                    np.ascontiguousarray(table[:, i]).tofile(f)
+
+                rows += len(times)
+                readings += int(np.count_nonzero(~np.isnan(table)))
+        finally:
+            for f in files:
+                f.close()
+
+        if readings != received[0]:
+            shutil.rmtree(temp_path)
+            raise ValueError("Only %s of the %s readings in session %s can be archived" % (
+                readings, received[0], session_id))
+
+        with open(os.path.join(temp_path, cls.MANIFEST), 'w') as f:
+            json.dump({"session": session_id, "rows": rows, "readings": readings, "categories": category_ids}, f)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(temp_path, path)
+
+        cls.logger.info("Archived %s readings from session %s to %s" % (readings, session_id, path))
+        return cls(path)
@@ -1,43 +1,299 @@
 __author__ = 'Will Hart'
 
+from contextlib import contextmanager
 import logging
+import os
+import Queue
+import shutil
+import threading
+import zlib
+
+import numpy as np
 import sqlalchemy as sql
-from sqlalchemy import func as sql_func
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event, func as sql_func
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 import redis
 
+from blitz.data.archive import SessionArchive
 from blitz.data.models import *
 from blitz.data.fixtures import *
 import blitz.communications.signals as sigs
-from blitz.utilities import blitz_timestamp
+from blitz.utilities import blitz_timestamp, monotonic_time
+
+
+class DatabaseFuture(object):
+    """
+    The result of a write which has been queued on a :class:`DatabaseWriter`
+    """
+
+    def __init__(self):
+        self.__event = threading.Event()
+        self.__result = None
+        self.__exception = None
+
+    def done(self):
+        """
+        :returns: True if the write has been committed or has failed
+        """
+        return self.__event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the write to finish
+
+        :param timeout: the number of seconds to wait (default None, wait forever)
+        :returns: the value returned by the write
+        :raises: the exception raised by the write if it failed, or RuntimeError if the timeout expired
+        """
+        if not self.__event.wait(timeout):
+            raise RuntimeError("Timed out waiting for a database write")
+        if self.__exception is not None:
+            raise self.__exception
+        return self.__result
+
+    def set_result(self, result):
+        self.__result = result
+        self.__event.set()
+
+    def set_exception(self, exception):
+        self.__exception = exception
+        self.__event.set()
+
+
+class DatabaseWriter(object):
+    """
+    Makes all of the writes to a database from a single thread.  Writes are functions which are passed an ORM
+    session, and are queued with `submit` from any thread.  The writer takes every write which is waiting in the
+    queue, up to `BATCH_SIZE` writes or for at most `BATCH_INTERVAL` seconds while writes keep arriving, and
+    commits them as one transaction, so a stream of small writes costs one commit rather than one each.  A batch
+    is committed as soon as the queue is empty, so a single write is not delayed.  Writes which are submitted by
+    another write run straight away in the same transaction.
+
+    If a batch fails it is rolled back and its writes are retried one at a time, so only the write which caused
+    the error fails.  Objects are not expired when a batch is committed, so objects which were added can be read
+    after the write finishes.
+
+    :param session_factory: a sessionmaker bound to the database to write to
+    """
+
+    BATCH_SIZE = 500
+    BATCH_INTERVAL = 0.05
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.__queue = Queue.Queue()
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__session = None
+
+    def submit(self, write, *args):
+        """
+        Queues a write
+
+        :param write: a function which is called as `write(session, *args)` on the writer thread
+        :returns: a DatabaseFuture which holds the value returned by `write` once it has been committed
+        """
+        future = DatabaseFuture()
+
+        if threading.current_thread() is self.__thread and self.__session is not None:
+            # writes queued by another write would wait forever for the writer, so run them in its transaction
+            try:
+                future.set_result(write(self.__session, *args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self.__start()
+        self.__queue.put((write, args, future))
+        return future
+
+    def flush(self):
+        """
+        Waits until all of the writes queued before this call have been committed
+        """
+        self.submit(lambda sess: None).result()
+
+    def stop(self):
+        """
+        Commits the queued writes and stops the writer thread
+        """
+        with self.__lock:
+            thread, self.__thread = self.__thread, None
+
+        if thread is not None:
+            self.__queue.put(None)
+            thread.join()
+
+    def run(self):
+        """
+        The writer thread, which gathers queued writes into batches and commits them
+        """
+        while True:
+            batch = [self.__queue.get()]
+            deadline = monotonic_time() + self.BATCH_INTERVAL
+
+            while batch[-1] is not None and len(batch) < self.BATCH_SIZE and monotonic_time() < deadline:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+
+            if batch:
+                self.__commit(batch)
+
+            if stopping:
+                return
+
+    def __commit(self, batch):
+        """
+        Runs a batch of writes in a single transaction
+        """
+        sess = self.__session = self.session_factory()
+
+        try:
+            results = [write(sess, *args) for write, args, _ in batch]
+            sess.commit()
+        except Exception as e:
+            sess.rollback()
+
+            if len(batch) == 1:
+                self.logger.error("Database write failed - %s" % e)
+                batch[0][2].set_exception(e)
+            else:
+                self.logger.warning("Retrying a batch of %s database writes one at a time - %s" % (len(batch), e))
+                for item in batch:
+                    self.__commit([item])
+            return
+        finally:
+            self.__session = None
+            sess.close()
+
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def __start(self):
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.run, name="DatabaseWriter")
+                self.__thread.daemon = True
+                self.__thread.start()
 
 
 class DatabaseClient(object):
     """
-    Provides database operations for the client using SqlAlchemy
+    Provides database operations for the client using SqlAlchemy.
+
+    Writes are made by a single :class:`DatabaseWriter` thread, which commits writes from the TCP, interface and
+    download threads in batches.  Reads use a small pool of read only connections.  Database files use write
+    ahead logging so reads don't block the writer.
+
+    Reads are made in a `session_scope`, which closes the session when the read is finished so that connections
+    go back to the pool and loaded objects aren't kept alive by an identity map.  Objects which are returned can
+    be used after their session is closed, but relationships which weren't loaded can't be read from them.
+
+    In memory databases share a single connection between threads with a StaticPool.  Database files use a
+    QueuePool of one connection for the writer and a QueuePool of `READ_CONNECTIONS` connections, with up to
+    `READ_OVERFLOW` more when the pool is busy, for readers.
+
+    If an `archive_path` is given, sessions are compacted into a :class:`blitz.data.archive.SessionArchive`
+    in that directory when they have been fully downloaded and their readings are removed from the database.
+    The session query methods read archived sessions transparently.
     """
 
+    READ_CONNECTIONS = 4
+    READ_OVERFLOW = 4
+    POOL_TIMEOUT = 30
+
     _database = None
     _baseClass = None
     logger = logging.getLogger(__name__)
 
-    def __init__(self, verbose=False, path=":memory:"):
+    def __init__(self, verbose=False, path=":memory:", archive_path=None):
         """
         Instantiates a connection and creates an in memory database by default.
 
         :param verbose: if True, SqlAlchemy will emit verbose debug messages (default False)
         :param path: the path to the database file (default ":memory:")
+        :param archive_path: the directory to archive completed sessions to (default None, sessions are not
+            archived)
         """
+        self.archive_path = archive_path
 
-        # allow loading from memory for testing
-        self._database = sql.create_engine('sqlite:///' + path, echo=verbose)
-        self._session = sessionmaker(bind=self._database)
+        if path == ":memory:":
+            # allow loading from memory for testing, sharing one connection so every thread sees the same data
+            self._database = sql.create_engine('sqlite://', echo=verbose, poolclass=StaticPool,
+                                               connect_args={'check_same_thread': False})
+            self._reader = self._database
+        else:
+            self._database = sql.create_engine('sqlite:///' + path, echo=verbose, poolclass=QueuePool,
+                                               pool_size=1, max_overflow=0, pool_timeout=self.POOL_TIMEOUT,
+                                               connect_args={'check_same_thread': False})
+            self._reader = sql.create_engine('sqlite:///' + path, echo=verbose, poolclass=QueuePool,
+                                             pool_size=self.READ_CONNECTIONS, max_overflow=self.READ_OVERFLOW,
+                                             pool_timeout=self.POOL_TIMEOUT,
+                                             connect_args={'check_same_thread': False})
+            event.listen(self._database, "connect", self.__configure_writer)
+            event.listen(self._reader, "connect", self.__configure_reader)
+
+        self._session = sessionmaker(bind=self._reader)
+        self._scoped_session = scoped_session(self._session)
+        self.__scope = threading.local()
+        self.writer = DatabaseWriter(sessionmaker(bind=self._database, expire_on_commit=False))
         self.logger.debug("DatabaseClient __init__")
         self.create_tables()
         self.logger.debug("DatabaseClient created tables")
 
         # connect up the session_list_update signal
         sigs.client_session_list_updated.connect(self.update_session_list)
+        sigs.session_download_finished.connect(self.archive_session)
+
+    @staticmethod
+    def __configure_writer(connection, record):
+        """
+        Uses write ahead logging so readers don't block the writer, and only syncs to disk at checkpoints
+        """
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+    @staticmethod
+    def __configure_reader(connection, record):
+        connection.execute("PRAGMA query_only=ON")
+
+    @contextmanager
+    def session_scope(self):
+        """
+        Provides the read session of the current thread for a unit of work.  Scopes can be nested, and the session
+        is closed when the outermost scope exits.
+
+        :returns: a context manager which yields an ORM session
+        """
+        depth = getattr(self.__scope, "depth", 0)
+        self.__scope.depth = depth + 1
+
+        try:
+            yield self._scoped_session()
+        finally:
+            self.__scope.depth = depth
+            if depth == 0:
+                self._scoped_session.remove()
+
+    def close(self):
+        """
+        Commits any queued writes, stops the writer thread and closes all of the connections
+
+        :returns: nothing
+        """
+        self.writer.stop()
+        self._scoped_session.remove()
+        self._reader.dispose()
+        self._database.dispose()
 
     def create_tables(self, force_drop=False):
         """
@@ -51,6 +307,12 @@ class DatabaseClient(object):
             SQL_BASE.metadata.drop_all(self._database)
         SQL_BASE.metadata.create_all(self._database)
 
+        # tables created by older versions don't have the indexes that have been added since
+        existing = set(i["name"] for i in sql.inspect(self._database).get_indexes(Reading.__tablename__))
+        for index in Reading.__table__.indexes:
+            if index.name not in existing:
+                index.create(self._database)
+
     def add(self, item):
         """
         Adds a single item to the database
@@ -61,18 +323,21 @@ class DatabaseClient(object):
         res = self.add_many([item])
         return res[0]
 
-    def add_many(self, items):
+    def add_many(self, items, wait=True):
         """
         Adds the given items to the database with the passed attributes
 
         :param items: A list of Model instances to be added
-        :returns: The list of items that was added (should now be populated with IDs)
+        :param wait: if False, return without waiting for the items to be written (default True)
+        :returns: The list of items that was added (should now be populated with IDs), or a DatabaseFuture
+            holding the list if `wait` is False
         """
-        sess = self._session()
-        for r in items:
-            sess.add(r)
-        sess.commit()
-        return items
+        def add(sess):
+            sess.add_all(items)
+            return items
+
+        future = self.writer.submit(add)
+        return future.result() if wait else future
 
     def get(self, model, query):
         """
@@ -82,7 +347,8 @@ class DatabaseClient(object):
         :param query: the dict of "field: value" pairs to filter on
         :return: A single model matching the query string
         """
-        return self.find(model, query).first()
+        with self.session_scope() as sess:
+            return sess.query(model).filter_by(**query).first()
 
     def get_by_id(self, model, model_id):
         """
@@ -97,9 +363,8 @@ class DatabaseClient(object):
         :param model: The model to return all records for
         :return: A list of all records for a given model
         """
-
-        sess = self._session()
-        return sess.query(model).all()
+        with self.session_scope() as sess:
+            return sess.query(model).all()
 
     def find(self, model, query):
         """
@@ -109,8 +374,8 @@ class DatabaseClient(object):
         :param query: the dictionary of "field: value" pairs to filter on
         :return: a list of all matching records
         """
-        sess = self._session()
-        return sess.query(model).filter_by(**query)
+        with self.session_scope() as sess:
+            return sess.query(model).filter_by(**query).all()
 
     def update_session_availability(self, session_id):
         """
@@ -119,14 +384,12 @@ class DatabaseClient(object):
         :param session_id: the ref_id of the session being checked
         :returns: nothing
         """
-        sess = self._session()
-        session = sess.query(Session).filter_by(**{'ref_id': session_id}).first()
-        count = sess.query(sql_func.count(Reading.sessionId))\
-            .filter(Reading.sessionId == session_id).scalar()
+        count = self.count_session_readings(session_id)
 
         # check all lines were received and set "available" accordingly
-        session.available = count > 0
-        sess.commit()
+        self.writer.submit(
+            lambda sess: sess.query(Session).filter_by(ref_id=session_id).update({"available": count > 0})
+        ).result()
 
     def get_session_variables(self, session_id):
         """
@@ -134,16 +397,17 @@ class DatabaseClient(object):
         :param session_id: the ref_id of the session to get variables for.
         :returns: a list of Reading objects
         """
-        res = set()
-        qry = self._session().query(Category, Reading). \
-            filter(Category.id == Reading.categoryId). \
-            filter(Reading.sessionId == session_id). \
-            order_by(Reading.id). \
-            all()
-        for c, r in qry:
-            res.add(c)
+        archive = self.get_session_archive(session_id)
 
-        return list(res)
+        with self.session_scope() as sess:
+            if archive is not None:
+                return sess.query(Category).filter(Category.id.in_(archive.categories)).all()
+
+            return sess.query(Category). \
+                filter(Category.id == Reading.categoryId). \
+                filter(Reading.sessionId == session_id). \
+                distinct(). \
+                all()
 
     def get_cache_variables(self):
         """
@@ -152,7 +416,8 @@ class DatabaseClient(object):
         :returns: a list of Cache objects
         """
         res = set()
-        qry = self._session().query(Category, Cache).filter(Category.id == Cache.categoryId).order_by(Cache.id).all()
+        with self.session_scope() as sess:
+            qry = sess.query(Category, Cache).filter(Category.id == Cache.categoryId).order_by(Cache.id).all()
         for c, r in qry:
             res.add(c)
         return list(res)
@@ -164,8 +429,227 @@ class DatabaseClient(object):
         :param session_id: the ref_id of the session to get variables for.
         :returns: a list of Reading objects for the session ID
         """
-        sess = self._session()
-        return sess.query(Reading).filter(Reading.sessionId == session_id).all()
+        archive = self.get_session_archive(session_id)
+        if archive is not None:
+            return [Reading(sessionId=session_id, timeLogged=t, categoryId=c, value=v)
+                    for chunk in archive.iter_readings() for t, c, v in chunk]
+
+        with self.session_scope() as sess:
+            return sess.query(Reading).filter(Reading.sessionId == session_id).order_by(Reading.id).all()
+
+    def get_session_series(self, session_id):
+        """
+        Gets the readings of a session as arrays, one pair for each variable.  Archived sessions are read from
+        memory mapped files without querying the readings table.
+
+        :param session_id: the ref_id of the session to get readings for
+        :returns: a dictionary of (x, y) tuples of numpy arrays of `timeLogged` and value, keyed by category ID
+        """
+        archive = self.get_session_archive(session_id)
+        if archive is not None:
+            return dict((c, archive.series(c)) for c in archive.categories)
+
+        series = {}
+        for chunk in self.iter_session_readings(session_id, by_time=True):
+            for time_logged, category_id, value in chunk:
+                x, y = series.setdefault(category_id, ([], []))
+                x.append(time_logged)
+                y.append(value)
+
+        return dict((k, (np.array(x, dtype=np.int64), np.array(y, dtype=np.float64)))
+                    for k, (x, y) in series.iteritems())
+
+    def get_session_time_range(self, session_id):
+        """
+        Gets the time of the first and last readings of a session
+
+        :param session_id: the ref_id of the session
+        :returns: a tuple of the first and last `timeLogged`, or (None, None) if the session has no readings
+        """
+        archive = self.get_session_archive(session_id)
+        if archive is not None:
+            times = archive.times
+            return (int(times[0]), int(times[-1])) if len(times) else (None, None)
+
+        table = Reading.__table__
+        query = sql.select([sql_func.min(table.c.timeLogged), sql_func.max(table.c.timeLogged)]). \
+            where(table.c.sessionId == session_id)
+
+        with self._reader.connect() as conn:
+            return tuple(conn.execute(query).first())
+
+    def get_session_window(self, session_id, category_ids=None, start=None, end=None, max_points=2000):
+        """
+        Gets the readings of a session in a time window, reduced to at most `max_points` for each variable.  The
+        window is split into buckets of equal time and the database works out the minimum, maximum and mean
+        value in each bucket, so only the reduced points are loaded however long the session is.  Buckets with no
+        readings are left out, and if the window is shorter than `max_points` each bucket holds one timestamp.
+        Archived sessions are reduced from their memory mapped files.
+
+        :param session_id: the ref_id of the session to get readings for
+        :param category_ids: a list of the IDs of the categories to get (default None, every category)
+        :param start: the first `timeLogged` in the window (default None, the start of the session)
+        :param end: the last `timeLogged` in the window (default None, the end of the session)
+        :param max_points: the maximum number of buckets for each variable (default 2000)
+        :returns: a dictionary of (x, y_min, y_max, y_mean) tuples of numpy arrays keyed by category ID, where x
+            is the `timeLogged` of the first reading in each bucket
+        """
+        if start is None or end is None:
+            first, last = self.get_session_time_range(session_id)
+            if first is None:
+                return {}
+            start = first if start is None else start
+            end = last if end is None else end
+
+        if end < start or (category_ids is not None and len(category_ids) == 0):
+            return {}
+
+        # round the bucket width up so the window fits in max_points buckets
+        width = max(1, (end - start + max_points) // max_points)
+
+        archive = self.get_session_archive(session_id)
+        if archive is not None:
+            times = archive.times
+            lo, hi = np.searchsorted(times, [start, end + 1])
+            result = {}
+
+            for category_id in archive.categories if category_ids is None else category_ids:
+                if category_id not in archive.categories:
+                    continue
+
+                values = archive.values(category_id)[lo:hi]
+                mask = ~np.isnan(values)
+                if mask.any():
+                    result[category_id] = self.__reduce_buckets(times[lo:hi][mask], values[mask], start, width)
+
+            return result
+
+        table = Reading.__table__
+        value = sql.cast(table.c.value, sql.Float)
+        bucket = (table.c.timeLogged - start) / width
+        query = sql.select([table.c.categoryId, sql_func.min(table.c.timeLogged), sql_func.min(value),
+                            sql_func.max(value), sql_func.avg(value)]). \
+            where(table.c.sessionId == session_id). \
+            where(table.c.timeLogged >= start). \
+            where(table.c.timeLogged <= end)
+
+        if category_ids is not None:
+            query = query.where(table.c.categoryId.in_(category_ids))
+
+        query = query.group_by(table.c.categoryId, bucket).order_by(table.c.categoryId, bucket)
+
+        with self._reader.connect() as conn:
+            rows = conn.execute(query).fetchall()
+
+        if not rows:
+            return {}
+
+        data = np.array(rows, dtype=np.float64)
+        boundaries = np.flatnonzero(np.diff(data[:, 0])) + 1
+
+        return dict((int(chunk[0, 0]), (chunk[:, 1].astype(np.int64), chunk[:, 2], chunk[:, 3], chunk[:, 4]))
+                    for chunk in np.split(data, boundaries))
+
+    @staticmethod
+    def __reduce_buckets(times, values, start, width):
+        """
+        Reduces a series to the first time and the minimum, maximum and mean value of each bucket of time
+        """
+        buckets = (times - start) // width
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        counts = np.diff(np.concatenate((starts, [len(values)])))
+
+        return (times[starts].astype(np.int64), np.minimum.reduceat(values, starts),
+                np.maximum.reduceat(values, starts), np.add.reduceat(values, starts) / counts)
+
+    def count_session_readings(self, session_id):
+        """
+        Counts the readings for a particular session
+
+        :param session_id: the ref_id of the session to count readings for
+        :returns: the number of readings
+        """
+        archive = self.get_session_archive(session_id)
+        if archive is not None:
+            return archive.readings
+
+        with self.session_scope() as sess:
+            return sess.query(sql_func.count(Reading.id)).filter(Reading.sessionId == session_id).scalar()
+
+    def iter_session_readings(self, session_id, chunk_size=10000, by_time=False):
+        """
+        Iterates over the readings for a particular session in chunks, without loading the whole session or
+        creating Reading objects.  The query bypasses the ORM and rows are streamed from the database cursor
+        `chunk_size` at a time.
+
+        :param session_id: the ref_id of the session to get readings for
+        :param chunk_size: the number of readings in each chunk (default 10000)
+        :param by_time: if True the readings are ordered by the time they were logged rather than the order they
+            were saved (default False)
+        :returns: a generator of lists of (timeLogged, categoryId, value) rows
+        """
+        archive = self.get_session_archive(session_id)
+        if archive is not None:
+            for chunk in archive.iter_readings(chunk_size):
+                yield chunk
+            return
+
+        table = Reading.__table__
+        order = [table.c.timeLogged, table.c.id] if by_time else [table.c.id]
+        query = sql.select([table.c.timeLogged, table.c.categoryId, table.c.value]). \
+            where(table.c.sessionId == session_id). \
+            order_by(*order)
+
+        with self._reader.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+
+            while True:
+                chunk = result.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def get_session_archive(self, session_id):
+        """
+        Gets the archive of a session, if it has been archived
+
+        :param session_id: the ref_id of the session
+        :returns: a SessionArchive or None if the session has not been archived
+        """
+        if self.archive_path is None:
+            return None
+
+        path = os.path.join(self.archive_path, "session_%s" % session_id)
+        return SessionArchive(path) if SessionArchive.exists(path) else None
+
+    def archive_session(self, session_id):
+        """
+        Compacts the readings of a fully downloaded session into a SessionArchive and removes them from the
+        database.  Does nothing if no `archive_path` was given or the session has no readings in the database.
+        Sessions with readings which can't be archived, such as values which are not numbers, are left in the
+        database.
+
+        :param session_id: the ref_id of the session to archive
+        :returns: the SessionArchive that was written, or None if the session was not archived
+        """
+        if self.archive_path is None:
+            return None
+
+        with self.session_scope() as sess:
+            if not sess.query(sql.exists().where(Reading.sessionId == session_id)).scalar():
+                return None
+
+        category_ids = [c.id for c in self.get_session_variables(session_id)]
+        try:
+            archive = SessionArchive.write(os.path.join(self.archive_path, "session_%s" % session_id), session_id,
+                                           self.iter_session_readings(session_id, by_time=True), category_ids)
+        except ValueError as e:
+            self.logger.warning("Session %s was not archived - %s" % (session_id, e))
+            return None
+
+        self.writer.submit(
+            lambda sess: sess.query(Reading).filter(Reading.sessionId == session_id).delete()).result()
+        return archive
 
     def get_cache(self, since=0):
         """
@@ -179,20 +663,20 @@ class DatabaseClient(object):
         """
 
         res = []
-        sess = self._session()
 
-        # get the categories in the cache
-        cache_vars = sess.query(Cache).group_by(Cache.categoryId).all()
+        with self.session_scope() as sess:
+            # get the categories in the cache
+            cache_vars = sess.query(Cache).group_by(Cache.categoryId).all()
 
-        # loop and build the variables
-        for v in cache_vars:
-            if since > 0:
-                qry = sess.query(Cache).filter(Cache.categoryId == v.categoryId).filter(
-                    Cache.timeLogged >= since).order_by(Cache.timeLogged.desc())
-            else:
-                qry = sess.query(Cache).filter(Cache.categoryId == v.categoryId).order_by(Cache.timeLogged.desc())
+            # loop and build the variables
+            for v in cache_vars:
+                if since > 0:
+                    qry = sess.query(Cache).filter(Cache.categoryId == v.categoryId).filter(
+                        Cache.timeLogged >= since).order_by(Cache.timeLogged.desc())
+                else:
+                    qry = sess.query(Cache).filter(Cache.categoryId == v.categoryId).order_by(Cache.timeLogged.desc())
 
-            res += qry[:50]
+                res += qry[:50]
 
         return res
 
@@ -206,15 +690,12 @@ class DatabaseClient(object):
         """
         self.logger.debug("Updating session list")
 
-        sess = self._session()
-        sess.query(Session).delete()
-        sess.commit()
-
         sessions = []
 
         for session in sessions_list:
-
-            count = self._session().query(sql.exists().where(Reading.sessionId == session[0])).scalar()
+            with self.session_scope() as sess:
+                count = sess.query(sql.exists().where(Reading.sessionId == session[0])).scalar() or \
+                    self.get_session_archive(session[0]) is not None
             blitz_session = Session()
             blitz_session.ref_id = session[0]
             blitz_session.timeStarted = session[1]
@@ -223,7 +704,11 @@ class DatabaseClient(object):
             blitz_session.available = count > 0
             sessions.append(blitz_session)
 
-        self.add_many(sessions)
+        def replace_sessions(sess):
+            sess.query(Session).delete()
+            sess.add_all(sessions)
+
+        self.writer.submit(replace_sessions).result()
 
     def load_fixtures(self, testing=False):
         """
@@ -233,13 +718,15 @@ class DatabaseClient(object):
         :returns: nothing
         """
         for config in CONFIG_FIXTURES:
-            self.set_config(config['key'], config['value'], False)
+            self.set_config(config['key'], config['value'], False, wait=False)
 
         if testing:
-            self.add_many(generate_objects(Category, CATEGORY_FIXTURES))
-            self.add_many(generate_objects(Cache, CACHE_FIXTURES))
-            self.add_many(generate_objects(Reading, READING_FIXTURES))
-            self.add_many(generate_objects(Session, SESSION_FIXTURES))
+            self.add_many(generate_objects(Category, CATEGORY_FIXTURES), wait=False)
+            self.add_many(generate_objects(Cache, CACHE_FIXTURES), wait=False)
+            self.add_many(generate_objects(Reading, READING_FIXTURES), wait=False)
+            self.add_many(generate_objects(Session, SESSION_FIXTURES), wait=False)
+
+        self.writer.flush()
 
     def get_config(self, key):
         """
@@ -250,21 +737,26 @@ class DatabaseClient(object):
         """
         return self.get(Config, {"key": key})
 
-    def set_config(self, key, value, do_update=True):
+    def set_config(self, key, value, do_update=True, wait=True):
         """
         Sets a config value in the database, adding or updating as required
 
         :param key: the config key to set
         :param value: the config value to set for the given key
+        :param do_update: if False an existing value is not changed (default True)
+        :param wait: if False, return without waiting for the value to be written (default True)
         :returns: nothing
         """
-        config = self.get_config(key)
+        def set_value(sess):
+            config = sess.query(Config).filter_by(key=key).first()
+            if config is None:
+                sess.add(Config(key=key, value=value))
+            elif do_update:
+                config.value = value
 
-        if config is None:
-            self.add(Config(key=key, value=value))
-        elif do_update:
-            config.value = value
-            self._session().commit()
+        future = self.writer.submit(set_value)
+        if wait:
+            future.result()
 
     def get_or_create_category(self, key):
         """
@@ -277,10 +769,17 @@ class DatabaseClient(object):
         category = self.get(Category, {"variableName": key})
         if category:
             return category.id
-        else:
-            new_category = Category(variableName=key)
-            self.add(new_category)
-        return new_category.id
+
+        def create(sess):
+            # another thread may have created the category since it was looked up
+            category = sess.query(Category).filter_by(variableName=key).first()
+            if category is None:
+                category = Category(variableName=key)
+                sess.add(category)
+                sess.flush()
+            return category.id
+
+        return self.writer.submit(create).result()
 
     def log_error(self, description, severity=1):
         """
@@ -305,9 +804,7 @@ class DatabaseClient(object):
 
         :returns: nothing
         """
-        sess = self._session()
-        sess.query(Notification).delete()
-        sess.commit()
+        self.writer.submit(lambda sess: sess.query(Notification).delete()).result()
 
     def handle_error(self, err_id):
         """
@@ -315,9 +812,7 @@ class DatabaseClient(object):
 
         :returns: nothing
         """
-        sess = self._session()
-        sess.query(Notification).filter(Notification.id == err_id).delete()
-        sess.commit()
+        self.writer.submit(lambda sess: sess.query(Notification).filter(Notification.id == err_id).delete()).result()
 
     def add_reading(self, session_id, time_logged, category_id, value):
         """
@@ -338,6 +833,27 @@ class DatabaseClient(object):
         self.add(reading)
         return reading
 
+    def add_session_columns(self, session_id, columns, wait=True):
+        """
+        Adds columns of readings to a session in a single transaction, without creating Reading objects
+
+        :param session_id: the ID of the session to add the readings to
+        :param columns: a dictionary of (times_logged, values) sequence tuples keyed by category ID
+        :param wait: if False, return without waiting for the readings to be written (default True)
+        :returns: nothing
+        """
+        rows = []
+        for category_id, (times_logged, values) in columns.iteritems():
+            rows += [{"sessionId": session_id, "timeLogged": t, "categoryId": category_id, "value": v}
+                     for t, v in zip(np.asarray(times_logged).tolist(), np.asarray(values).tolist())]
+
+        if not rows:
+            return
+
+        future = self.writer.submit(lambda sess: sess.execute(Reading.__table__.insert(), rows))
+        if wait:
+            future.result()
+
     def add_cache(self, time_logged, category_id, value):
         """
         Quick helper to add a cache record to the database
@@ -361,9 +877,7 @@ class DatabaseClient(object):
 
         :returns: the Reading that was generated
         """
-        sess = self._session()
-        sess.query(Cache).delete()
-        sess.commit()
+        self.writer.submit(lambda sess: sess.query(Cache).delete()).result()
 
     def clear_session_data(self, session_id):
         """
@@ -372,14 +886,75 @@ class DatabaseClient(object):
         :param session_id: the id of the session to clear data for
         :returns: the Reading that was generated
         """
-        sess = self._session()
-        sess.query(Reading).filter(Reading.sessionId == session_id).delete()
-        sess.commit()
+        self.writer.submit(
+            lambda sess: sess.query(Reading).filter(Reading.sessionId == session_id).delete()).result()
+
+        # remove the manifest first so the archive is gone even if mapped files can't be deleted yet
+        archive = self.get_session_archive(session_id)
+        if archive is not None:
+            os.remove(os.path.join(archive.path, SessionArchive.MANIFEST))
+            shutil.rmtree(archive.path, ignore_errors=True)
 
         # now update the session availability to reflect the cleared data
         self.update_session_availability(session_id)
 
 
+def compress_lines(lines, level=6):
+    """
+    Compresses a list of raw messages into a single zlib compressed string
+
+    :param lines: the list of messages to compress, which must not contain new lines
+    :param level: the zlib compression level (default 6)
+    :returns: the compressed string
+    """
+    return zlib.compress("\n".join(lines), level)
+
+
+def decompress_lines(data):
+    """
+    Decompresses a string created by `compress_lines`
+
+    :param data: the compressed string
+    :returns: the list of messages
+    """
+    return zlib.decompress(data).split("\n")
+
+
+class CompressedSessionChunks(object):
+    """
+    A read only sequence of the chunks of a compacted session, where each chunk is a list of raw messages.  Chunks
+    are read from redis and decompressed only when they are accessed, so a download holds one chunk in memory at
+    a time rather than the whole session.
+
+    :param data: the redis connection
+    :param key: the key of the redis list of compressed chunks
+    """
+
+    def __init__(self, data, key):
+        self.__data = data
+        self.key = key
+        self.__length = data.llen(key)
+
+    def __len__(self):
+        return self.__length
+
+    def __getitem__(self, index):
+        return decompress_lines(self.compressed(index))
+
+    def compressed(self, index):
+        """
+        Gets a chunk without decompressing it
+
+        :param index: the index of the chunk
+        :returns: the zlib compressed string of the messages in the chunk, separated by new lines
+        """
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError("Chunk index %s out of range" % index)
+        return self.__data.lindex(self.key, index)
+
+
 class DatabaseServer(object):
     """
     The redis database server - retains several documents:
@@ -389,11 +964,22 @@ class DatabaseServer(object):
     - **session_N_end**  the timestamp when logging session N ended
     - **sessions**  a list of session in the database
     - **session_N**  a queue of raw session data for session_id N
+    - **session_N_chunks**  the raw session data for session_id N once it has been compacted, as a list of zlib
+      compressed chunks of `CHUNK_LINES` messages, oldest first
+    - **session_N_count**  the number of messages in session N once it has been compacted
+
+    When a session is stopped it is compacted on a background thread, which replaces the `session_N` queue with
+    `session_N_chunks` so that completed sessions take much less of the memory redis holds.
     """
 
     __data = redis.StrictRedis()
+    __compact_lock = threading.Lock()
     session_id = -1
 
+    CHUNK_LINES = 100
+    COMPACT_BATCH_LINES = 10000
+    COMPRESSION_LEVEL = 6
+
     logger = logging.getLogger(__name__)
 
     def __init__(self):
@@ -426,6 +1012,79 @@ class DatabaseServer(object):
         self.__data.set("session_" + str(self.session_id) + "_end", blitz_timestamp())
         self.session_id = -1
         self.__last_session_length = -1
+        self.compact_in_background()
+
+    def compact_in_background(self):
+        """
+        Compacts all stopped sessions on a background thread
+
+        :returns: the thread the compaction runs on
+        """
+        thread = threading.Thread(target=self.compact_stopped_sessions, name="DatabaseServerCompaction")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def compact_stopped_sessions(self):
+        """
+        Compacts every session which has stopped but has not yet been compacted, including any left over if the
+        server stopped before compaction finished
+
+        :returns: the number of sessions that were compacted
+        """
+        compacted = 0
+
+        with self.__compact_lock:
+            for session_id in self.available_sessions():
+                session_str = "session_%s" % session_id
+                if self.__data.exists(session_str + "_end") and self.__data.exists(session_str):
+                    try:
+                        self.compact_session(session_id)
+                        compacted += 1
+                    except redis.RedisError as e:
+                        self.logger.error("Failed to compact session %s - %s" % (session_id, e))
+
+        return compacted
+
+    def compact_session(self, session_id):
+        """
+        Compresses the raw messages of a stopped session into chunks of `CHUNK_LINES` messages and frees the
+        session queue.  The chunks are built under a temporary key and swapped in with a single transaction, so
+        the session can be downloaded while it is being compacted.
+
+        :param session_id: the ID of the session to compact
+        :returns: the number of chunks that were written
+        """
+        session_str = "session_%s" % session_id
+        temp_str = session_str + "_chunks_tmp"
+        length = self.__data.llen(session_str)
+
+        if length == 0:
+            return 0
+
+        self.__data.delete(temp_str)
+        chunks = 0
+
+        # messages are pushed on the left so the oldest are at the end of the list
+        for start in xrange(0, length, self.COMPACT_BATCH_LINES):
+            lines = self.__data.lrange(
+                session_str, max(0, length - start - self.COMPACT_BATCH_LINES), length - start - 1)
+            lines.reverse()
+
+            pipe = self.__data.pipeline(transaction=False)
+            for i in xrange(0, len(lines), self.CHUNK_LINES):
+                pipe.rpush(temp_str, compress_lines(lines[i:i + self.CHUNK_LINES], self.COMPRESSION_LEVEL))
+                chunks += 1
+            pipe.execute()
+
+        pipe = self.__data.pipeline()
+        pipe.rename(temp_str, session_str + "_chunks")
+        pipe.set(session_str + "_count", length)
+        pipe.delete(session_str)
+        pipe.execute()
+
+        self.logger.info("Compacted %s messages from session %s into %s chunks" % (length, session_id, chunks))
+        return chunks
 
     def __get_session_id(self):
         sess_id = self.__data.get("session_id")
@@ -458,6 +1117,22 @@ class DatabaseServer(object):
         self.__data.lpush(session_str, message)
         return message
 
+    def queue_many(self, messages):
+        """
+        Queues a list of messages against the current session in a single database operation.
+        If no session is being run then it logs a warning and does nothing
+
+        :param messages: the list of messages to push onto the session data, in the order they were received
+        :returns: the list of messages that were queued
+        """
+        if self.session_id == -1:
+            self.logger.warning("Attempted to save %s logged variables with no session running" % len(messages))
+            return []
+
+        if messages:
+            self.__data.lpush("session_%s" % self.session_id, *messages)
+        return messages
+
     def get_all_from_session(self, session_id):
         """
         Gets all messages logged during the given session ID
@@ -466,10 +1141,41 @@ class DatabaseServer(object):
         :returns: the readings from the session
         """
         session_str = "session_" + str(session_id)
+
+        if self.__data.exists(session_str + "_chunks"):
+            return [line for chunk in CompressedSessionChunks(self.__data, session_str + "_chunks") for line in chunk]
+
         result = self.__data.lrange(session_str, 0, -1)
         result.reverse()
         return result
 
+    def get_session_chunks(self, session_id):
+        """
+        Gets the messages logged during the given session ID in chunks of `CHUNK_LINES` messages for downloading.
+        The chunks of a compacted session are decompressed as they are accessed.
+
+        :param session_id: the ID of the session to return information for
+        :returns: a sequence of lists of messages, oldest first
+        """
+        session_str = "session_" + str(session_id)
+
+        if self.__data.exists(session_str + "_chunks"):
+            return CompressedSessionChunks(self.__data, session_str + "_chunks")
+
+        session_data = self.get_all_from_session(session_id)
+        return [session_data[i:i + self.CHUNK_LINES] for i in range(0, len(session_data), self.CHUNK_LINES)]
+
+    def count_session_messages(self, session_id):
+        """
+        Counts the messages logged during the given session ID
+
+        :param session_id: the ID of the session to count messages for
+        :returns: the number of messages
+        """
+        session_str = "session_" + str(session_id)
+        count = self.__data.get(session_str + "_count")
+        return int(count) if count is not None else self.__data.llen(session_str)
+
     def get_latest_from_session(self, session_id):
         """
         Gets the most recent logged variable from the database and returns it as
@@ -507,6 +1213,8 @@ class DatabaseServer(object):
         self.__data.delete(session_str + "_start")
         self.__data.delete(session_str + "_end")
         self.__data.delete(session_str)
+        self.__data.delete(session_str + "_chunks")
+        self.__data.delete(session_str + "_count")
 
     def available_sessions(self):
         """
@@ -544,7 +1252,7 @@ class DatabaseServer(object):
         for session in sessions:
             session_start = self.__data.get("session_" + str(session) + "_start")
             session_end = self.__data.get("session_" + str(session) + "_end")
-            session_count = self.__data.llen("session_" + str(session))
+            session_count = self.count_session_messages(session)
             result.append("%s %s %s %s" % (session, session_start, session_end, session_count))
 
         return result
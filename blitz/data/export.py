@@ -0,0 +1,386 @@
+__author__ = 'Will Hart'
+
+import io
+from itertools import izip
+import logging
+import os
+import threading
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+from blitz.data.models import Session
+from blitz.utilities import blitz_strftimestamp
+
+
+class BaseSessionExporter(object):
+    """
+    A base class for exporting the readings of a session to a file, either on the calling thread with
+    `export` or on a background thread with `start`.  Derived classes must implement `export`.
+
+    :param database: the DatabaseClient to read the session from
+    :param session_id: the ID of the session to export
+    :param path: the path of the file to write
+    :param progress: a function called after each chunk with the number of readings written and the total
+    :param finished: a function called when the export has finished with the number of readings written, or
+        None if the export failed
+    """
+
+    CHUNK_SIZE = 20000
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, database, session_id, path, progress=None, finished=None):
+        self.database = database
+        self.session_id = session_id
+        self.path = path
+        self.__progress = progress
+        self.__finished = finished
+        self.__thread = None
+
+    def start(self):
+        """
+        Starts the export on a background thread
+        """
+        self.__thread = threading.Thread(target=self.run, name=self.__class__.__name__)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def join(self, timeout=None):
+        """
+        Waits for a background export to finish
+
+        :param timeout: the maximum number of seconds to wait (default None, wait forever)
+        """
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def run(self):
+        """
+        Runs the export, logging rather than raising any errors, and calls the finished callback
+        """
+        written = None
+        try:
+            written = self.export()
+        except Exception as e:
+            self.logger.error("Failed to export session %s to %s - %s" % (self.session_id, self.path, e))
+        finally:
+            if self.__finished is not None:
+                self.__finished(written)
+
+    def export(self):
+        """
+        Exports the session on the calling thread.  Must be overridden by derived classes.
+
+        :returns: the number of readings written
+        :raises: NotImplementedError
+        """
+        raise NotImplementedError("BaseSessionExporter.export should be overridden by derived instances")
+
+    def report_progress(self, written, total):
+        """
+        Passes export progress to the progress callback, if one was given
+        """
+        if self.__progress is not None:
+            self.__progress(written, total)
+
+    def get_session_details(self):
+        """
+        Gets the start time, variable names and number of readings of the session being exported
+
+        :returns: a tuple of (time_started, names, total) where names is a dictionary of variable names
+            keyed by category ID
+        """
+        session = self.database.get(Session, {"id": self.session_id})
+        time_started = session.timeStarted if session is not None else 0
+        names = dict((c.id, c.variableName) for c in self.database.get_session_variables(self.session_id))
+        return time_started, names, self.database.count_session_readings(self.session_id)
+
+
+class SessionCsvExporter(BaseSessionExporter):
+    """
+    Exports the readings of a session to a long format CSV file, with one row for each reading.  Readings are
+    streamed from the database in chunks and each chunk is formatted in one pass, with timestamps converted
+    with numpy and formatted once per second of logging rather than once per row.  The file is written through
+    a large buffer, so memory use does not depend on the size of the session.
+    """
+
+    HEADER = "Time Logged,Elapsed Seconds, Variable Name,Value\n"
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, database, session_id, path, progress=None, finished=None):
+        super(SessionCsvExporter, self).__init__(database, session_id, path, progress, finished)
+        self.__timestamps = {}
+
+    def export(self):
+        """
+        Exports the session on the calling thread
+
+        :returns: the number of readings written
+        """
+        time_started, names, total = self.get_session_details()
+        written = 0
+
+        with io.open(self.path, 'wb', buffering=self.BUFFER_SIZE) as f:
+            f.write(self.HEADER)
+
+            for chunk in self.database.iter_session_readings(self.session_id, self.CHUNK_SIZE):
+                f.write(self.format_chunk(chunk, time_started, names))
+                written += len(chunk)
+                self.report_progress(written, total)
+
+        self.logger.info("Exported %s readings from session %s to %s" % (written, self.session_id, self.path))
+        return written
+
+    def format_chunk(self, rows, time_started, names):
+        """
+        Formats a chunk of readings as CSV lines
+
+        :param rows: a list of (timeLogged, categoryId, value) tuples
+        :param time_started: the blitz timestamp the session started at
+        :param names: a dictionary of variable names keyed by category ID
+        :returns: a UTF-8 encoded string of CSV lines
+        """
+        logged = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        seconds, positions = np.unique((time_started + logged) // 1000, return_inverse=True)
+        stamps = [self.__timestamp(s) for s in seconds.tolist()]
+        elapsed = (logged / 1000.0).tolist()
+
+        text = "".join([
+            "%s,%s,%s,%s\n" % (stamps[p], e, names[r[1]], r[2]) for p, e, r in izip(positions.tolist(), elapsed, rows)
+        ])
+
+        return text.encode('utf-8') if isinstance(text, unicode) else text
+
+    def __timestamp(self, second):
+        """
+        Formats a timestamp to the second, caching the result
+        """
+        try:
+            return self.__timestamps[second]
+        except KeyError:
+            stamp = self.__timestamps[second] = blitz_strftimestamp(second * 1000)
+            return stamp
+
+
+class _NpzWriter(object):
+    """
+    Collects the columns of a wide format export and writes them to a compressed NumPy archive on close
+    """
+
+    def __init__(self, path, names):
+        self.path = path
+        self.names = names
+        self.chunks = []
+
+    def write(self, timestamps, elapsed, table):
+        self.chunks.append((timestamps, elapsed, table))
+
+    def close(self):
+        timestamps, elapsed, table = [np.concatenate(c) for c in zip(*self.chunks)] if self.chunks else \
+            (np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, len(self.names))))
+
+        columns = dict(("channel_%s" % i, table[:, i]) for i in xrange(len(self.names)))
+        with open(self.path, 'wb') as f:
+            np.savez_compressed(f, timestamp=timestamps, elapsed=elapsed,
+                                channels=np.array(self.names, dtype=np.unicode_), **columns)
+
+
+class _Hdf5Writer(object):
+    """
+    Appends the columns of a wide format export to resizable, gzip compressed HDF5 datasets
+    """
+
+    def __init__(self, path, names):
+        self.file = h5py.File(path, 'w')
+        self.count = 0
+        self.timestamps = self.__dataset("timestamp", np.int64)
+        self.elapsed = self.__dataset("elapsed", np.float64)
+        self.values = self.file.create_dataset(
+            "values", shape=(0, len(names)), maxshape=(None, len(names)), dtype=np.float64,
+            chunks=(4096, max(len(names), 1)), compression="gzip", shuffle=True)
+        self.values.attrs["channels"] = [n.encode('utf-8') for n in names]
+
+    def __dataset(self, name, dtype):
+        return self.file.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(65536,),
+                                        compression="gzip", shuffle=True)
+
+    def write(self, timestamps, elapsed, table):
+        start, self.count = self.count, self.count + len(timestamps)
+        for dataset, values in ((self.timestamps, timestamps), (self.elapsed, elapsed), (self.values, table)):
+            dataset.resize(self.count, axis=0)
+            dataset[start:self.count] = values
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter(object):
+    """
+    Writes each chunk of a wide format export as a compressed Parquet row group
+    """
+
+    def __init__(self, path, names):
+        self.names = names
+        self.writer = None
+        self.path = path
+
+    def write(self, timestamps, elapsed, table):
+        arrays = [pyarrow.array(timestamps), pyarrow.array(elapsed)] + [
+            pyarrow.array(table[:, i]) for i in xrange(len(self.names))]
+        batch = pyarrow.Table.from_arrays(arrays, ["timestamp", "elapsed"] + list(self.names))
+
+        if self.writer is None:
+            self.writer = parquet.ParquetWriter(self.path, batch.schema, compression="snappy")
+        self.writer.write_table(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class SessionWideExporter(BaseSessionExporter):
+    """
+    Exports a session in wide format, with one row for each time a reading was logged and one column of
+    floating point values for each variable (missing readings are NaN), to a columnar file format.  Readings
+    are streamed from the database and pivoted a chunk at a time.  The format is chosen from the file extension
+    if it isn't given:
+
+     - `npz`: a compressed NumPy archive holding `timestamp`, `elapsed`, `channels` (the variable names) and a
+       `channel_N` array for each variable.  The whole table is held in memory until it is written.
+     - `h5`: an HDF5 file (requires h5py) holding gzip compressed `timestamp`, `elapsed` and `values` datasets,
+       with the variable names in the `channels` attribute of `values`
+     - `parquet`: a Parquet file (requires pyarrow) with `timestamp`, `elapsed` and one column per variable
+
+    Readings are read from the database in time order and pivoted with `iter_wide_chunks`.
+
+    :param format: one of `npz`, `h5` or `parquet` (default None, chosen from the file extension)
+    :raises: ValueError if the format is not known, ImportError if the library for the format is not installed
+    """
+
+    WRITERS = {
+        'npz': (_NpzWriter, True),
+        'h5': (_Hdf5Writer, h5py is not None),
+        'hdf5': (_Hdf5Writer, h5py is not None),
+        'parquet': (_ParquetWriter, pyarrow is not None),
+    }
+
+    def __init__(self, database, session_id, path, progress=None, finished=None, format=None):
+        super(SessionWideExporter, self).__init__(database, session_id, path, progress, finished)
+        self.format = (format or os.path.splitext(path)[1][1:]).lower()
+
+        try:
+            self.__writer_class, available = self.WRITERS[self.format]
+        except KeyError:
+            raise ValueError("Unknown export format '%s', expected one of %s" % (
+                self.format, ", ".join(sorted(self.WRITERS.keys()))))
+
+        if not available:
+            raise ImportError("Exporting to '%s' requires a package which is not installed" % self.format)
+
+    def export(self):
+        """
+        Exports the session on the calling thread
+
+        :returns: the number of readings written
+        """
+        time_started, names, total = self.get_session_details()
+        category_ids = sorted(names.keys())
+        writer = self.__writer_class(self.path, [names[k] for k in category_ids])
+        self.__written = 0
+
+        try:
+            chunks = self.__count(self.database.iter_session_readings(self.session_id, self.CHUNK_SIZE, by_time=True),
+                                  total)
+            for times, table in iter_wide_chunks(chunks, category_ids):
+                writer.write(times + time_started, times / 1000.0, table)
+        finally:
+            writer.close()
+
+        self.logger.info("Exported %s readings from session %s to %s" % (
+            self.__written, self.session_id, self.path))
+        return self.__written
+
+    def __count(self, chunks, total):
+        """
+        Counts the readings in each chunk as it is read and reports progress
+        """
+        for chunk in chunks:
+            yield chunk
+            self.__written += len(chunk)
+            self.report_progress(self.__written, total)
+
+
+def pivot_readings(rows, category_ids):
+    """
+    Pivots a chunk of readings into a table with one row for each time and one column for each variable.  Values
+    which aren't numbers and missing readings are NaN.
+
+    :param rows: a list of (timeLogged, categoryId, value) tuples
+    :param category_ids: a sorted list of the category IDs, one for each column
+    :returns: a tuple of (times, table) arrays
+    """
+    category_ids = np.asarray(category_ids, dtype=np.int64)
+    logged = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    columns = np.searchsorted(category_ids, np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows)))
+
+    try:
+        values = np.array([r[2] for r in rows], dtype=np.float64)
+    except ValueError:
+        values = np.array([_to_float(r[2]) for r in rows], dtype=np.float64)
+
+    times, positions = np.unique(logged, return_inverse=True)
+    table = np.empty((len(times), len(category_ids)))
+    table.fill(np.nan)
+    table[positions, columns] = values
+    return times, table
+
+
+def iter_wide_chunks(chunks, category_ids):
+    """
+    Pivots chunks of readings which are ordered by time into wide format tables with `pivot_readings`.  A time
+    which is split across chunks is merged into a single row, so each time appears in exactly one table.
+
+    :param chunks: an iterable of lists of (timeLogged, categoryId, value) tuples
+    :param category_ids: a sorted list of the category IDs, one for each column
+    :returns: a generator of (times, table) tuples
+    """
+    pending = None
+
+    for chunk in chunks:
+        times, table = pivot_readings(chunk, category_ids)
+
+        # merge a time split across chunks into one row, and hold back the last row of this chunk
+        if pending is not None:
+            if times[0] == pending[0]:
+                table[0] = np.where(np.isnan(table[0]), pending[1], table[0])
+            else:
+                times = np.concatenate(([pending[0]], times))
+                table = np.vstack((pending[1], table))
+
+        pending = times[-1], table[-1]
+        if len(times) > 1:
+            yield times[:-1], table[:-1]
+
+    if pending is not None:
+        yield np.array([pending[0]]), pending[1][np.newaxis, :]
+
+
+def _to_float(value):
+    """
+    Converts a reading value to a float, returning NaN if it isn't a number
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
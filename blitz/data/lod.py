@@ -0,0 +1,198 @@
+__author__ = 'Will Hart'
+
+import numpy as np
+
+
+class MinMaxPyramid(object):
+    """
+    A level of detail pyramid holding the minimum and maximum values of a series over blocks of
+    increasing size, so that a long series can be drawn with a number of points proportional to the
+    screen width rather than the length of the series.
+
+    The first level summarises blocks of `BLOCK_SIZE` values and each further level summarises `FACTOR`
+    blocks of the level below.  Each level stores the indexes of the minimum and maximum value in each block,
+    so the decimated points are real points of the series.  The pyramid does not hold the series itself,
+    which must be passed to `update` and `query`.  New values can be added without rebuilding the pyramid,
+    as only the last block of each level is recalculated.
+
+    The x values of the series must be increasing.
+    """
+
+    BLOCK_SIZE = 8
+    FACTOR = 4
+
+    def __init__(self):
+        self.count = 0
+        self.levels = []
+
+    def update(self, y):
+        """
+        Updates the pyramid after values have been appended to the series
+
+        :param y: an array of all the y values in the series
+        """
+        count = len(y)
+        if count <= self.count:
+            return
+
+        index_type = np.int32 if count < 2 ** 31 else np.int64
+        finer_start = 0
+        factor = self.BLOCK_SIZE
+        level = 0
+
+        while True:
+            if level == len(self.levels):
+                self.levels.append((np.empty(0, dtype=index_type), np.empty(0, dtype=index_type)))
+
+            mins, maxs = self.levels[level]
+            start = max(len(mins) - 1, 0)
+
+            if level == 0:
+                finer_mins = finer_maxs = np.arange(start * factor, count, dtype=index_type)
+            else:
+                finer_mins, finer_maxs = [a[start * factor:] for a in self.levels[level - 1]]
+
+            new_mins, new_maxs = self.__reduce(y, finer_mins, finer_maxs, factor)
+            mins = np.concatenate((mins[:start], new_mins))
+            maxs = np.concatenate((maxs[:start], new_maxs))
+            self.levels[level] = (mins, maxs)
+
+            if len(mins) <= 1:
+                break
+
+            factor = self.FACTOR
+            level += 1
+
+        self.count = count
+
+    def block_size(self, level):
+        """
+        Gets the number of values summarised by each block in a level of the pyramid
+
+        :param level: the 0 based level
+        :returns: the number of values in each block
+        """
+        return self.BLOCK_SIZE * self.FACTOR ** level
+
+    def query(self, x, y, x_min=None, x_max=None, points=2000):
+        """
+        Gets the points to draw for part of the series.  If the range holds fewer than `points` values they
+        are returned as is, otherwise the minimum and maximum of each block from the finest level which
+        gives no more than `points` values are returned in x order.
+
+        :param x: an array of all the x values in the series
+        :param y: an array of all the y values in the series
+        :param x_min: the start of the range to draw (defaults to the start of the series)
+        :param x_max: the end of the range to draw (defaults to the end of the series)
+        :param points: the approximate maximum number of points to return (default 2000)
+        :returns: a tuple of (x, y) arrays
+        """
+        self.update(y)
+
+        first = 0 if x_min is None else max(np.searchsorted(x, x_min, side='left') - 1, 0)
+        last = len(x) if x_max is None else min(np.searchsorted(x, x_max, side='right') + 1, len(x))
+
+        if last - first <= points:
+            return x[first:last], y[first:last]
+
+        level = 0
+        while level < len(self.levels) - 1 and 2 * (last - first) // self.block_size(level) > points:
+            level += 1
+
+        size = self.block_size(level)
+        mins, maxs = [a[first // size:(last - 1) // size + 1] for a in self.levels[level]]
+        indexes = np.column_stack((np.minimum(mins, maxs), np.maximum(mins, maxs))).ravel()
+        return x[indexes], y[indexes]
+
+    def extent(self, y):
+        """
+        Gets the minimum and maximum values of the series from the coarsest level of the pyramid
+
+        :param y: an array of all the y values in the series
+        :returns: a tuple of (minimum, maximum) values, or None if the series is empty
+        """
+        self.update(y)
+
+        if not self.levels:
+            return None
+
+        mins, maxs = self.levels[-1]
+        return y[mins].min(), y[maxs].max()
+
+    @staticmethod
+    def __reduce(y, mins, maxs, factor):
+        """
+        Finds the index of the minimum and maximum value in each block of `factor` indexes
+        """
+        padding = (-len(mins)) % factor
+        if padding:
+            mins = np.concatenate((mins, np.repeat(mins[-1:], padding)))
+            maxs = np.concatenate((maxs, np.repeat(maxs[-1:], padding)))
+
+        mins = mins.reshape(-1, factor)
+        maxs = maxs.reshape(-1, factor)
+        rows = np.arange(len(mins))
+        return mins[rows, y[mins].argmin(axis=1)], maxs[rows, y[maxs].argmax(axis=1)]
+
+
+class LevelOfDetail(object):
+    """
+    Provides decimated views of the series in a DataContainer for plotting.  A MinMaxPyramid is kept for each
+    series and extended as values are pushed.  If values have been discarded from a series (because the
+    container has a capacity or has been cleared) the pyramid is rebuilt.
+
+    :param container: the DataContainer to read series from
+    """
+
+    def __init__(self, container):
+        self.__container = container
+        self.__pyramids = {}
+
+    def clear(self):
+        """
+        Discards all the pyramids
+        """
+        self.__pyramids = {}
+
+    def __pyramid(self, series_id):
+        """
+        Gets the pyramid for a series, rebuilding it if values have been discarded from the series
+        """
+        x, y = self.__container.get_series_view(series_id)
+        version = self.__container.get_version(series_id)
+        pyramid, pyramid_version = self.__pyramids.get(series_id, (None, None))
+
+        if pyramid is None or version is None or version - pyramid_version != len(y) - pyramid.count:
+            pyramid = MinMaxPyramid()
+
+        pyramid.update(y)
+        self.__pyramids[series_id] = (pyramid, version)
+        return pyramid, x, y
+
+    def get_series(self, series_id, x_min=None, x_max=None, points=2000):
+        """
+        Gets the points to draw for part of a series
+
+        :param series_id: the ID of the series
+        :param x_min: the start of the range to draw (defaults to the start of the series)
+        :param x_max: the end of the range to draw (defaults to the end of the series)
+        :param points: the approximate maximum number of points to return (default 2000)
+        :returns: a tuple of (x, y) arrays
+        """
+        pyramid, x, y = self.__pyramid(series_id)
+        return pyramid.query(x, y, x_min, x_max, points)
+
+    def get_extent(self, series_id):
+        """
+        Gets the range of values in a series
+
+        :param series_id: the ID of the series
+        :returns: a tuple of (x_min, x_max, y_min, y_max), or None if the series is empty
+        """
+        pyramid, x, y = self.__pyramid(series_id)
+        y_extent = pyramid.extent(y)
+
+        if y_extent is None or len(x) == 0:
+            return None
+
+        return (x[0], x[-1]) + y_extent
@@ -3,7 +3,7 @@ __author__ = 'mecharius'
 import json
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 
 # set up the base model
@@ -50,6 +50,9 @@ class Reading(SQL_BASE):
 
     category = relationship("Category", backref=backref('readings', order_by=timeLogged))
 
+    # time window queries on one variable of a session use this index
+    __table_args__ = (Index('ix_reading_session_category_time', 'sessionId', 'categoryId', 'timeLogged'),)
+
     def to_dict(self):
         """
         Returns the object in json format
@@ -12,55 +12,65 @@ class MultiplierDataTransform(BaseDataTransform):
 
     :param multiplier: the value to multiply y-values by (default 1)
     """
+
+    incremental = True
+
     def __init__(self, multiplier=1):
         self.multiplier = multiplier
 
-    def apply(self, container):
+    def process(self, series_id, x, y):
         """
-        Multiplies each y value in the container by the multiplier set in `__init__`
+        Multiplies each new y value by the multiplier set in `__init__`
 
-        :param container: the data container to operate over
+        :param series_id: the ID of the series being transformed, or a list of IDs if y is 2-D
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row for each series
+        :returns: a tuple of (x, y) arrays
         """
-
-        new_y_transformed = []
-
-        for y in container.y_transformed:
-            y_array = np.array(y)
-            y_array *= self.multiplier
-
-            new_y_transformed.append(y_array.tolist())
-
-        # finally overwrite the existing y_transformed with new data
-        container.y_transformed = new_y_transformed
+        return x, y * self.multiplier
 
 
 class MovingAverageDataTransform(BaseDataTransform):
     """
-    Calculates an n-period moving average transform over the y-axis data.
+    Calculates an n-period trailing moving average transform over the y-axis data.
 
     :param periods: the number of periods to perform the moving average over
     """
+
+    incremental = True
+
     def __init__(self, periods):
         self.periods = periods
+        self.__windows = {}
 
-    def apply(self, container):
+    def reset(self):
+        """
+        Clears the stored windows of previous values
         """
-        Applies a moving average filters using numpy
+        self.__windows = {}
 
-        :param container: the data container to operate over
+    def process(self, series_id, x, y):
         """
+        Applies a moving average filter using a cumulative sum, which operates on all the rows of a 2-D
+        array at once.  The last `periods - 1` y values of each series are kept between calls so that only
+        the new values need to be averaged.  Values before the start of the series are treated as zero.
 
-        new_y_transformed = []
+        :param series_id: the ID of the series being transformed, or a list of IDs if y is 2-D
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row for each series
+        :returns: a tuple of (x, y) arrays
+        """
+        series_ids = series_id if y.ndim == 2 else [series_id]
+        windows = np.vstack([self.__windows.get(k, np.zeros(self.periods - 1)) for k in series_ids])
+        values = np.hstack((np.zeros((len(series_ids), 1)), windows, np.atleast_2d(y)))
 
-        for y in container.y_transformed:
-            y_array = np.array(y)
-            ones = np.ones(self.periods) / self.periods
-            avgs = np.convolve(y_array, ones, mode='same').tolist()
+        sums = np.cumsum(values, axis=-1)
+        avgs = (sums[:, self.periods:] - sums[:, :-self.periods]) / self.periods
 
-            new_y_transformed.append(avgs)
+        for row, k in enumerate(series_ids):
+            self.__windows[k] = values[row, values.shape[1] - windows.shape[1]:]
 
-        # finally overwrite the existing y_transformed with new data
-        container.y_transformed = new_y_transformed
+        return x, avgs if y.ndim == 2 else avgs[0]
 
 
 class TranslateDataTransform(BaseDataTransform):
@@ -74,24 +84,442 @@ class TranslateDataTransform(BaseDataTransform):
         If `shift_axis` is neither `x` nor `y`, then the translation will apply to the 'y' axis
     """
 
+    incremental = True
+
     def __init__(self, shift_amount=0, shift_axis='y'):
         self.shift_amount = shift_amount
         self.shift_axis = 'x' if shift_axis == 'x' else 'y'
 
+    def process(self, series_id, x, y):
+        """
+        Applies an axis translation to the new values
+
+        :param series_id: the ID of the series being transformed, or a list of IDs if y is 2-D
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row for each series
+        :returns: a tuple of (x, y) arrays
+        """
+        if self.shift_axis == 'x':
+            return x - self.shift_amount, y
+        return x, y - self.shift_amount
+
+
+def _estimate_sample_rate(x):
+    """
+    Estimates the sample rate of a series from the median spacing of its x values
+
+    :param x: an array of x values
+    :returns: the number of samples per unit of x, or 1.0 if it can't be estimated
+    """
+    if len(x) < 2:
+        return 1.0
+
+    spacing = np.median(np.diff(x))
+    return 1.0 / spacing if spacing > 0 else 1.0
+
+
+def _cached(cache, key, factory, limit=16):
+    """
+    Returns the value for `key` in the given cache dictionary, creating it by calling `factory` if it is
+    not already there.  The cache is emptied if it grows beyond `limit` entries.
+    """
+    try:
+        return cache[key]
+    except KeyError:
+        if len(cache) >= limit:
+            cache.clear()
+        value = cache[key] = factory()
+        return value
+
+
+class PowerSpectrumDataTransform(BaseDataTransform):
+    """
+    Replaces each series with its power spectral density, estimated using Welch's method.  The series is
+    split into segments which overlap by half, each segment has its mean removed and a Hann window applied,
+    and the squared magnitudes of the segment FFTs are averaged.  All segments are transformed in a single
+    FFT call.  The x values of the transformed series are frequencies.
+
+    As the whole series is replaced this transform is not incremental.
+
+    :param segment_length: the number of samples in each segment (default 256)
+    :param sample_rate: the number of samples per unit of x, estimated from the x values if not given
+    """
+
+    _windows = {}
+
+    def __init__(self, segment_length=256, sample_rate=None):
+        if segment_length < 2:
+            raise ValueError("Power spectrum segments must contain at least two samples")
+
+        self.segment_length = segment_length
+        self.sample_rate = sample_rate
+
     def apply(self, container):
         """
-        Applies an axis translation to the data.
+        Calculates the power spectral density of each series in the container
 
         :param container: the data container to operate over
         """
+        results = [self.spectrum(x, y) for x, y in zip(container.x_transformed, container.y_transformed)]
+        container.x_transformed = [r[0] for r in results]
+        container.y_transformed = [r[1] for r in results]
+
+    def spectrum(self, x, y):
+        """
+        Calculates the power spectral density of y, which may be a 2-D array with one row for each series
+
+        :param x: an array of x values
+        :param y: an array of y values
+        :returns: a tuple of (frequencies, densities) arrays
+        """
+        count = y.shape[-1]
+        if count < 2:
+            return np.empty(0), np.empty(y.shape[:-1] + (0,))
+
+        sample_rate = self.sample_rate or _estimate_sample_rate(x)
+        length = min(self.segment_length, count)
+        step = max(length // 2, 1)
+        segments = (count - length) // step + 1
+
+        window = _cached(self._windows, length, lambda: 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(length) / length))
+        indexes = np.arange(length)[np.newaxis, :] + step * np.arange(segments)[:, np.newaxis]
+
+        values = y[..., indexes]
+        values = values - values.mean(axis=-1)[..., np.newaxis]
+        power = np.abs(np.fft.rfft(values * window, axis=-1)) ** 2
+        density = power.mean(axis=-2) / (sample_rate * (window ** 2).sum())
+
+        # fold the negative frequencies into a one sided spectrum
+        if length % 2 == 0:
+            density[..., 1:-1] *= 2
+        else:
+            density[..., 1:] *= 2
+
+        frequencies = np.arange(length // 2 + 1) * sample_rate / length
+        return frequencies, density
+
+
+class ButterworthFilterDataTransform(BaseDataTransform):
+    """
+    Applies a zero-phase Butterworth filter to the y-axis data.  The filter is applied in the frequency
+    domain with the squared magnitude response of a digital (bilinear transform) Butterworth filter, which
+    is the response of running the filter forwards and then backwards over the data.  The data is extended
+    with an odd reflection at each end to reduce edge effects, then padded with its last value up to a power
+    of two, so a growing live series is transformed at the same length for many updates.  Frequency responses
+    are cached for each combination of padded length and sample rate.
+
+    As a zero-phase filter needs the whole series this transform is not incremental.
+
+    :param cutoff: the cutoff frequency, or a (low, high) tuple of frequencies for a band-pass filter
+    :param btype: the type of filter, one of `low`, `high` or `band` (default `low`)
+    :param order: the order of the filter (default 2)
+    :param sample_rate: the number of samples per unit of x, estimated from the x values if not given
+    """
+
+    FILTER_TYPES = ['low', 'high', 'band']
+
+    def __init__(self, cutoff, btype='low', order=2, sample_rate=None):
+        if btype not in self.FILTER_TYPES:
+            raise ValueError("Unknown filter type %s, expected one of %s" % (btype, ", ".join(self.FILTER_TYPES)))
+
+        if (btype == 'band') != isinstance(cutoff, (tuple, list)):
+            raise ValueError("Band-pass filters require a (low, high) cutoff, other filters a single cutoff")
+
+        if btype == 'band' and not cutoff[0] < cutoff[1]:
+            raise ValueError("The low cutoff of a band-pass filter must be below the high cutoff")
+
+        self.cutoff = tuple(cutoff) if btype == 'band' else cutoff
+        self.btype = btype
+        self.order = order
+        self.sample_rate = sample_rate
+        self.__responses = {}
+
+    def apply(self, container):
+        """
+        Filters each series in the container
+
+        :param container: the data container to operate over
+        """
+        container.y_transformed = [
+            self.filter(x, y) for x, y in zip(container.x_transformed, container.y_transformed)]
+
+    def filter(self, x, y):
+        """
+        Filters y, which may be a 2-D array with one row for each series
+
+        :param x: an array of x values
+        :param y: an array of y values
+        :returns: an array of filtered y values
+        """
+        count = y.shape[-1]
+        if count < 2:
+            return y.copy()
+
+        sample_rate = self.sample_rate or _estimate_sample_rate(x)
+        padding = count - 1
+        start = 2 * y[..., :1] - y[..., padding:0:-1]
+        end = 2 * y[..., -1:] - y[..., -2:-padding - 2:-1]
+        extended = np.concatenate((start, y, end), axis=-1)
+
+        length = 1 << (extended.shape[-1] - 1).bit_length()
+        extended = np.concatenate(
+            (extended, np.repeat(extended[..., -1:], length - extended.shape[-1], axis=-1)), axis=-1)
+        response = _cached(self.__responses, (length, sample_rate), lambda: self.response(length, sample_rate))
+        filtered = np.fft.irfft(np.fft.rfft(extended, axis=-1) * response, length, axis=-1)
+        return filtered[..., padding:padding + count]
+
+    def response(self, length, sample_rate):
+        """
+        Calculates the zero-phase magnitude response of the filter at the frequencies of a real FFT
+
+        :param length: the number of samples being transformed
+        :param sample_rate: the number of samples per unit of x
+        :returns: an array of gains, one for each FFT frequency
+        :raises: ValueError if a cutoff is not between zero and the Nyquist frequency
+        """
+        cutoffs = self.cutoff if self.btype == 'band' else (self.cutoff,)
+        if not all(0 < c < sample_rate / 2.0 for c in cutoffs):
+            raise ValueError("Filter cutoffs must be between zero and the Nyquist frequency (%g)" % (sample_rate / 2.0))
+
+        # pre-warp the frequencies for the bilinear transform
+        warped = np.tan(np.pi * np.arange(length // 2 + 1) / length)
+        edges = [np.tan(np.pi * c / sample_rate) for c in cutoffs]
 
-        new_transformed = []
-        target = container.x_transformed if self.shift_axis == 'x' else container.y_transformed
+        with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+            if self.btype == 'low':
+                ratio = warped / edges[0]
+            elif self.btype == 'high':
+                ratio = edges[0] / warped
+            else:
+                ratio = (warped ** 2 - edges[0] * edges[1]) / (warped * (edges[1] - edges[0]))
 
-        for dataset in target:
-            output = np.array(dataset)
-            output -= self.shift_amount
-            new_transformed.append(output.tolist())
+            return 1.0 / (1.0 + ratio ** (2 * self.order))
 
-        # finally overwrite the existing y_transformed with new data
-        container.y_transformed = new_transformed
+
+class DecimateDataTransform(BaseDataTransform):
+    """
+    Reduces the sample rate of each series by an integer factor after applying an anti-aliasing FIR filter.
+    Only the retained output samples are calculated, and each is the dot product of the filter taps with
+    the preceding input samples.  The last inputs of each series are kept between calls so the filter runs
+    across successive updates.  The output is delayed by half the filter length.
+
+    The filter history is kept for each series, so series can be regrouped between calls.  Series which are
+    processed together share a time base, so they are decimated with the phase of the first series which
+    has been processed before.
+
+    :param factor: the decimation factor
+    :param taps_per_factor: the filter length as a multiple of the factor (default 8)
+    """
+
+    incremental = True
+    _filters = {}
+
+    def __init__(self, factor, taps_per_factor=8):
+        if factor < 1:
+            raise ValueError("The decimation factor must be at least 1")
+
+        self.factor = int(factor)
+        self.taps = _cached(self._filters, (self.factor, taps_per_factor),
+                            lambda: self.design(self.factor, taps_per_factor))
+        self.__states = {}
+
+    @staticmethod
+    def design(factor, taps_per_factor):
+        """
+        Designs a Hamming windowed-sinc low-pass filter with a cutoff at the decimated Nyquist frequency
+
+        :param factor: the decimation factor
+        :param taps_per_factor: the filter length as a multiple of the factor
+        :returns: an array of filter taps which sum to one, reversed ready to be applied with a dot product
+        """
+        count = factor * taps_per_factor + 1
+        offsets = np.arange(count) - (count - 1) / 2.0
+        taps = np.sinc(offsets / factor) * np.hamming(count)
+        return (taps / taps.sum())[::-1]
+
+    def reset(self):
+        """
+        Clears the stored filter state
+        """
+        self.__states = {}
+
+    def process(self, series_id, x, y):
+        """
+        Decimates the new values of a series
+
+        :param series_id: the ID of the series being transformed, or a list of IDs if y is 2-D
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row for each series
+        :returns: a tuple of (x, y) arrays
+        """
+        series_ids = series_id if y.ndim == 2 else [series_id]
+        rows = np.atleast_2d(y)
+        states = [self.__states.get(k) for k in series_ids]
+        phase = next((state[1] for state in states if state is not None), 0)
+
+        # series without any history start the filter as if their first value had been constant beforehand
+        history = np.vstack([state[0] if state is not None else np.repeat(rows[row, :1], len(self.taps) - 1)
+                             for row, state in enumerate(states)])
+
+        values = np.hstack((history, rows))
+        outputs = np.arange(phase, rows.shape[1], self.factor)
+        windows = values[:, outputs[:, np.newaxis] + np.arange(len(self.taps))]
+
+        phase = (phase - rows.shape[1]) % self.factor
+        for row, k in enumerate(series_ids):
+            self.__states[k] = (values[row, values.shape[1] - len(self.taps) + 1:], phase)
+
+        decimated = np.dot(windows, self.taps)
+        return x[outputs], decimated if y.ndim == 2 else decimated[0]
+
+
+class ResampleDataTransform(BaseDataTransform):
+    """
+    Linearly interpolates each series onto a uniform grid of x values, `origin + n * interval`, so that
+    series recorded at irregular times can be compared sample for sample.  The last value of each series is
+    kept between calls so that grid points falling between updates are interpolated correctly.
+
+    The previous value is kept for each series, so series can be regrouped between calls.  Series which are
+    processed together share a time base, so the grid continues from the first series which has been
+    processed before.
+
+    :param interval: the spacing of the grid
+    :param origin: the x value of a point on the grid (default 0)
+    """
+
+    incremental = True
+
+    def __init__(self, interval, origin=0):
+        if interval <= 0:
+            raise ValueError("The resampling interval must be positive")
+
+        self.interval = float(interval)
+        self.origin = origin
+        self.__states = {}
+
+    def reset(self):
+        """
+        Clears the stored previous values
+        """
+        self.__states = {}
+
+    def process(self, series_id, x, y):
+        """
+        Resamples the new values of a series.  The x values must be increasing.
+
+        :param series_id: the ID of the series being transformed, or a list of IDs if y is 2-D
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row for each series
+        :returns: a tuple of (x, y) arrays
+        """
+        series_ids = series_id if y.ndim == 2 else [series_id]
+        rows = np.atleast_2d(y)
+        states = [self.__states.get(k) for k in series_ids]
+        known = next((state for state in states if state is not None), None)
+
+        if known is None:
+            xs, ys = x, rows
+            first = np.ceil((x[0] - self.origin) / self.interval)
+        else:
+            # series without a previous value hold their first value back to the previous x value
+            last_x, _, first = known
+            last_y = np.array([state[1] if state is not None else rows[row, 0] for row, state in enumerate(states)])
+            xs = np.hstack(([last_x], x))
+            ys = np.hstack((last_y[:, np.newaxis], rows))
+
+        last = np.floor((x[-1] - self.origin) / self.interval)
+        grid = self.origin + self.interval * np.arange(first, last + 1)
+
+        for row, k in enumerate(series_ids):
+            self.__states[k] = (x[-1], rows[row, -1], max(first, last + 1))
+
+        upper = np.clip(np.searchsorted(xs, grid, side='right'), 1, len(xs) - 1)
+        lower = upper - 1
+        spans = xs[upper] - xs[lower]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(spans > 0, (grid - xs[lower]) / spans, 0.0)
+
+        resampled = ys[:, lower] + (ys[:, upper] - ys[:, lower]) * weights
+        return grid, resampled if y.ndim == 2 else resampled[0]
+
+
+class PolynomialCalibrationDataTransform(BaseDataTransform):
+    """
+    Converts raw y values to engineering units with a calibration polynomial.  Coefficients are given
+    highest order first (as for `numpy.polyval`), either as a single list which is applied to every series
+    or as a dictionary of lists keyed by series ID, in which case series without coefficients are left
+    unchanged.  When several series are processed together their coefficients are stacked into a matrix,
+    which is cached for each group of series, and all the polynomials are evaluated at once.
+
+    :param coefficients: a list of coefficients or a dictionary of lists keyed by series ID
+    """
+
+    incremental = True
+
+    def __init__(self, coefficients):
+        self.coefficients = coefficients
+        self.__matrices = {}
+
+    def process(self, series_id, x, y):
+        """
+        Calibrates the new y values of a series
+
+        :param series_id: the ID of the series being transformed, or a list of IDs if y is 2-D
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row for each series
+        :returns: a tuple of (x, y) arrays
+        """
+        series_ids = tuple(series_id) if y.ndim == 2 else (series_id,)
+        matrix = _cached(self.__matrices, series_ids, lambda: self.__stack(series_ids), limit=256)
+
+        rows = np.atleast_2d(y)
+        result = np.zeros(rows.shape)
+        for column in matrix.T:
+            result = result * rows + column[:, np.newaxis]
+
+        return x, result if y.ndim == 2 else result[0]
+
+    def __stack(self, series_ids):
+        """
+        Builds a matrix of coefficients with one row for each series, padding lower order polynomials
+        """
+        if isinstance(self.coefficients, dict):
+            polynomials = [self.coefficients.get(k, [1, 0]) for k in series_ids]
+        else:
+            polynomials = [self.coefficients] * len(series_ids)
+
+        degree = max(len(p) for p in polynomials)
+        return np.array([[0] * (degree - len(p)) + list(p) for p in polynomials], dtype=np.float64)
+
+
+class LookupTableCalibrationDataTransform(BaseDataTransform):
+    """
+    Converts raw y values to engineering units by linear interpolation in a calibration table.  Values
+    outside the table are clamped to the first or last output value.
+
+    :param inputs: the increasing raw values in the table
+    :param outputs: the calibrated value for each raw value
+    """
+
+    incremental = True
+
+    def __init__(self, inputs, outputs):
+        if len(inputs) != len(outputs) or len(inputs) < 2:
+            raise ValueError("A lookup table needs at least two inputs, each with an output")
+
+        self.inputs = np.asarray(inputs, dtype=np.float64)
+        self.outputs = np.asarray(outputs, dtype=np.float64)
+
+        if np.any(np.diff(self.inputs) <= 0):
+            raise ValueError("Lookup table inputs must be increasing")
+
+    def process(self, series_id, x, y):
+        """
+        Calibrates the new y values of a series
+
+        :param series_id: the ID of the series being transformed, or a list of IDs if y is 2-D
+        :param x: an array of the new x values
+        :param y: an array of the new y values, or a 2-D array with one row for each series
+        :returns: a tuple of (x, y) arrays
+        """
+        return x, np.interp(y.ravel(), self.inputs, self.outputs).reshape(y.shape)
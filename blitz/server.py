@@ -29,7 +29,10 @@ class Config(object):
             "tcp_port": 8999,
             "database_port": 6379,
             "debug": True,
-            "use_netscanner": False
+            "use_netscanner": False,
+            "netscanner_binary": True,
+            "netscanner_sample_frequency": 2.0,
+            "download_compression_level": None
         }
 
         self.load_from_file()
@@ -131,9 +134,13 @@ class ApplicationServer(object):
         # create a NetScanner server
         if (self.config['use_netscanner']):
             db = self.serial_server.database
+            binary = self.config['netscanner_binary']
+            frequency = self.config['netscanner_sample_frequency']
             self.netscanner = [
-                NetScannerManager(db, self.config['netscanner_one_ip'], "0A"),
-                NetScannerManager(db, self.config['netscanner_two_ip'], "0B")
+                NetScannerManager(db, self.config['netscanner_one_ip'], "0A", binary=binary,
+                                  sample_frequency=frequency),
+                NetScannerManager(db, self.config['netscanner_two_ip'], "0B", binary=binary,
+                                  sample_frequency=frequency)
             ]
 
         # hook up signals
@@ -143,7 +150,7 @@ class ApplicationServer(object):
         sigs.board_list_requested.connect(self.send_connected_boards)
 
         # start the TCP server
-        self.tcp = TcpBase(port=self.config["tcp_port"])
+        self.tcp = TcpBase(port=self.config["tcp_port"], compression_level=self.config["download_compression_level"])
         self.tcp.create_server()
         self.is_running = True
         self.logger.info("Started TCP on port %s" % self.config["tcp_port"])
@@ -174,13 +181,8 @@ class ApplicationServer(object):
         self.tcp.send(message)
 
     def serve_client_download(self, session_id):
-        # get all the session data from the database
-        session_data = self.serial_server.database.get_all_from_session(session_id)
-
-        # split into rows of 100 readings then pass to the state manager for dispatch
-        # todo set the '100' value to a constant
-        split_session_data = [session_data[i:i + 100] for i in range(0, len(session_data), 100)]
-        self.tcp.send(split_session_data)
+        # get the session data in chunks of lines then pass to the state manager for dispatch
+        self.tcp.send(self.serial_server.database.get_session_chunks(session_id))
 
     def send_connected_boards(self, args=None):
         """
@@ -134,6 +134,12 @@ class ProcessingDialog(QtGui.QDialog):
         # connect to the "close dialog" signal
         complete_signal.connect(self.hide_box)
 
+    def set_description(self, description):
+        """
+        Updates the description of the process
+        """
+        self.processing_description_label.setText(description)
+
     def hide_box(self):
         """
         Closes the dialog
@@ -6,20 +6,35 @@ matplotlib.use('Qt4Agg')
 matplotlib.rcParams['backend.qt4'] = 'PySide'
 
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt4agg import NavigationToolbar2QTAgg as NavigationToolbar
 from matplotlib.figure import Figure
 from matplotlib.widgets import Cursor as MplCursor
+from PySide import QtCore
 from PySide import QtGui as Qt
 
 import blitz.communications.signals as sigs
-from blitz.data.models import Session
-from blitz.utilities import blitz_strftimestamp
+from blitz.data.export import SessionCsvExporter, SessionWideExporter
+from blitz.data.lod import LevelOfDetail
 
 
 class BlitzLoggingWidget(Qt.QWidget):
     """
     A widget which handles logger display of data
+
+    Each series is drawn with a persistent, animated Line2D which is updated with `set_data`.  Updates are
+    blitted over a cached copy of the axes background, and the whole figure is only redrawn when a series
+    is added, the data leaves the current axis limits or the canvas is resized.
+
+    Lines are given decimated data from a LevelOfDetail for the visible x range, so that long sessions can
+    be zoomed and panned with the toolbar while only about two points per pixel are drawn.  Once the view
+    has been zoomed or panned away from the data the axes stop following new data until it is zoomed out
+    to show all the data again.
     """
 
+    DEFAULT_LIMITS = (0, 100)
+    X_HEADROOM = 0.25
+    Y_MARGIN = 0.1
+
     def __init__(self, container):
         """
         Initialises the graph widget
@@ -30,24 +45,34 @@ class BlitzLoggingWidget(Qt.QWidget):
         # set up the required data structures
         self.__lines = {}
         self.__container = container
+        self.__lod = LevelOfDetail(container)
+        self.__background = None
+        self.__follow = True
+        self.__setting_limits = False
+        self.canvas = None
 
         # create widgets
         self.figure = Figure(figsize=(800, 600), dpi=72, facecolor=(1, 1, 1), edgecolor=(1, 0, 0))
 
         # create a plot
         self.axis = self.figure.add_subplot(111)
+        self.axis.set_xlabel("Time Logged (s)")
+        self.axis.set_ylabel("Value")
+        self.axis.callbacks.connect('xlim_changed', self.limits_changed)
 
         # build the chart but do not draw it yet - wait until the application is drawn
         self.redraw({}, True, False)
 
         # create the canvas
         self.canvas = FigureCanvas(self.figure)
+        self.toolbar = NavigationToolbar(self.canvas, self)
 
         # initialise the data point label
         self.data_point_label = Qt.QLabel('X: 0.000000, Y: 0.000000')
 
         # conect up the canvas
         self.canvas.mpl_connect('motion_notify_event', self.mouse_over_event)
+        self.canvas.mpl_connect('draw_event', self.full_draw_event)
 
         # create a cursor
         self.data_cursor = MplCursor(self.axis, useblit=True, color='blue', linewidth=1)
@@ -56,6 +81,7 @@ class BlitzLoggingWidget(Qt.QWidget):
         self.grid = Qt.QGridLayout()
         self.grid.addWidget(self.canvas, 0, 0, 1, 3)
         self.grid.addWidget(self.data_point_label, 1, 0)
+        self.grid.addWidget(self.toolbar, 1, 1, 1, 2)
 
         # Save the layout
         self.setLayout(self.grid)
@@ -70,6 +96,26 @@ class BlitzLoggingWidget(Qt.QWidget):
         else:
             self.data_point_label.setText(self.axis.format_coord(event.xdata, event.ydata))
 
+    def limits_changed(self, axis):
+        """
+        Handles the x-axis limits changing by resampling the lines for the new range.  If the limits were
+        changed by the user the axes only follow new data if all the data is visible.
+        """
+        if not self.__setting_limits:
+            self.__follow = self.__rescale(apply_limits=False) is not True
+
+        self.__refresh_lines()
+
+    def full_draw_event(self, event):
+        """
+        Handles a full redraw of the canvas by caching the background (which excludes the animated lines)
+        and then drawing the lines over it
+        """
+        self.__background = self.canvas.copy_from_bbox(self.axis.bbox)
+
+        for line in self.__lines.itervalues():
+            self.axis.draw_artist(line)
+
     def redraw(self, new_data, replace_existing=False, draw_canvas=True):
         """
         Redraws the graph when new cached data is supplied
@@ -78,15 +124,22 @@ class BlitzLoggingWidget(Qt.QWidget):
         :param replace_existing: If True, then the existing data will be deleted before appending
         :param draw_canvas: Prevents attempting to draw the canvas before the Qt window is drawn on startup
         """
+        full_draw = self.__background is None
+
         if replace_existing:
             # clear the existing plot
             self.__container.clear_data()
 
-        self.axis.cla()
-        self.__lines = {}
-        self.axis.set_xlabel("Time Logged (s)")
-        self.axis.set_ylabel("Value")
+            for line in self.__lines.itervalues():
+                line.remove()
+
+            self.__lines = {}
+            self.__lod.clear()
+            self.__follow = True
+            self.__set_limits(self.DEFAULT_LIMITS, self.DEFAULT_LIMITS)
+            full_draw = True
 
+        added = False
         for key in new_data.keys():
             series_id, series_name = key
 
@@ -94,27 +147,186 @@ class BlitzLoggingWidget(Qt.QWidget):
             x, y = new_data[key]
             self.__container.push(series_id, series_name, x, y)
 
-            x, y = self.__container.get_series(series_id)
-            self.__lines[series_id], = self.axis.plot(x, y, 'o-', label=series_name.replace("_", " ").title())
+            if series_id not in self.__lines:
+                self.__lines[series_id], = self.axis.plot(
+                    [], [], 'o-', label=series_name.replace("_", " ").title(), animated=True)
+                added = True
 
-        # tidy up and rescale
-        if self.__container.empty():
-            self.axis.set_xlim(left=0, right=100, auto=True)
-            self.axis.set_ylim(bottom=0, top=100, auto=True)
+        if new_data and self.__follow and self.__rescale():
+            full_draw = True
+
+        # the container returns views which are only valid until the next push, so refresh every line
+        self.__refresh_lines()
 
         # redraw if required
-        if draw_canvas:
-            self.axis.legend(loc='upper left')
+        if not draw_canvas or self.canvas is None:
+            return
+
+        if added or replace_existing:
+            if self.__lines:
+                self.axis.legend(loc='upper left')
+            else:
+                self.axis.legend_ = None
+            full_draw = True
+
+        if full_draw:
+            # the draw event caches the new background and draws the lines
             self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.__background)
+            for line in self.__lines.itervalues():
+                self.axis.draw_artist(line)
+            self.canvas.blit(self.axis.bbox)
+
+    def __refresh_lines(self):
+        """
+        Sets the data of every line to the decimated data for the visible x range
+        """
+        left, right = self.axis.get_xlim()
+        points = 2 * max(int(self.axis.bbox.width), 500)
+
+        for series_id, line in self.__lines.iteritems():
+            line.set_data(*self.__lod.get_series(series_id, left, right, points))
+
+    def __set_limits(self, x_limits=None, y_limits=None):
+        """
+        Sets the axis limits without treating the change as a user zoom
+        """
+        self.__setting_limits = True
+        try:
+            if x_limits is not None:
+                self.axis.set_xlim(x_limits)
+            if y_limits is not None:
+                self.axis.set_ylim(y_limits)
+        finally:
+            self.__setting_limits = False
+
+    def __rescale(self, apply_limits=True):
+        """
+        Changes the axis limits if the data has left them.  The x-axis is extended with some headroom so
+        that new data can be added without rescaling, and is narrowed if the data covers less than half of it.
+
+        :param apply_limits: If False the limits are only checked and not changed
+        :returns: True if the axis limits were (or would be) changed, None if there is no data
+        """
+        extents = [self.__lod.get_extent(series_id) for series_id in self.__lines.iterkeys()]
+        extents = [e for e in extents if e is not None]
+
+        if not extents:
+            return None
+
+        x_min = min(e[0] for e in extents)
+        x_max = max(e[1] for e in extents)
+        y_min = min(e[2] for e in extents)
+        y_max = max(e[3] for e in extents)
+
+        x_limits, y_limits = None, None
+        left, right = self.axis.get_xlim()
+        span = max(x_max - x_min, 1)
+        if x_min < left or x_max > right or (x_max - x_min) < (right - left) / 2.0:
+            x_limits = (x_min, x_max + span * self.X_HEADROOM)
+
+        bottom, top = self.axis.get_ylim()
+        if y_min < bottom or y_max > top:
+            margin = max(y_max - y_min, 1) * self.Y_MARGIN
+            y_limits = (min(bottom, y_min - margin), max(top, y_max + margin))
+
+        if apply_limits:
+            self.__set_limits(x_limits, y_limits)
+
+        return x_limits is not None or y_limits is not None
 
     def clear_graphs(self):
         """
         Clears the graphs in the logging display
         """
-        self.__container.clear_data()
         self.redraw({}, True)
 
 
+class BlitzTableModel(QtCore.QAbstractTableModel):
+    """
+    A read only table model holding rows of values, displayed as strings.  When new rows are set they are
+    compared with the existing rows, and only the rows which have changed are signalled to the view, so a
+    table can be updated many times a second without rebuilding it.
+
+    :param headers: a list of column headers
+    """
+
+    def __init__(self, headers, parent=None):
+        super(BlitzTableModel, self).__init__(parent)
+        self.__headers = headers
+        self.__rows = []
+        self.__display = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.__rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.__headers)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+
+        row = self.__display[index.row()]
+        return row[index.column()] if index.column() < len(row) else None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+
+        if orientation == QtCore.Qt.Horizontal:
+            return self.__headers[section] if section < len(self.__headers) else None
+
+        return section + 1
+
+    def row(self, index):
+        """
+        Gets the values in a row of the table
+
+        :param index: the 0 based row index
+        :returns: the list of values originally passed for the row
+        """
+        return self.__rows[index]
+
+    def set_rows(self, rows):
+        """
+        Replaces the rows in the model, inserting or removing rows at the end of the table if the number of
+        rows has changed and emitting `dataChanged` for each run of consecutive rows whose values have changed
+
+        :param rows: a list of rows, each of which is a list of values
+        """
+        rows = [list(r) for r in rows]
+        display = [["{0}".format(val) for val in r] for r in rows]
+        old_count, new_count = len(self.__rows), len(rows)
+
+        if new_count < old_count:
+            self.beginRemoveRows(QtCore.QModelIndex(), new_count, old_count - 1)
+            self.__rows = self.__rows[:new_count]
+            self.__display = self.__display[:new_count]
+            self.endRemoveRows()
+
+        changed = [i for i in xrange(min(old_count, new_count)) if self.__display[i] != display[i]]
+        self.__rows[:len(self.__rows)] = rows[:len(self.__rows)]
+        self.__display[:len(self.__display)] = display[:len(self.__display)]
+
+        if new_count > old_count:
+            self.beginInsertRows(QtCore.QModelIndex(), old_count, new_count - 1)
+            self.__rows.extend(rows[old_count:])
+            self.__display.extend(display[old_count:])
+            self.endInsertRows()
+
+        # signal runs of consecutive changed rows together
+        last_column = max(len(self.__headers) - 1, 0)
+        start = None
+        for position, i in enumerate(changed):
+            if start is None:
+                start = i
+            if position + 1 == len(changed) or changed[position + 1] != i + 1:
+                self.dataChanged.emit(self.index(start, 0), self.index(i, last_column))
+                start = None
+
+
 class BlitzTableView(Qt.QWidget):
     """
     A UI tab pane which shows teh last variable read from each channel in the current session data
@@ -128,24 +340,33 @@ class BlitzTableView(Qt.QWidget):
         self.__stretch = stretch_columns
 
         # set up the table
-        self.variable_table = Qt.QTableWidget()
-        self.variable_table.setColumnCount(self.__cols)
-        self.variable_table.setHorizontalHeaderLabels(self.__headers)
+        self.model = BlitzTableModel(self.__headers, self)
+        self.variable_table = Qt.QTableView()
+        self.variable_table.setModel(self.model)
         self.variable_table.setSelectionBehavior(Qt.QAbstractItemView.SelectRows)
         self.variable_table.setSelectionMode(Qt.QAbstractItemView.SingleSelection)
         self.variable_table.setEditTriggers(Qt.QAbstractItemView.NoEditTriggers)
 
         # slots/signals
-        self.variable_table.itemSelectionChanged.connect(self.selection_changed)
+        self.variable_table.selectionModel().selectionChanged.connect(self.selection_changed)
 
         if self.__stretch:
             self.variable_table.horizontalHeader().setResizeMode(Qt.QHeaderView.Stretch)
         else:
             self.variable_table.horizontalHeader().setResizeMode(Qt.QHeaderView.ResizeToContents)
 
-    def selection_changed(self):
+    def selection_changed(self, selected=None, deselected=None):
         pass
 
+    def selected_row(self):
+        """
+        Gets the values in the selected row of the table
+
+        :returns: a list of values, or None if no row is selected
+        """
+        rows = self.variable_table.selectionModel().selectedRows()
+        return self.model.row(rows[0].row()) if rows else None
+
     def build_layout(self):
         self.grid = Qt.QGridLayout()
         self.grid.addWidget(self.variable_table, 0, 0)
@@ -153,19 +374,15 @@ class BlitzTableView(Qt.QWidget):
 
     def set_data(self, data):
         """
-        Sets the data on the table by providing a 2d list of variable/value pairs
+        Sets the data on the table by providing a 2d list of variable/value pairs.  Only rows which
+        have changed are redrawn.
 
-        :param data: the list of variable/value pairs
+        :param data: the list of variable/value pairs, or a dictionary of variable: value
         """
+        if isinstance(data, dict):
+            data = sorted(data.items())
 
-        self.variable_table.clear()
-        self.variable_table.setRowCount(len(data))
-
-        for i, row in enumerate(data):
-            for j, val in enumerate(row):
-                self.variable_table.setItem(i, j, Qt.QTableWidgetItem("{0}".format(val)))
-
-        self.variable_table.setHorizontalHeaderLabels(self.__headers)
+        self.model.set_rows(data)
 
 
 class BlitzSessionTabPane(BlitzTableView):
@@ -173,6 +390,8 @@ class BlitzSessionTabPane(BlitzTableView):
     A UI tab pane which lists available data logger sessions and
     """
 
+    EXPORT_FILTER = "CSV Files (*.csv);;NumPy Archives (*.npz);;HDF5 Files (*.h5);;Parquet Files (*.parquet)"
+
     def __init__(self, headers, application):
 
         super(BlitzSessionTabPane, self).__init__(headers, False)
@@ -219,12 +438,12 @@ class BlitzSessionTabPane(BlitzTableView):
         self.grid.addWidget(self.delete_session_button, 3, 5)
         self.setLayout(self.grid)
 
-    def selection_changed(self):
-        items = self.variable_table.selectedItems()
-        self.__selected_id = int(items[1].text()) if items else -1
+    def selection_changed(self, selected=None, deselected=None):
+        row = self.selected_row()
+        self.__selected_id = int(row[1]) if row else -1
 
         # update GUI
-        self.save_button.setEnabled(self.__selected_id >= 0 and (items[0].text() == "X" or self.__connected))
+        self.save_button.setEnabled(self.__selected_id >= 0 and (row[0] == "X" or self.__connected))
         self.download_button.setEnabled(self.__selected_id >= 0 and self.__connected)
         # self.view_series_button.setEnabled(self.__selected_id >= 0)
         # self.delete_session_button.setEnabled(self.__selected_id >= 0)
@@ -251,43 +470,36 @@ class BlitzSessionTabPane(BlitzTableView):
         """
 
         # get the session ID of the selected item
-        selected_items = self.variable_table.selectedItems()
+        selected_row = self.selected_row()
 
-        if len(selected_items) <= 0:
+        if not selected_row:
             return
 
-        selected_idx = int(selected_items[1].text())
-        available = selected_items[0].text() == "X"
+        selected_idx = int(selected_row[1])
+        available = selected_row[0] == "X"
 
         # get the file name
-        file_path, _ = Qt.QFileDialog.getSaveFileName(self, 'Save session to file...', 'C:/', 'CSV Files (*.csv)')
+        file_path, _ = Qt.QFileDialog.getSaveFileName(self, 'Save session to file...', 'C:/', self.EXPORT_FILTER)
 
         # check we have the item downloaded and trigger download if we do not
         if not available:
             self.trigger_session_download(selected_idx)
 
-        # show the saving dialogue
+        if not file_path:
+            return
+
+        # show the saving dialogue and export on a background thread
         sigs.process_started.send("Saving data")
+        exporter_class = SessionCsvExporter if file_path.lower().endswith(".csv") else SessionWideExporter
+        try:
+            exporter = exporter_class(
+                self.application.data, selected_idx, file_path,
+                progress=lambda written, total: sigs.process_progress.send(
+                    "Saving data - %s of %s readings" % (written, total)),
+                finished=lambda written: sigs.process_finished.send())
+        except (ValueError, ImportError) as e:
+            sigs.process_finished.send()
+            Qt.QMessageBox.warning(self, "Unable to save session", str(e))
+            return
 
-        # get the data
-        data = self.application.data.get_session_readings(selected_idx)
-        sess = self.application.data.get(Session, {"id": selected_idx})
-        raw_sess_vars = self.application.data.get_session_variables(selected_idx)
-        sess_vars = dict([(x.id, x.variableName) for x in raw_sess_vars])
-
-        # prepare the string to write to file
-        output = "Time Logged,Elapsed Seconds, Variable Name,Value\n"
-        for row in data:
-            output += "%s,%s,%s,%s\n" % (
-                blitz_strftimestamp(sess.timeStarted + row.timeLogged),
-                row.timeLogged / 1000.0,
-                sess_vars[row.categoryId],
-                row.value
-            )
-
-        # write to file if a path was given
-        if file_path:
-            with open(file_path, 'w') as f:
-                f.write(output)
-
-        sigs.process_finished.send()
+        exporter.start()
@@ -1,6 +1,7 @@
 import PySide.QtGui as Qt
 import PySide.QtCore as QtCore
 import sys
+import threading
 
 from blitz.client import ApplicationClient
 import blitz.communications.signals as sigs
@@ -16,20 +17,32 @@ from blitz.utilities import blitz_strftimestamp
 class GUISignalEmitter(QtCore.QObject):
     """
     Used for passing events and signals from other threads onto the GUI thread
+
+    Processed cache data is coalesced: batches received while the GUI thread has not yet collected the
+    previous data (using `take_processed_data`) are merged into it rather than queuing another signal, so
+    the GUI never falls behind during bursts of data.
     """
     tcp_lost = QtCore.Signal()
     task_started = QtCore.Signal(str)
+    task_progress = QtCore.Signal(str)
     task_finished = QtCore.Signal()
     board_error = QtCore.Signal(str)
     logging_started = QtCore.Signal()
     logging_stopped = QtCore.Signal()
     boards_updated = QtCore.Signal(dict)
+    data_processed = QtCore.Signal()
 
     def __init__(self):
         super(GUISignalEmitter, self).__init__()
+        self.__data_lock = threading.Lock()
+        self.__pending_data = {}
+        self.__data_signalled = False
+
+        sigs.cache_data_processed.connect(self.trigger_data_processed)
         sigs.lost_tcp_connection.connect(self.trigger_connection_lost)
         sigs.process_started.connect(self.trigger_task_started)
         sigs.process_finished.connect(self.trigger_task_finished)
+        sigs.process_progress.connect(self.trigger_task_progress)
         sigs.logger_error_received.connect(self.trigger_board_error)
         sigs.logging_started.connect(self.trigger_logging_started)
         sigs.logging_stopped.connect(self.trigger_logging_stopped)
@@ -44,6 +57,9 @@ class GUISignalEmitter(QtCore.QObject):
     def trigger_task_finished(self, args):
         self.task_finished.emit()
 
+    def trigger_task_progress(self, description):
+        self.task_progress.emit(description)
+
     def trigger_board_error(self, args):
         self.board_error.emit(args)
 
@@ -56,6 +72,33 @@ class GUISignalEmitter(QtCore.QObject):
     def trigger_boards_updated(self, boards):
         self.boards_updated.emit(boards)
 
+    def trigger_data_processed(self, data):
+        with self.__data_lock:
+            for key, (x, y) in data.iteritems():
+                pending = self.__pending_data.setdefault(key, [[], []])
+                pending[0].extend(x)
+                pending[1].extend(y)
+
+            if self.__data_signalled:
+                return
+            self.__data_signalled = True
+
+        self.data_processed.emit()
+
+    def take_processed_data(self):
+        """
+        Collects the cache data received since the last call.  Should be called on the GUI thread
+        in response to the `data_processed` signal
+
+        :returns: a dictionary of {(series_id, series_name): [[x], [y]]}
+        """
+        with self.__data_lock:
+            data = self.__pending_data
+            self.__pending_data = {}
+            self.__data_signalled = False
+
+        return data
+
 
 class MainBlitzApplication(ApplicationClient):
 
@@ -73,7 +116,8 @@ class MainBlitzApplication(ApplicationClient):
 
     def update_interface(self, data, replace_existing=False):
         """
-        Provides an implementation of BaseApplicationClient.update_interface.
+        Provides an implementation of BaseApplicationClient.update_interface.  This is called on the cache
+        worker thread, so the results are passed to the GUI thread through the `cache_data_processed` signal.
 
         :param data: The results received from the BoardManager.parse_message command
         :param replace_existing: If True, appends to existing cache, if False, replaces cache? Defaults to False
@@ -84,7 +128,7 @@ class MainBlitzApplication(ApplicationClient):
         result = super(MainBlitzApplication, self).update_interface(data, replace_existing)
 
         if result:
-            self.gui_application.window.update_cached_data(result, replace_existing)
+            sigs.cache_data_processed.send(result)
 
 
 class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
@@ -101,11 +145,13 @@ class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
         self.__signaller = GUISignalEmitter()
         self.__signaller.tcp_lost.connect(self.connection_lost)
         self.__signaller.task_started.connect(self.show_process_dialogue)
+        self.__signaller.task_progress.connect(self.update_process_dialogue)
         self.__signaller.task_finished.connect(self.update_session_list)
         self.__signaller.board_error.connect(self.show_board_error)
         self.__signaller.logging_started.connect(self.logging_started_ui_update)
         self.__signaller.logging_stopped.connect(self.logging_stopped_ui_update)
         self.__signaller.boards_updated.connect(self.update_connected_boards)
+        self.__signaller.data_processed.connect(self.cache_data_processed, QtCore.Qt.QueuedConnection)
 
         # create a data context for managing data
         self.__container = DataContainer()
@@ -128,6 +174,10 @@ class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
         self.__indicator = ProcessingDialog(self.__signaller.task_finished, description)
         self.__indicator.show()
 
+    def update_process_dialogue(self, description):
+        if self.__indicator is not None:
+            self.__indicator.set_description(description)
+
     def show_board_error(self, error):
         """
         Displays a board error to the user and suggests a logger reset
@@ -347,6 +397,15 @@ class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
         # go go go
         self.show()
 
+    def cache_data_processed(self):
+        """
+        Plots the cache data processed since the last update
+        """
+        data = self.__signaller.take_processed_data()
+
+        if data:
+            self.update_cached_data(data, False)
+
     def update_cached_data(self, data, replace_existing=True):
         """
         Updates the cached and plotted data, optionally clearing the existing data
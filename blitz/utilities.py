@@ -2,12 +2,88 @@ __author__ = 'Will Hart'
 
 from datetime import datetime
 from math import ceil
+import os
+import sys
 import time
 from random import random
 
 from bitstring import BitArray
 
 
+def _os_monotonic_clock():
+    """
+    Creates a monotonic clock from the operating system using ctypes, for python versions without
+    `time.monotonic`.  Uses QueryPerformanceCounter on Windows and clock_gettime(CLOCK_MONOTONIC) elsewhere.
+
+    :returns: a function which returns the clock time in seconds
+    :raises: OSError, AttributeError, TypeError or ValueError if the clock is not available
+    """
+    import ctypes
+    import ctypes.util
+
+    if os.name == 'nt':
+        kernel32 = ctypes.windll.kernel32
+        frequency = ctypes.c_int64()
+        if not kernel32.QueryPerformanceFrequency(ctypes.byref(frequency)) or frequency.value <= 0:
+            raise OSError("QueryPerformanceFrequency failed")
+
+        def monotonic():
+            counter = ctypes.c_int64()
+            kernel32.QueryPerformanceCounter(ctypes.byref(counter))
+            return counter.value / float(frequency.value)
+
+    else:
+        class TimeSpec(ctypes.Structure):
+            _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+        library = ctypes.util.find_library("rt") or ctypes.util.find_library("c")
+        clock_gettime = ctypes.CDLL(library, use_errno=True).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(TimeSpec)]
+        clock_id = 6 if sys.platform == 'darwin' else 1  # CLOCK_MONOTONIC
+
+        def monotonic():
+            spec = TimeSpec()
+            if clock_gettime(clock_id, ctypes.byref(spec)) != 0:
+                raise OSError(ctypes.get_errno(), "clock_gettime failed")
+            return spec.tv_sec + spec.tv_nsec * 1e-9
+
+    # check the clock works before using it
+    monotonic()
+    return monotonic
+
+
+try:
+    from time import monotonic as monotonic_time
+except ImportError:
+    try:
+        from monotonic import monotonic as monotonic_time
+    except ImportError:
+        try:
+            monotonic_time = _os_monotonic_clock()
+        except (OSError, AttributeError, ValueError, TypeError):
+            # no monotonic clock is available, so fall back to the wall clock
+            from time import time as monotonic_time
+
+
+def user_data_path(*parts):
+    """
+    Gets a path in the directory where blitz keeps per user data, which is writable even when blitz is
+    installed somewhere read only.  This is %APPDATA%\\blitz on Windows, ~/Library/Application Support/blitz on
+    OS X and $XDG_CONFIG_HOME/blitz (by default ~/.config/blitz) elsewhere.  The directory is not created.
+
+    :param parts: path components to join to the data directory
+    :returns: the path
+    """
+    if os.name == 'nt':
+        base = os.environ.get("APPDATA", os.path.expanduser("~"))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join("~", "Library", "Application Support"))
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser(os.path.join("~", ".config")))
+
+    return os.path.join(base, "blitz", *parts)
+
+
 def to_blitz_date(given_date):
     """
     Generates a blitz date string from a python datetime